@@ -0,0 +1,100 @@
+"""
+JWT authentication without a User query on every request.
+
+``CachedJWTAuthentication`` keeps the users resolved from access tokens in a
+per-process cache for ``AUTH_USER_CACHE_TIMEOUT`` seconds. Saving or deleting
+a user (profile updates, password changes, deactivation) drops the entry in
+the worker that made the change through ``accounts.signals``; other workers
+pick the change up when their entry expires, so the timeout bounds how long
+a deactivated user keeps access.
+
+``TokenUserJWTAuthentication`` additionally serves safe (read-only) requests
+with a ``TokenUser`` built from the token claims alone when
+``AUTH_STATELESS_READS`` is enabled. Only use it on views that need nothing
+but ``request.user.pk``.
+"""
+
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+MAX_CACHED_USERS = 10000
+
+_lock = threading.Lock()
+_users = {}  # user id -> (expires at, user)
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 30)
+
+
+def invalidate_user(user_id):
+    """Forget the cached copy of a user in this process"""
+    with _lock:
+        _users.pop(str(user_id), None)
+
+
+def clear_user_cache():
+    with _lock:
+        _users.clear()
+
+
+def _check(user, validated_token):
+    if not user.is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    if api_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication resolving users through a short-lived local cache"""
+
+    def get_user(self, validated_token):
+        timeout = _timeout()
+        if not timeout:
+            return super().get_user(validated_token)
+        try:
+            key = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        now = time.monotonic()
+        cached = _users.get(key)
+        if cached is not None and cached[0] > now:
+            user = cached[1]
+            _check(user, validated_token)
+        else:
+            user = super().get_user(validated_token)
+            with _lock:
+                if len(_users) >= MAX_CACHED_USERS:
+                    for stale in [pk for pk, (expires, _) in _users.items() if expires <= now]:
+                        del _users[stale]
+                    if len(_users) >= MAX_CACHED_USERS:
+                        _users.clear()
+                _users[key] = (now + timeout, user)
+        # Views modify request.user (e.g. set_password), never hand out the cached instance
+        return copy.copy(user)
+
+
+class TokenUserJWTAuthentication(CachedJWTAuthentication):
+    """Read-only requests get a TokenUser from the claims when AUTH_STATELESS_READS is on"""
+
+    def authenticate(self, request):
+        self.stateless = getattr(settings, 'AUTH_STATELESS_READS', False) and request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if self.stateless:
+            if api_settings.USER_ID_CLAIM not in validated_token:
+                raise InvalidToken(_('Token contained no recognizable user identification'))
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        return super().get_user(validated_token)
@@ -0,0 +1,115 @@
+"""
+Refresh-token blacklist.
+
+Only revoked tokens are stored: ``RevokedToken`` holds the JTI of every
+refresh token that was rotated (``BLACKLIST_AFTER_ROTATION``) or logged out,
+until the token would have expired anyway. ``manage.py purge_revoked_tokens``
+deletes those rows on a schedule, so the table only ever holds about one
+refresh lifetime of revocations, however long the site has been running.
+
+Each worker keeps a Bloom filter of the live JTIs, so refreshing a token that
+was never revoked (the common case) needs no lookup. The filter picks up rows
+written by other workers every ``TOKEN_BLACKLIST_SYNC_INTERVAL`` seconds; a
+token revoked elsewhere within that window still fails on rotation, because
+its JTI is inserted under a unique constraint.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+ERROR_RATE = 0.01
+MIN_CAPACITY = 10000
+# Rebuilt from scratch this often so purged JTIs leave the filter
+REBUILD_INTERVAL = 3600
+# Rows committed this long after their created_at are still picked up by a sync
+SYNC_MARGIN = timedelta(minutes=1)
+
+_lock = threading.Lock()
+_filter = None
+_built_at = 0.0
+_synced_at = 0.0
+_sync_from = None
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def _live_jtis(since=None):
+    rows = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+    if since is not None:
+        rows = rows.filter(created_at__gte=since)
+    return rows.values_list('jti', flat=True).iterator()
+
+
+def _current_filter():
+    """This worker's filter, rebuilt or synced with the table when due"""
+    global _filter, _built_at, _synced_at, _sync_from
+    now = time.monotonic()
+    with _lock:
+        if _filter is None or now - _built_at > REBUILD_INTERVAL or _filter.count > _filter.capacity:
+            live = RevokedToken.objects.filter(expires_at__gt=timezone.now()).count()
+            bloom = BloomFilter(max(MIN_CAPACITY, live * 2))
+            sync_from = timezone.now() - SYNC_MARGIN
+            for jti in _live_jtis():
+                bloom.add(jti)
+            _filter, _built_at, _synced_at, _sync_from = bloom, now, now, sync_from
+        elif now - _synced_at > getattr(settings, 'TOKEN_BLACKLIST_SYNC_INTERVAL', 5):
+            sync_from = timezone.now() - SYNC_MARGIN
+            for jti in _live_jtis(_sync_from):
+                _filter.add(jti)
+            _synced_at, _sync_from = now, sync_from
+        return _filter
+
+
+def is_revoked(jti):
+    if jti not in _current_filter():
+        return False
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def revoke(jti, expires_at):
+    """Blacklist ``jti``, returns False if it already was"""
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+    except IntegrityError:
+        return False
+    with _lock:
+        if _filter is not None:
+            _filter.add(jti)
+    return True
+
+
+def purge_expired():
+    """Delete revocations of tokens that have expired, returns the number deleted"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
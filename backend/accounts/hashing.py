@@ -0,0 +1,278 @@
+"""
+Password hashing off the request worker.
+
+``PooledPBKDF2PasswordHasher`` (first in ``PASSWORD_HASHERS``) produces the
+usual ``pbkdf2_sha256`` hashes, but runs the key derivation in a small
+process pool of ``PASSWORD_HASH_WORKERS`` processes started at a lower CPU
+priority (``PASSWORD_HASH_NICE``). Every password check and change goes
+through it: ``authenticate`` on login, ``create_user`` on registration,
+``change_password`` and ``password_reset_confirm``.
+
+At most ``PASSWORD_HASH_CONCURRENCY`` hashes are in flight on the host,
+across all web worker processes and threads. The slots are lock files in
+``PASSWORD_HASH_SLOT_DIR`` held with ``flock``, and the kernel frees them
+when a process dies. Without ``fcntl`` (Windows development) the limit is per
+process.
+
+Inside ``shedding()`` (the login, registration and password views, see
+``accounts.views``) a hash that waits longer than
+``PASSWORD_HASH_QUEUE_TIMEOUT`` seconds for a slot raises
+``PasswordHashingBusy``, which those views answer with 503 and Retry-After,
+so a burst of logins is shed instead of queueing up every web worker and
+taking the CPU from product browsing. So does a hash that takes longer than
+``PASSWORD_HASH_TIMEOUT``; its slot stays taken until the pool finishes it.
+The request thread still waits for its own hash, for at most those two
+timeouts; under ASGI those views run in threads of their own (see
+``accounts.urls.hashing_view``) so the wait does not hold up the sync views
+sharing the worker's main thread. Everywhere else (the admin, ``createsuperuser``, ``make_password``
+in management commands) hashes wait for a slot and their result, so they
+never fail because the site is busy.
+
+Wait and hash times are served to staff at
+``/api/accounts/metrics/password-hashing/``.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.utils.encoding import force_bytes
+
+from ecofinds_backend.instrumentation import LATENCY_BUCKETS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_metrics_lock = threading.Lock()
+_metrics = {}
+_shedding = ContextVar('password_hash_shedding', default=False)
+
+
+class PasswordHashingBusy(Exception):
+    """No hashing slot or result within the timeouts, raised only inside ``shedding()``"""
+    retry_after = 1
+
+    def __init__(self, message='Too many sign-ins in progress, please try again shortly.'):
+        super().__init__(message)
+
+
+@contextmanager
+def shedding():
+    """Give up on hashes that would wait past the timeouts, raising PasswordHashingBusy"""
+    token = _shedding.set(True)
+    try:
+        yield
+    finally:
+        _shedding.reset(token)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Seconds between attempts to take a slot
+SLOT_POLL_INTERVAL = 0.01
+
+
+class HostSlots:
+    """``count`` slots shared by every process on the host, as flock'ed files in ``directory``"""
+
+    def __init__(self, directory, count):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f'slot-{index}.lock') for index in range(count)]
+
+    def try_acquire(self):
+        start = random.randrange(len(self.paths))
+        for path in self.paths[start:] + self.paths[:start]:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def acquire(self, timeout):
+        """A slot token, or None after ``timeout`` seconds (None waits as long as it takes)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            fd = self.try_acquire()
+            if fd is not None or (deadline is not None and time.monotonic() >= deadline):
+                return fd
+            time.sleep(SLOT_POLL_INTERVAL)
+
+    def release(self, fd):
+        # Closing the descriptor drops the lock
+        os.close(fd)
+
+
+class ProcessSlots:
+    """HostSlots stand-in limited to this process, where flock is unavailable"""
+
+    def __init__(self, count):
+        self.semaphore = threading.BoundedSemaphore(count)
+
+    def acquire(self, timeout):
+        return True if self.semaphore.acquire(timeout=timeout) else None
+
+    def release(self, token):
+        self.semaphore.release()
+
+
+def _get_slots():
+    global _slots
+    with _pool_lock:
+        if _slots is None:
+            count = _setting('PASSWORD_HASH_CONCURRENCY', 4)
+            if fcntl is None:
+                _slots = ProcessSlots(count)
+            else:
+                directory = _setting('PASSWORD_HASH_SLOT_DIR', None) or os.path.join(
+                    tempfile.gettempdir(), 'ecofinds-password-slots'
+                )
+                _slots = HostSlots(directory, count)
+        return _slots
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: web workers run background threads
+            _pool = ProcessPoolExecutor(
+                max_workers=_setting('PASSWORD_HASH_WORKERS', 1),
+                mp_context=get_context('spawn'),
+                initializer=os.nice,
+                initargs=(_setting('PASSWORD_HASH_NICE', 10),),
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def derive(password, salt, iterations, digest_name):
+    """hashlib.pbkdf2_hmac in the pool (inline when PASSWORD_HASH_WORKERS is 0)"""
+    args = (digest_name, force_bytes(password), force_bytes(salt), iterations)
+    queued = time.perf_counter()
+    shed = _shedding.get()
+    slots = _get_slots()
+    slot = slots.acquire(_setting('PASSWORD_HASH_QUEUE_TIMEOUT', 2) if shed else None)
+    if slot is None:
+        _record(rejected=True, wait_ms=(time.perf_counter() - queued) * 1000)
+        raise PasswordHashingBusy()
+    started = time.perf_counter()
+    release = True
+    try:
+        if not _setting('PASSWORD_HASH_WORKERS', 1):
+            result = hashlib.pbkdf2_hmac(*args)
+        else:
+            pool = _get_pool()
+            future = pool.submit(hashlib.pbkdf2_hmac, *args)
+            try:
+                result = future.result(timeout=_setting('PASSWORD_HASH_TIMEOUT', 10) if shed else None)
+            except FutureTimeoutError:
+                # Free the request, the slot is given back when the hash ends
+                release = False
+                future.add_done_callback(lambda _: slots.release(slot))
+                _record(rejected=True, timed_out=True, wait_ms=(started - queued) * 1000)
+                raise PasswordHashingBusy()
+            except BrokenProcessPool:
+                logger.exception('Password hashing pool died, hashing inline')
+                _discard_pool(pool)
+                result = hashlib.pbkdf2_hmac(*args)
+    finally:
+        if release:
+            slots.release(slot)
+    finished = time.perf_counter()
+    _record(wait_ms=(started - queued) * 1000, hash_ms=(finished - started) * 1000)
+    return result
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2PasswordHasher deriving keys through accounts.hashing.derive"""
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        hash = derive(password, salt, iterations, self.digest().name)
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%s' % (self.algorithm, iterations, salt, hash)
+
+
+def _record(wait_ms, hash_ms=None, rejected=False, timed_out=False):
+    with _metrics_lock:
+        if not _metrics:
+            _metrics.update({
+                'hashes': 0,
+                'rejected': 0,
+                'timed_out': 0,
+                'total_wait_ms': 0.0,
+                'max_wait_ms': 0.0,
+                'total_hash_ms': 0.0,
+                'max_hash_ms': 0.0,
+                'latency_histogram': [0] * len(LATENCY_BUCKETS),
+            })
+        _metrics['total_wait_ms'] += wait_ms
+        _metrics['max_wait_ms'] = max(_metrics['max_wait_ms'], wait_ms)
+        if rejected:
+            _metrics['rejected'] += 1
+            _metrics['timed_out'] += timed_out
+            return
+        _metrics['hashes'] += 1
+        _metrics['total_hash_ms'] += hash_ms
+        _metrics['max_hash_ms'] = max(_metrics['max_hash_ms'], hash_ms)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if hash_ms <= bound:
+                _metrics['latency_histogram'][index] += 1
+                break
+
+
+def snapshot():
+    with _metrics_lock:
+        if not _metrics:
+            return {'hashes': 0, 'rejected': 0, 'timed_out': 0}
+        attempts = _metrics['hashes'] + _metrics['rejected']
+        hashes = max(_metrics['hashes'], 1)
+        return {
+            'hashes': _metrics['hashes'],
+            'rejected': _metrics['rejected'],
+            'timed_out': _metrics['timed_out'],
+            'avg_wait_ms': round(_metrics['total_wait_ms'] / attempts, 3),
+            'max_wait_ms': round(_metrics['max_wait_ms'], 3),
+            'avg_hash_ms': round(_metrics['total_hash_ms'] / hashes, 3),
+            'max_hash_ms': round(_metrics['max_hash_ms'], 3),
+            'latency_histogram': {
+                ('inf' if bound == float('inf') else f'{bound}ms'): count
+                for bound, count in zip(LATENCY_BUCKETS, _metrics['latency_histogram'])
+            },
+        }
+
+
+def reset():
+    with _metrics_lock:
+        _metrics.clear()
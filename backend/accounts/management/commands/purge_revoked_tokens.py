@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from accounts.blacklist import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete blacklisted refresh tokens that have expired (run on a schedule, e.g. daily)'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully purged {deleted} expired revoked tokens')
+        )
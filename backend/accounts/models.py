@@ -1,3 +1,11 @@
 from django.db import models
 
-# Create your models here.
+
+class RevokedToken(models.Model):
+    """JTI of a refresh token that was rotated or logged out, kept until the token expires"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.jti} (until {self.expires_at:%Y-%m-%d %H:%M})"
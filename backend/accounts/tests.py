@@ -1,3 +1,262 @@
-from django.test import TestCase
+import base64
+import shutil
+import tempfile
+import threading
+import time
+from asyncio import iscoroutinefunction
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import authentication, blacklist, hashing, urls
+from .models import RevokedToken
+from .tokens import RefreshToken
+
+
+class RefreshTokenBlacklistTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+
+    def setUp(self):
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def refresh_with(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(token)}, format='json')
+
+    def logout(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        return self.client.post(reverse('logout'), {'refresh': str(token)}, format='json')
+
+    def test_rotation_revokes_the_used_token(self):
+        response = self.refresh_with(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], str(self.refresh))
+        self.assertTrue(RevokedToken.objects.filter(jti=self.refresh['jti']).exists())
+
+        self.assertEqual(self.refresh_with(self.refresh).status_code, 401)
+        self.assertEqual(self.refresh_with(response.data['refresh']).status_code, 200)
+
+    def test_logout_revokes_the_token(self):
+        response = self.logout(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh_with(self.refresh).status_code, 401)
+        # Already revoked
+        self.assertEqual(self.logout(self.refresh).status_code, 400)
+
+    def test_revoked_by_another_worker(self):
+        # Not in this worker's Bloom filter until its next sync, rotation still fails
+        blacklist._current_filter()
+        RevokedToken.objects.create(jti=self.refresh['jti'], expires_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.refresh_with(self.refresh).status_code, 401)
+
+    def test_revoke_once(self):
+        expires_at = timezone.now() + timedelta(days=1)
+        self.assertTrue(blacklist.revoke('some-jti', expires_at))
+        self.assertFalse(blacklist.revoke('some-jti', expires_at))
+        self.assertTrue(blacklist.is_revoked('some-jti'))
+        self.assertFalse(blacklist.is_revoked('other-jti'))
+
+    def test_purge_expired(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='expired', expires_at=now - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='live', expires_at=now + timedelta(days=1))
+        call_command('purge_revoked_tokens', stdout=StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+@override_settings(
+    PASSWORD_HASH_WORKERS=0,
+    PASSWORD_HASH_CONCURRENCY=2,
+    PASSWORD_HASH_QUEUE_TIMEOUT=0.05,
+    PASSWORD_HASH_TIMEOUT=0.05,
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}},
+)
+class PasswordHashingTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='buyer-password-1')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        slot_dir = override_settings(PASSWORD_HASH_SLOT_DIR=directory)
+        slot_dir.enable()
+        self.addCleanup(slot_dir.disable)
+        hashing._slots = None
+        self.addCleanup(setattr, hashing, '_slots', None)
+        hashing.reset()
+        self.addCleanup(hashing.reset)
+
+    def login(self):
+        return self.client.post(reverse('login'), {'username': 'buyer', 'password': 'buyer-password-1'}, format='json')
+
+    def hold_slots(self):
+        slots = hashing._get_slots()
+        held = [slots.try_acquire() for _ in slots.paths]
+        self.assertNotIn(None, held)
+
+        def release():
+            while held:
+                slots.release(held.pop())
+        self.addCleanup(release)
+        return release
+
+    def pool_returning(self, future):
+        pool = mock.Mock()
+        pool.submit.return_value = future
+        patcher = mock.patch.object(hashing, '_get_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return pool
+
+    def test_busy_slots_answer_503(self):
+        release = self.hold_slots()
+        response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(hashing.snapshot()['rejected'], 1)
+
+        release()
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(hashing.snapshot()['hashes'], 1)
+
+    def test_busy_slots_wait_outside_the_views(self):
+        # The admin and management commands wait for a slot instead of failing
+        threading.Timer(0.2, self.hold_slots()).start()
+        self.assertTrue(self.user.check_password('buyer-password-1'))
+        self.assertEqual(hashing.snapshot()['rejected'], 0)
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_timed_out_hash_keeps_its_slot(self):
+        future = Future()
+        self.pool_returning(future)
+        response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(hashing.snapshot()['timed_out'], 1)
+
+        slots = hashing._get_slots()
+        free = slots.try_acquire()
+        self.assertIsNotNone(free)
+        self.assertIsNone(slots.try_acquire())
+        future.set_result(b'')
+        other = slots.try_acquire()
+        self.assertIsNotNone(other)
+        slots.release(free)
+        slots.release(other)
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_hash_waits_outside_the_views(self):
+        future = Future()
+        self.pool_returning(future)
+        threading.Timer(0.2, future.set_result, [b'derived']).start()
+        encoded = make_password('secret', salt='salt')
+        self.assertTrue(encoded.endswith('$' + base64.b64encode(b'derived').decode()))
+        self.assertEqual(hashing.snapshot()['timed_out'], 0)
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_broken_pool_hashes_inline(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        pool = self.pool_returning(future)
+        with self.assertLogs('accounts.hashing', 'ERROR'):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        pool.shutdown.assert_called_once()
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_async_views_hash_in_their_own_thread(self):
+        threads = []
+
+        def hashing_page(request):
+            threads.append(threading.get_ident())
+            return HttpResponse(make_password('secret'))
+
+        view = urls.hashing_view(hashing_page)
+        self.assertTrue(iscoroutinefunction(view))
+        response = async_to_sync(view)(AsyncRequestFactory().post('/'))
+        self.assertTrue(response.content.startswith(b'pbkdf2_sha256$'))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+@override_settings(AUTH_USER_CACHE_TIMEOUT=30)
+class CachedJWTAuthenticationTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', first_name='Ann')
+
+    def setUp(self):
+        authentication.clear_user_cache()
+        self.addCleanup(authentication.clear_user_cache)
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def profile(self):
+        return self.client.get(reverse('user-profile'))
+
+    def test_user_cached_between_requests(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.profile().data['first_name'], 'Ann')
+
+    def test_saving_the_user_drops_the_entry(self):
+        self.profile()
+        self.assertEqual(self.client.patch(reverse('update-profile'), {'first_name': 'Anna'}).status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile().data['first_name'], 'Anna')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.profile().status_code, 401)
+
+    def test_changes_from_other_workers_apply_on_expiry(self):
+        self.profile()
+        # Not seen by this worker's signal handlers
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.profile().status_code, 200)
+        with mock.patch.object(authentication.time, 'monotonic', return_value=time.monotonic() + 31):
+            self.assertEqual(self.profile().status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        # simplejwt's modules keep the api_settings they imported, override_settings misses them
+        with mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = RefreshToken.for_user(self.user).access_token
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(self.profile().status_code, 200)
+            self.user.set_password('new-password-1')
+            self.user.save()
+            self.assertEqual(self.profile().status_code, 401)
+
+    def test_requests_get_their_own_copy(self):
+        auth = authentication.CachedJWTAuthentication()
+        first, second = auth.get_user(self.token), auth.get_user(self.token)
+        self.assertEqual(first.pk, second.pk)
+        self.assertIsNot(first, second)
+
+    @override_settings(AUTH_USER_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.profile()
+        with self.assertNumQueries(1):
+            self.profile()
 
-# Create your tests here.
@@ -1,15 +1,40 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
 from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
 
+
+def hashing_view(view):
+    """``view``, run outside the thread shared by every sync view when ASYNC_VIEWS is on (ASGI)"""
+    if not getattr(settings, 'ASYNC_VIEWS', False):
+        return view
+
+    def run(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            # Executor threads miss the request_finished cleanup
+            connections.close_all()
+
+    # A password hash then only holds this request, not every sync view of the worker
+    @csrf_exempt
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False)(request, *args, **kwargs)
+    return async_view
+
+
 urlpatterns = [
-    path('register/', views.register, name='register'),
-    path('login/', views.login, name='login'),
+    path('register/', hashing_view(views.register), name='register'),
+    path('login/', hashing_view(views.login), name='login'),
     path('logout/', views.logout, name='logout'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', views.user_profile, name='user-profile'),
     path('profile/update/', views.update_profile, name='update-profile'),
-    path('change-password/', views.change_password, name='change-password'),
+    path('change-password/', hashing_view(views.change_password), name='change-password'),
     path('password-reset/', views.password_reset, name='password-reset'),
-    path('password-reset-confirm/', views.password_reset_confirm, name='password-reset-confirm'),
+    path('password-reset-confirm/', hashing_view(views.password_reset_confirm), name='password-reset-confirm'),
+    path('metrics/password-hashing/', views.password_hash_metrics, name='password-hash-metrics'),
 ]
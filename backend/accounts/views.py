@@ -1,8 +1,9 @@
+from functools import wraps
+
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.contrib.auth.tokens import default_token_generator
@@ -10,11 +11,30 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail
 from django.conf import settings
+from . import hashing
+from .tokens import RefreshToken
 from .serializers import UserRegistrationSerializer, UserSerializer, LoginSerializer, ChangePasswordSerializer
 
 
+def sheds_password_load(view):
+    """Answer 503 with Retry-After when no password hashing slot frees up in time (see accounts.hashing)"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            with hashing.shedding():
+                return view(request, *args, **kwargs)
+        except hashing.PasswordHashingBusy as exc:
+            return Response(
+                {'detail': str(exc)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(exc.retry_after)},
+            )
+    return wrapper
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@sheds_password_load
 def register(request):
     """Register a new user"""
     serializer = UserRegistrationSerializer(data=request.data)
@@ -31,6 +51,7 @@ def register(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@sheds_password_load
 def login(request):
     """Login user and return JWT tokens"""
     serializer = LoginSerializer(data=request.data)
@@ -80,6 +101,7 @@ def update_profile(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@sheds_password_load
 def change_password(request):
     """Change user password"""
     serializer = ChangePasswordSerializer(data=request.data)
@@ -124,6 +146,7 @@ def password_reset(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@sheds_password_load
 def password_reset_confirm(request):
     """Confirm password reset"""
     uid = request.data.get('uid')
@@ -149,4 +172,14 @@ def password_reset_confirm(request):
     user.set_password(new_password)
     user.save()
     
-    return Response({'message': 'Password reset successfully'}, status=status.HTTP_200_OK)
\ No newline at end of file
+    return Response({'message': 'Password reset successfully'}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def password_hash_metrics(request):
+    """Password hashing wait/latency metrics of this worker (DELETE resets them)"""
+    if request.method == 'DELETE':
+        hashing.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(hashing.snapshot())
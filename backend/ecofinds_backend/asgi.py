@@ -12,5 +12,15 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecofinds_backend.settings')
+# Read-heavy product endpoints run as async views (see products.async_views)
+os.environ.setdefault('ECOFINDS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# Build the in-memory autocomplete index as each worker starts, and flush
+# buffered product views even while the worker is idle
+from products.autocomplete import warm_up  # noqa: E402
+from products.view_counts import start_flusher  # noqa: E402
+
+warm_up()
+start_flusher()
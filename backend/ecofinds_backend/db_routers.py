@@ -0,0 +1,141 @@
+"""
+Primary/replica database routing.
+
+``PrimaryReplicaRouter`` sends every write and, by default, every read to
+``default``. Only requests that ``ReplicaPinningMiddleware`` marks as
+replica reads are sent to one of the ``DATABASE_REPLICAS`` aliases (none
+configured means everything stays on ``default``). Management commands,
+scheduled jobs and the shell therefore always see the primary. A request is
+a replica read when:
+
+- it uses a safe method (GET/HEAD/OPTIONS), so writes read what they are
+  about to change from the primary;
+- the client wrote nothing in the last ``REPLICA_PIN_SECONDS``, so a user
+  sees their own new listing or profile change despite replication lag
+  (read-your-writes);
+
+and the read is not inside a transaction on the primary.
+
+The middleware decides this per request. Clients are identified
+by the ``user_id`` claim of their bearer token and by their IP (so a login or
+registration also pins the requests that follow it with the new token). The
+pins are kept in the ``REPLICA_PIN_CACHE`` cache, which must be shared by all
+workers (a file cache by default; use Redis or memcached across hosts).
+"""
+
+import base64
+import json
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        candidates = replicas()
+        if not candidates or not _use_replica.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Related objects are read from where the instance came from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(candidates)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def _token_user(request):
+    """``user_id`` claim of the bearer token, unverified (it only selects a database)"""
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0] != 'Bearer' or parts[1].count('.') != 2:
+        return None
+    payload = parts[1].split('.')[1]
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return claims.get(settings.SIMPLE_JWT.get('USER_ID_CLAIM', 'user_id'))
+    except (ValueError, AttributeError):
+        return None
+
+
+def pin_keys(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    keys = ['replica-pin:ip:' + (forwarded.split(',')[0].strip() if forwarded else request.META.get('REMOTE_ADDR', ''))]
+    user_id = _token_user(request)
+    if user_id is not None:
+        keys.append(f'replica-pin:user:{user_id}')
+    return keys
+
+
+def _pin_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE', 'default')]
+
+
+def is_pinned(keys):
+    now = time.time()
+    return any(until > now for until in _pin_cache().get_many(keys).values())
+
+
+def pin(keys):
+    seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+    _pin_cache().set_many({key: time.time() + seconds for key in keys}, seconds)
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        keys = pin_keys(request)
+        writing = request.method not in SAFE_METHODS
+        return keys, writing, _use_replica.set(not writing and not is_pinned(keys))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replicas():
+            return self.get_response(request)
+        keys, writing, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        if writing and response.status_code < 400:
+            pin(keys)
+        return response
+
+    async def __acall__(self, request):
+        if not replicas():
+            return await self.get_response(request)
+        keys, writing, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        if writing and response.status_code < 400:
+            pin(keys)
+        return response
@@ -0,0 +1,191 @@
+"""
+Opt-in per-request instrumentation.
+
+With ``REQUEST_TIMING = True`` the ``RequestTimingMiddleware`` records, for
+every request, the number of SQL queries, total DB time, time spent building
+DRF serializer output and total view time. They are returned as a
+``Server-Timing`` header (visible in the browser dev tools) and aggregated
+per URL name into in-process histograms served to staff at
+``/api/metrics/requests/``.
+
+``QUERY_COUNT_BUDGETS`` maps URL names (or ``'*'``) to the maximum number of
+queries a request may run. Requests over budget are logged, or raise
+``QueryBudgetExceeded`` when ``QUERY_BUDGET_ACTION = 'raise'`` (use that in
+tests to catch N+1 regressions).
+"""
+
+import contextlib
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram upper bounds in milliseconds
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf')]
+
+_current = ContextVar('request_timing', default=None)
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestTiming:
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # django.db execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - started) * 1000
+
+
+def _timed_serializer_data(original):
+    def data(self):
+        timing = _current.get()
+        if timing is None or timing.serializer_depth:
+            return original.fget(self)
+        timing.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            timing.serializer_depth -= 1
+            timing.serializer_ms += (time.perf_counter() - started) * 1000
+    data._timed = True
+    return property(data)
+
+
+def install_serializer_timing():
+    """Time BaseSerializer.data; nested serializers are only counted once"""
+    for cls in (serializers.BaseSerializer, serializers.Serializer, serializers.ListSerializer):
+        prop = cls.__dict__.get('data')
+        if prop is not None and not getattr(prop.fget, '_timed', False):
+            cls.data = _timed_serializer_data(prop)
+
+
+def record(url_name, timing, total_ms):
+    with _metrics_lock:
+        stats = _metrics.setdefault(url_name, {
+            'requests': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'queries': 0,
+            'max_queries': 0,
+            'db_ms': 0.0,
+            'serializer_ms': 0.0,
+            'latency_histogram': [0] * len(LATENCY_BUCKETS),
+        })
+        stats['requests'] += 1
+        stats['total_ms'] += total_ms
+        stats['max_ms'] = max(stats['max_ms'], total_ms)
+        stats['queries'] += timing.queries
+        stats['max_queries'] = max(stats['max_queries'], timing.queries)
+        stats['db_ms'] += timing.db_ms
+        stats['serializer_ms'] += timing.serializer_ms
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if total_ms <= bound:
+                stats['latency_histogram'][index] += 1
+                break
+
+
+def snapshot():
+    with _metrics_lock:
+        result = {}
+        for url_name, stats in _metrics.items():
+            requests = stats['requests']
+            result[url_name] = {
+                'requests': requests,
+                'avg_ms': round(stats['total_ms'] / requests, 3),
+                'max_ms': round(stats['max_ms'], 3),
+                'avg_queries': round(stats['queries'] / requests, 2),
+                'max_queries': stats['max_queries'],
+                'avg_db_ms': round(stats['db_ms'] / requests, 3),
+                'avg_serializer_ms': round(stats['serializer_ms'] / requests, 3),
+                'latency_histogram': {
+                    ('inf' if bound == float('inf') else f'{bound}ms'): count
+                    for bound, count in zip(LATENCY_BUCKETS, stats['latency_histogram'])
+                },
+            }
+        return result
+
+
+def reset():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def query_budget(url_name):
+    budgets = getattr(settings, 'QUERY_COUNT_BUDGETS', {})
+    return budgets.get(url_name, budgets.get('*'))
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_serializer_timing()
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.url_name if match else None) or 'unresolved'
+        record(url_name, timing, total_ms)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timing.db_ms:.2f};desc="{timing.queries} queries"',
+            f'serializer;dur={timing.serializer_ms:.2f}',
+            f'view;dur={total_ms:.2f}',
+        ])
+
+        budget = query_budget(url_name)
+        if budget is not None and timing.queries > budget:
+            message = f'{request.method} {request.path} ({url_name}) ran {timing.queries} queries, budget is {budget}'
+            if getattr(settings, 'QUERY_BUDGET_ACTION', 'log') == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def request_metrics(request):
+    """Per URL name request timing histograms (DELETE resets them)"""
+    if request.method == 'DELETE':
+        reset()
+        return Response(status=204)
+    return Response({
+        'enabled': getattr(settings, 'REQUEST_TIMING', False),
+        'endpoints': snapshot(),
+    })
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecofinds_backend.instrumentation.RequestTimingMiddleware',
+    'ecofinds_backend.db_routers.ReplicaPinningMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -86,6 +90,35 @@ DATABASES = {
     }
 }
 
+# Safe (GET) requests read from a random replica in DATABASE_REPLICAS; writes,
+# and reads by a client for REPLICA_PIN_SECONDS after its last write, use
+# 'default' (see ecofinds_backend.db_routers). ECOFINDS_SQLITE_REPLICA=1 adds
+# a local SQLite replica, e.g. a copy of db.sqlite3 made with
+# `cp db.sqlite3 db_replica.sqlite3`, to try the routing without Postgres.
+DATABASE_ROUTERS = ['ecofinds_backend.db_routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 10
+# Pins must be visible to every worker (use Redis/memcached across hosts)
+REPLICA_PIN_CACHE = 'replica_pins'
+
+if os.environ.get('ECOFINDS_SQLITE_REPLICA') == '1':
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'replica_pins': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'ecofinds-replica-pins'),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -105,6 +138,26 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashes are computed by a low-priority process pool (accounts.hashing);
+# at most PASSWORD_HASH_CONCURRENCY run at once across all web workers on the
+# host (slot lock files in PASSWORD_HASH_SLOT_DIR, default in the temp dir).
+# Login, registration and password views answer 503 after waiting
+# PASSWORD_HASH_QUEUE_TIMEOUT seconds for a slot, or PASSWORD_HASH_TIMEOUT seconds
+# for the hash; other callers (admin, management commands) wait
+PASSWORD_HASHERS = [
+    'accounts.hashing.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_WORKERS = 1
+PASSWORD_HASH_NICE = 10
+PASSWORD_HASH_CONCURRENCY = 4
+PASSWORD_HASH_QUEUE_TIMEOUT = 2
+PASSWORD_HASH_TIMEOUT = 10
+PASSWORD_HASH_SLOT_DIR = None
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -131,15 +184,69 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'products.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # Cost units per client and minute, see products.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'catalog': '600/min',
+        'catalog_detail': '1200/min',
+    },
 }
 
+# SQLite file holding the throttle state shared by the workers on this host
+# (None: ecofinds-throttle.sqlite3 in the temp directory)
+THROTTLE_STORE_PATH = None
+
+# GETs of the product list, detail, search, featured, trending and category list
+# routes are served by products.async_views, and the password hashing account
+# views run in their own threads (enabled by ecofinds_backend.asgi, so WSGI
+# workers keep the DRF views)
+ASYNC_VIEWS = os.environ.get('ECOFINDS_ASYNC_VIEWS') == '1'
+
+# Product listing total counts are cached for this many seconds (0 disables)
+PRODUCT_COUNT_CACHE_TIMEOUT = 30
+
+# /api/products/analytics/ refreshes its snapshot in the background once it is
+# this many seconds old, and caches its response this many seconds (0 disables)
+ANALYTICS_SNAPSHOT_MAX_AGE = 900
+ANALYTICS_CACHE_TIMEOUT = 30
+
+# Upper bounds of the price facet buckets returned by /api/products/search/?facets=1
+SEARCH_PRICE_BUCKETS = [10, 25, 50, 100, 250, 500]
+
+# /api/products/autocomplete/ serves each worker's in-memory prefix index, rebuilt
+# in the background this often; searches become suggestions once made this many times
+AUTOCOMPLETE_REBUILD_INTERVAL = 300
+AUTOCOMPLETE_MIN_QUERY_COUNT = 3
+# Searches containing any of these (lowercase) words are never suggested
+AUTOCOMPLETE_BLOCKED_WORDS = []
+
+# Product views are buffered per worker and flushed in batches after this many
+# seconds or pending hits, whichever comes first; a background thread flushes
+# idle web workers (a crash loses at most VIEW_COUNT_MAX_PENDING hits per worker)
+VIEW_COUNT_FLUSH_INTERVAL = 10
+VIEW_COUNT_MAX_PENDING = 1000
+
+# Trending rankings (manage.py compute_trending): hourly view buckets decayed
+# with this half-life over the window, top N kept globally and per category
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_WINDOW_DAYS = 7
+TRENDING_TOP_N = 50
+
+# Similar items per product kept by manage.py compute_similar_products (run
+# incrementally on a schedule; the --full run, e.g. nightly, is required too, as
+# incremental merges mix scores of several IDF generations); needs numpy and scipy
+SIMILAR_PRODUCTS_TOP_K = 20
+
 # JWT Settings
 from datetime import timedelta
 
@@ -167,8 +274,21 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.TokenRefreshSerializer',
 }
 
+# Rotated and logged out refresh tokens are blacklisted in accounts.RevokedToken
+# (purge expired rows with manage.py purge_revoked_tokens, e.g. daily); workers
+# sync their Bloom filter of revoked JTIs with the table this often
+TOKEN_BLACKLIST_SYNC_INTERVAL = 5
+
+# Users resolved from access tokens are cached per worker for this many seconds
+# (0 disables); changes made in another worker apply once the entry expires.
+# With AUTH_STATELESS_READS, read-only views using TokenUserJWTAuthentication
+# (e.g. /api/products/my-products/) skip the user lookup entirely
+AUTH_USER_CACHE_TIMEOUT = 30
+AUTH_STATELESS_READS = False
+
 # Frontend URL for password reset links
 FRONTEND_URL = 'http://localhost:3000'
 
@@ -183,3 +303,44 @@ CORS_ALLOW_CREDENTIALS = True
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Uploads are stored once per unique content under media/blobs/ (see products.storage)
+STORAGES = {
+    'default': {
+        'BACKEND': 'products.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Resized WebP/JPEG copies of uploaded product images (longest edge in pixels),
+# rendered by a background thread pool after upload
+IMAGE_VARIANT_SIZES = {'thumbnail': 300, 'medium': 800, 'large': 1600}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANTS_SYNC = False
+
+# Photos whose 64-bit dHashes differ in at most this many bits are reported as
+# likely duplicates (upload_product_images, manage.py scan_duplicate_images)
+DUPLICATE_IMAGE_MAX_DISTANCE = 7
+
+# Products unavailable and unchanged for this many days are moved to the archive
+# tables by manage.py archive_products, and restored when made available again
+PRODUCT_ARCHIVE_AFTER_DAYS = 90
+
+# Per-request SQL/serializer/view timing (Server-Timing header and staff-only
+# histograms at /api/metrics/requests/), see ecofinds_backend.instrumentation
+REQUEST_TIMING = False
+# Maximum queries per URL name ('*' applies to every other route); over budget
+# requests are logged, or raise QueryBudgetExceeded with 'raise' (tests)
+QUERY_COUNT_BUDGETS = {
+    'product-list-create': 6,
+    'featured-products': 4,
+    'trending-products': 5,
+    'search-products': 6,
+    'product-detail': 8,
+    'product-categories': 2,
+    'product-analytics': 3,
+}
+QUERY_BUDGET_ACTION = 'log'
@@ -0,0 +1,91 @@
+import base64
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from products.models import Product
+
+from . import db_routers
+
+
+def bearer(user_id):
+    payload = base64.urlsafe_b64encode(json.dumps({'user_id': user_id}).encode()).rstrip(b'=').decode()
+    return f'Bearer header.{payload}.signature'
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_CACHE='default', REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.factory = RequestFactory()
+        self.router = db_routers.PrimaryReplicaRouter()
+
+    def request(self, method='get', status=200, ip='10.0.0.1', user_id=None):
+        """Database a read inside the request is routed to"""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Product))
+            return HttpResponse(status=status)
+
+        headers = {'REMOTE_ADDR': ip}
+        if user_id is not None:
+            headers['HTTP_AUTHORIZATION'] = bearer(user_id)
+        db_routers.ReplicaPinningMiddleware(view)(getattr(self.factory, method)('/', **headers))
+        return reads[0]
+
+    def test_safe_reads_use_a_replica(self):
+        self.assertEqual(self.request(), 'replica')
+        self.assertEqual(self.request('head'), 'replica')
+        # Outside requests (commands, jobs, the shell) read the primary
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+
+    def test_unsafe_methods_read_the_primary(self):
+        for method in ('post', 'put', 'patch', 'delete'):
+            with self.subTest(method):
+                self.assertEqual(self.request(method, ip=f'10.0.1.{len(method)}'), 'default')
+
+    def test_write_pins_the_client(self):
+        self.request('post', user_id=5)
+        self.assertEqual(self.request(), 'default')
+        # Same token from another address, e.g. a phone switching networks
+        self.assertEqual(self.request(ip='10.0.0.2', user_id=5), 'default')
+        self.assertEqual(self.request(ip='10.0.0.2', user_id=6), 'replica')
+
+    def test_failed_write_does_not_pin(self):
+        self.request('post', status=400)
+        self.assertEqual(self.request(), 'replica')
+
+    def test_pin_expires(self):
+        self.request('post')
+        later = db_routers.time.time() + 11
+        with mock.patch.object(db_routers.time, 'time', return_value=later):
+            self.assertEqual(self.request(), 'replica')
+
+    def test_transactions_read_the_primary(self):
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.request(), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.request(), 'default')
+
+    def test_async_requests(self):
+        reads = []
+
+        async def view(request):
+            reads.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        middleware = db_routers.ReplicaPinningMiddleware(view)
+        async_to_sync(middleware)(self.factory.get('/'))
+        async_to_sync(middleware)(self.factory.post('/'))
+        async_to_sync(middleware)(self.factory.get('/'))
+        self.assertEqual(reads, ['replica', 'default', 'default'])
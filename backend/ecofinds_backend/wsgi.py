@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecofinds_backend.settings')
 
 application = get_wsgi_application()
+
+# Build the in-memory autocomplete index as each worker starts, and flush
+# buffered product views even while the worker is idle
+from products.autocomplete import warm_up  # noqa: E402
+from products.view_counts import start_flusher  # noqa: E402
+
+warm_up()
+start_flusher()
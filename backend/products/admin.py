@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product
+from .models import ArchivedProduct, Product
 
 
 @admin.register(Product)
@@ -21,4 +21,12 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(ArchivedProduct)
+class ArchivedProductAdmin(admin.ModelAdmin):
+    list_display = ['title', 'category', 'owner', 'updated_at', 'archived_at']
+    list_filter = ['category', 'archived_at']
+    search_fields = ['title', 'owner__username']
+    readonly_fields = ['id', 'owner', 'category', 'title', 'image', 'image_variants', 'fields', 'updated_at', 'archived_at']
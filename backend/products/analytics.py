@@ -0,0 +1,151 @@
+"""
+Catalog statistics rollups for /api/products/analytics/.
+
+``take_snapshot`` runs the aggregate queries once and stores the result in
+today's ``AnalyticsSnapshot`` row; one row per day is kept as history. The
+endpoint reads the latest row, and when it is older than
+``ANALYTICS_SNAPSHOT_MAX_AGE`` seconds keeps serving it while a background
+thread takes a new one, so the numbers stay fresh without a scheduler.
+``manage.py snapshot_analytics`` still refreshes it on demand.
+
+``analytics_payload`` adds the recent products to the snapshot and caches the
+result for ``ANALYTICS_CACHE_TIMEOUT`` seconds, so most requests make no query.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+from django.db.models import Avg, Count, Max, Min
+from django.utils import timezone
+
+from .fast_serializers import product_rows, serialize_product_rows
+from .models import AnalyticsSnapshot, Category, Product
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'product-analytics'
+
+_refresh_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def _price(value):
+    return round(float(value), 2) if value is not None else None
+
+
+def take_snapshot(now=None):
+    """Recompute the catalog statistics and store them as today's snapshot"""
+    now = now or timezone.now()
+    available = Product.objects.filter(is_available=True)
+
+    price_stats = available.aggregate(
+        total=Count('id'),
+        avg_price=Avg('price'),
+        min_price=Min('price'),
+        max_price=Max('price')
+    )
+
+    per_category = {
+        row['category_id']: row
+        for row in available.order_by().values('category_id').annotate(
+            product_count=Count('id'), avg_price=Avg('price')
+        )
+    }
+    categories = Category.objects.filter(is_active=True).order_by('name')
+    category_distribution = sorted(
+        [
+            {
+                'name': category.name,
+                'slug': category.slug,
+                'product_count': per_category.get(category.pk, {}).get('product_count', 0),
+                'avg_price': _price(per_category.get(category.pk, {}).get('avg_price')),
+            }
+            for category in categories
+        ],
+        key=lambda row: -row['product_count']
+    )
+
+    labels = dict(Product.CONDITION_CHOICES)
+    condition_distribution = [
+        {
+            'condition': row['condition'],
+            'label': labels.get(row['condition'], row['condition']),
+            'product_count': row['product_count'],
+            'avg_price': _price(row['avg_price']),
+        }
+        for row in available.order_by().values('condition').annotate(
+            product_count=Count('id'), avg_price=Avg('price')
+        ).order_by('-product_count', 'condition')
+    ]
+
+    snapshot, _ = AnalyticsSnapshot.objects.update_or_create(
+        date=timezone.localdate(now),
+        defaults={
+            'total_products': price_stats['total'],
+            'total_categories': len(category_distribution),
+            'avg_price': price_stats['avg_price'],
+            'min_price': price_stats['min_price'],
+            'max_price': price_stats['max_price'],
+            'category_distribution': category_distribution,
+            'condition_distribution': condition_distribution,
+            'generated_at': now,
+        }
+    )
+    return snapshot
+
+
+def _refresh():
+    close_old_connections()
+    try:
+        take_snapshot()
+    except Exception:
+        logger.exception('Could not refresh the analytics snapshot')
+    finally:
+        connections.close_all()
+        _refreshing.clear()
+
+
+def latest_snapshot():
+    """Most recent snapshot, taking the first one if none exists yet and refreshing it in the background once stale"""
+    snapshot = AnalyticsSnapshot.objects.first()
+    if snapshot is None:
+        return take_snapshot()
+    max_age = getattr(settings, 'ANALYTICS_SNAPSHOT_MAX_AGE', 900)
+    if max_age and (timezone.now() - snapshot.generated_at).total_seconds() > max_age:
+        with _refresh_lock:
+            if not _refreshing.is_set():
+                _refreshing.set()
+                threading.Thread(target=_refresh, name='analytics-refresh', daemon=True).start()
+    return snapshot
+
+
+def analytics_payload():
+    """The snapshot and the five newest products, cached for ANALYTICS_CACHE_TIMEOUT seconds"""
+    timeout = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 0)
+    payload = cache.get(CACHE_KEY) if timeout else None
+    if payload is None:
+        snapshot = latest_snapshot()
+        recent_products = product_rows(Product.objects.filter(is_available=True).order_by('-created_at'))[:5]
+        payload = {
+            'total_products': snapshot.total_products,
+            'total_categories': snapshot.total_categories,
+            'price_statistics': {
+                'avg_price': snapshot.avg_price,
+                'min_price': snapshot.min_price,
+                'max_price': snapshot.max_price
+            },
+            'category_distribution': [
+                {'name': row['name'], 'product_count': row['product_count']}
+                for row in snapshot.category_distribution
+            ],
+            'category_breakdown': snapshot.category_distribution,
+            'condition_distribution': snapshot.condition_distribution,
+            'recent_products': serialize_product_rows(recent_products),
+            'snapshot_generated_at': snapshot.generated_at,
+        }
+        if timeout:
+            cache.set(CACHE_KEY, payload, timeout)
+    return payload
@@ -0,0 +1,164 @@
+"""
+Cold storage for long-unlisted products.
+
+Deleting or unlisting a product only sets ``is_available=False``, so without
+this the products table and its indexes would keep every listing ever made.
+``archive_products`` (``manage.py archive_products``, run on a schedule)
+moves products unlisted and unchanged for ``PRODUCT_ARCHIVE_AFTER_DAYS`` into
+``ArchivedProduct``, their gallery into ``ArchivedProductImage``, and deletes
+them from the hot tables together with their view buckets, trending and
+similarity entries and image fingerprints. Fields are stored serialized (as
+Django's serializers do), so older archives restore after schema changes.
+
+``restore_product`` moves one back with its original ids, when its owner
+toggles it available again. Archived image files keep their blob references
+(see products.storage), so ``dedupe_media --purge`` leaves them alone.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+
+from . import duplicates, storage
+from .models import ArchivedProduct, ArchivedProductImage, Product, ProductImage
+
+# Columns of ArchivedProduct/ArchivedProductImage, not part of ``fields``
+PRODUCT_COLUMNS = {'id', 'owner', 'category', 'title', 'image', 'image_variants', 'updated_at'}
+IMAGE_COLUMNS = {'id', 'product', 'image', 'variants'}
+
+
+def _dump(instance, exclude):
+    return {
+        field.name: None if field.value_from_object(instance) is None else field.value_to_string(instance)
+        for field in instance._meta.concrete_fields
+        if field.name not in exclude
+    }
+
+
+def _load(model, data):
+    values = {}
+    for name, value in data.items():
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Field removed since the product was archived
+            continue
+        values[field.attname] = None if value is None else field.to_python(value)
+    return values
+
+
+def archive_candidates(now=None):
+    days = getattr(settings, 'PRODUCT_ARCHIVE_AFTER_DAYS', 90)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return Product.objects.filter(is_available=False, updated_at__lt=cutoff)
+
+
+def _hold_references(names):
+    # The archive holds its own reference, deleting the product releases the hot one
+    for name in names:
+        storage.add_reference(name)
+
+
+@transaction.atomic
+def archive_batch(product_ids, now=None):
+    """Archive the given products that are still candidates, returns how many were"""
+    products = list(
+        archive_candidates(now).filter(pk__in=product_ids).select_for_update().prefetch_related('images')
+    )
+    if not products:
+        return 0
+
+    archived, archived_images = [], []
+    for product in products:
+        archived.append(ArchivedProduct(
+            id=product.pk,
+            owner_id=product.owner_id,
+            category_id=product.category_id,
+            title=product.title,
+            image=product.image.name or '',
+            image_variants=product.image_variants,
+            fields=_dump(product, PRODUCT_COLUMNS),
+            updated_at=product.updated_at,
+        ))
+        _hold_references([product.image.name] + storage.variant_names(product.image_variants))
+        for image in product.images.all():
+            archived_images.append(ArchivedProductImage(
+                id=image.pk,
+                product_id=product.pk,
+                image=image.image.name,
+                variants=image.variants,
+                fields=_dump(image, IMAGE_COLUMNS),
+            ))
+            _hold_references([image.image.name] + storage.variant_names(image.variants))
+
+    ArchivedProduct.objects.bulk_create(archived)
+    ArchivedProductImage.objects.bulk_create(archived_images)
+    Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+    return len(products)
+
+
+def archive_products(batch_size=500, now=None):
+    """Archive every current candidate, in batches of ``batch_size``"""
+    now = now or timezone.now()
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(
+            archive_candidates(now).filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += archive_batch(ids, now)
+        last_id = ids[-1]
+
+
+@transaction.atomic
+def restore_product(pk, owner=None):
+    """Move archived product ``pk`` (of ``owner``, if given) back, unlisted, or return None"""
+    archived = ArchivedProduct.objects.select_for_update().filter(pk=pk)
+    if owner is not None:
+        archived = archived.filter(owner=owner)
+    archived = archived.first()
+    if archived is None:
+        return None
+
+    values = _load(Product, archived.fields)
+    product = Product(
+        id=archived.pk,
+        owner_id=archived.owner_id,
+        category_id=archived.category_id,
+        title=archived.title,
+        image=archived.image or None,
+        image_variants=archived.image_variants,
+        **values,
+    )
+    product.is_available = False
+    # The archive's blob references are handed over, nothing to re-render
+    product._loaded_image = product.image.name
+    product.save(force_insert=True)
+
+    stored_images = list(archived.images.all())
+    image_values = [_load(ProductImage, image.fields) for image in stored_images]
+    images = ProductImage.objects.bulk_create([
+        ProductImage(id=image.pk, product_id=product.pk, image=image.image, variants=image.variants, **loaded)
+        for image, loaded in zip(stored_images, image_values)
+    ])
+
+    # auto_now_add stamped the restore time over the original creation times
+    if values.get('created_at'):
+        product.created_at = values['created_at']
+        Product.objects.filter(pk=product.pk).update(created_at=product.created_at)
+    for image, loaded in zip(images, image_values):
+        if loaded.get('created_at'):
+            ProductImage.objects.filter(pk=image.pk).update(created_at=loaded['created_at'])
+
+    if product.image:
+        duplicates.fingerprint(product.pk, None, product.image.name)
+    for image in images:
+        duplicates.fingerprint(product.pk, image.pk, image.image.name)
+
+    archived.delete()
+    return product
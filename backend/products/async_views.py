@@ -0,0 +1,170 @@
+"""
+Async variants of the read-heavy product endpoints, for ASGI deployments.
+
+With ``ASYNC_VIEWS`` on (the default when served through
+``ecofinds_backend.asgi``), GET requests to the product list, detail,
+search, featured, trending and category list routes are answered by the
+coroutines below with the async ORM, so a worker keeps accepting requests
+while others wait on the database. They return the same bytes as the DRF
+views. Writes, keyset (``?cursor=``) pages and the browsable API are passed
+on to the DRF view.
+
+The async paths authenticate and throttle requests like the DRF views, with
+the view's authenticators, so throttles key signed-in users by user id.
+"""
+
+import math
+
+from asgiref.sync import sync_to_async
+from django.db.models import aprefetch_related_objects
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from . import autocomplete as autocomplete_index
+from .facets import facet_counts, parse_facets
+from .fast_serializers import aserialize_product_rows, product_rows
+from .models import Category, Product
+from .pagination import ProductPagination, acached_count
+from .renderers import FastJSONRenderer
+from .serializers import CategorySerializer, ProductSerializer
+from .views import (
+    FeaturedProductsView, ProductListCreateView, TrendingProductsView, allow_header,
+    atrending_products_queryset, featured_products_queryset, search_filters, search_page
+)
+
+_renderer = FastJSONRenderer()
+
+
+def _json(data, status=200):
+    return HttpResponse(_renderer.render(data), content_type='application/json', status=status)
+
+
+def _error(exc):
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = _json(data, status=exc.status_code)
+    if getattr(exc, 'auth_header', None):
+        response['WWW-Authenticate'] = exc.auth_header
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+def _initial(request, authenticators, throttle_class):
+    """Authenticate and throttle ``request`` as APIView.initial() does, raising APIException"""
+    drf_request = Request(request, authenticators=authenticators)
+    try:
+        drf_request.user
+    except (exceptions.NotAuthenticated, exceptions.AuthenticationFailed) as exc:
+        if authenticators:
+            exc.auth_header = authenticators[0].authenticate_header(drf_request)
+        else:
+            exc.status_code = 403
+        raise
+    if throttle_class is not None:
+        throttle = throttle_class()
+        if not throttle.allow_request(drf_request, None):
+            raise exceptions.Throttled(math.ceil(throttle.wait()))
+
+
+def _handles(request):
+    return (
+        request.method == 'GET' and
+        ProductPagination.cursor_query_param not in request.GET and
+        'format' not in request.GET and
+        'text/html' not in request.headers.get('Accept', '')
+    )
+
+
+def with_async_reads(sync_view, async_view, throttle_class=None):
+    """Serve plain JSON GETs of ``sync_view`` with ``async_view``"""
+    instance = sync_view.cls(**sync_view.initkwargs)
+    instance.setup(None)  # adds head()
+    # Computed like APIView.finalize_response(), in a stable order
+    allow = allow_header(instance.allowed_methods)
+    authenticators = instance.get_authenticators()
+    fallback = sync_to_async(sync_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if not _handles(request):
+            return await fallback(request, *args, **kwargs)
+        try:
+            # Authenticators and throttles may use the database
+            if throttle_class is not None or 'HTTP_AUTHORIZATION' in request.META:
+                await sync_to_async(_initial)(request, authenticators, throttle_class)
+            response = await async_view(request, *args, **kwargs)
+        except Http404 as exc:
+            response = _error(exceptions.NotFound(*exc.args))
+        except exceptions.APIException as exc:
+            response = _error(exc)
+        response['Allow'] = allow
+        patch_vary_headers(response, ('Accept',))
+        return response
+    return view
+
+
+async def product_list(request):
+    view = ProductListCreateView(request=Request(request), args=(), kwargs={}, format_kwarg=None)
+    # The category filter may validate its value against the database
+    queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+    paginator = ProductPagination()
+    rows = await paginator.apaginate_queryset(product_rows(queryset), view.request)
+    return _json(paginator.get_paginated_response(await aserialize_product_rows(rows, request)).data)
+
+
+async def product_detail(request, pk):
+    try:
+        product = await Product.objects.select_related('category', 'owner').aget(pk=pk)
+    except Product.DoesNotExist:
+        raise Http404('No Product matches the given query.')
+    await aprefetch_related_objects([product], 'images')
+    # Buffered in memory, only touches the database when a flush is due
+    await sync_to_async(product.increment_view_count)()
+    return _json(ProductSerializer(product, context={'request': Request(request)}).data)
+
+
+async def search_products(request):
+    queryset, search = search_filters(request.GET)
+    facets = parse_facets(request.GET.get('facets'))
+    try:
+        page, page_size = search_page(request.GET)
+    except ValueError:
+        return _json({'page': ['Must be a number']}, status=400)
+
+    start = (page - 1) * page_size
+    count = await acached_count(queryset)
+    data = {
+        'results': await aserialize_product_rows(product_rows(queryset)[start:start + page_size]),
+        'count': count,
+        'page': page,
+        'page_size': page_size,
+        'total_pages': (count + page_size - 1) // page_size
+    }
+    if facets:
+        data['facets'] = await sync_to_async(facet_counts)(queryset, facets)
+    if search and count:
+        autocomplete_index.record_query(search)
+    return _json(data)
+
+
+async def _paginated(view_class, queryset, request):
+    paginator = view_class.pagination_class()
+    rows = await paginator.apaginate_queryset(product_rows(queryset), Request(request))
+    return _json(paginator.get_paginated_response(await aserialize_product_rows(rows, request)).data)
+
+
+async def featured_products(request):
+    return await _paginated(FeaturedProductsView, featured_products_queryset(), request)
+
+
+async def trending_products(request):
+    queryset = await atrending_products_queryset(request.GET.get('category'))
+    return await _paginated(TrendingProductsView, queryset, request)
+
+
+async def product_categories(request):
+    categories = [category async for category in Category.objects.filter(is_active=True).order_by('name')]
+    return _json(CategorySerializer(categories, many=True).data)
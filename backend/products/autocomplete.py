@@ -0,0 +1,347 @@
+"""
+Search-as-you-type suggestions from an in-memory prefix index.
+
+Every worker keeps a sorted array of normalized keys (each word-start suffix
+of available product titles, active category names and popular search
+queries, see ``suggestible_query``) and answers ``/api/products/autocomplete/?q=`` with a binary search
+for the prefix range. Prefixes matching more than ``SCAN_LIMIT`` keys keep
+their best ``TOP_KEEP`` entries, merged bottom-up from their children when the
+index loads and updated in place as entries are added, reweighted or removed
+(a prefix is rescanned only after removals leave it fewer than
+``MAX_SUGGESTIONS``). Any other prefix covers at most ``SCAN_LIMIT`` keys, so
+lookups stay fast however large the catalog is.
+
+The index is built when a worker starts (see ``ecofinds_backend.wsgi``) or on
+first use, updated in place by ``products.signals`` for changes made in this
+worker, and rebuilt in the background every ``AUTOCOMPLETE_REBUILD_INTERVAL``
+seconds to pick up changes from other workers and bulk imports.
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+MAX_SUGGESTIONS = 20
+MAX_WORD_STARTS = 8
+# Prefix ranges wider than this keep their top suggestions
+SCAN_LIMIT = 64
+# Entries kept per wide prefix, the slack absorbs removals before a rescan
+TOP_KEEP = 2 * MAX_SUGGESTIONS
+KIND_BOOST = {'category': 50, 'query': 5, 'product': 1}
+MAX_TRACKED_QUERIES = 10000
+# Longer searches are too specific to suggest to everyone
+MAX_QUERY_WORDS = 5
+MAX_QUERY_LENGTH = 60
+# Digit runs this long look like phone, order or tracking numbers
+DIGITS_RE = re.compile(r'\d{5,}')
+
+_index = None
+_built_at = 0.0
+_index_lock = threading.Lock()
+_rebuilding = threading.Event()
+_query_counts = Counter()
+_query_lock = threading.Lock()
+
+
+def normalize(text):
+    return re.sub(r'[\W_]+', ' ', text.lower()).strip()
+
+
+def index_keys(text):
+    """The normalized text and each of its word-start suffixes"""
+    words = normalize(text).split()
+    return {' '.join(words[start:]) for start in range(min(len(words), MAX_WORD_STARTS))}
+
+
+class TopEntries:
+    """Best entries under a prefix, best first; ``complete`` when they are all of them"""
+    __slots__ = ('entries', 'complete')
+
+    def __init__(self, entries, complete):
+        self.entries = entries
+        self.complete = complete
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.keys = []  # sorted (key, kind, text)
+        self.weights = {}  # (kind, text) -> weight
+        self.extra = {}  # (kind, text) -> extra response fields
+        self.top = {}  # prefix matching over SCAN_LIMIT keys -> TopEntries
+        self.lock = threading.RLock()
+
+    def load(self, entries):
+        """Bulk load (kind, text, weight, extra) tuples, sorting once"""
+        for kind, text, weight, extra in entries:
+            entry = (kind, text)
+            self.weights[entry] = self.weights.get(entry, 0) + weight
+            if extra:
+                self.extra[entry] = extra
+        self.keys = sorted(
+            (key, kind, text) for kind, text in self.weights for key in index_keys(text)
+        )
+        self.top = {}
+        if self.keys:
+            self.build_top(0, len(self.keys), 0)
+
+    def add(self, kind, text, weight=1, **extra):
+        entry = (kind, text)
+        with self.lock:
+            if entry not in self.weights:
+                self.weights[entry] = 0
+                for key in index_keys(text):
+                    bisect.insort(self.keys, (key, kind, text))
+            self.weights[entry] += weight
+            if extra:
+                self.extra[entry] = extra
+            for prefix in self.kept_prefixes(text, create=True):
+                self.raise_entry(prefix, entry)
+
+    def remove(self, kind, text, weight=1):
+        entry = (kind, text)
+        with self.lock:
+            if entry not in self.weights:
+                return
+            prefixes = self.kept_prefixes(text)
+            self.weights[entry] -= weight
+            gone = self.weights[entry] <= 0
+            if gone:
+                del self.weights[entry]
+                self.extra.pop(entry, None)
+                for key in index_keys(text):
+                    position = bisect.bisect_left(self.keys, (key, kind, text))
+                    if position < len(self.keys) and self.keys[position] == (key, kind, text):
+                        del self.keys[position]
+            for prefix in prefixes:
+                if gone:
+                    start, end = self.range(prefix)
+                    if end - start <= SCAN_LIMIT:
+                        del self.top[prefix]
+                        continue
+                self.lower_entry(prefix, entry, gone)
+
+    def score(self, entry):
+        return self.weights.get(entry, 0) * KIND_BOOST.get(entry[0], 1)
+
+    def sort_key(self, entry):
+        return (-self.score(entry), entry[1], entry[0])
+
+    def range(self, prefix):
+        return (
+            bisect.bisect_left(self.keys, (prefix,)),
+            bisect.bisect_left(self.keys, (prefix + '\uffff',)),
+        )
+
+    def scan(self, start, end):
+        entries = {(kind, text) for _, kind, text in self.keys[start:end]}
+        return TopEntries(heapq.nsmallest(TOP_KEEP, entries, key=self.sort_key), len(entries) <= TOP_KEEP)
+
+    def build_top(self, start, end, depth):
+        """
+        Best entries of ``keys[start:end]``, which share their first ``depth``
+        characters, from the best entries of each longer prefix; keeps those
+        of every wide prefix
+        """
+        if end - start <= SCAN_LIMIT:
+            return self.scan(start, end)
+        prefix = self.keys[start][0][:depth]
+        candidates = set()
+        complete = True
+        position = start
+        # Keys equal to the prefix sort first
+        while position < end and len(self.keys[position][0]) == depth:
+            candidates.add(self.keys[position][1:])
+            position += 1
+        while position < end:
+            child = prefix + self.keys[position][0][depth]
+            child_end = bisect.bisect_left(self.keys, (child + '\uffff',), position, end)
+            top = self.build_top(position, child_end, depth + 1)
+            candidates.update(top.entries)
+            complete = complete and top.complete
+            position = child_end
+        top = TopEntries(
+            heapq.nsmallest(TOP_KEEP, candidates, key=self.sort_key), complete and len(candidates) <= TOP_KEEP
+        )
+        if depth:
+            self.top[prefix] = top
+        return top
+
+    def kept_prefixes(self, text, create=False):
+        """Prefixes of the keys of ``text`` keeping top entries, with ``create`` also those that just became wide"""
+        prefixes = set()
+        for key in index_keys(text):
+            for end in range(1, len(key) + 1):
+                prefix = key[:end]
+                if prefix not in self.top:
+                    # Longer prefixes cover fewer keys
+                    if not create:
+                        break
+                    start, stop = self.range(prefix)
+                    if stop - start <= SCAN_LIMIT:
+                        break
+                    self.top[prefix] = self.scan(start, stop)
+                prefixes.add(prefix)
+        return prefixes
+
+    def raise_entry(self, prefix, entry):
+        """Place ``entry`` after its score grew"""
+        top = self.top[prefix]
+        if entry in top.entries:
+            top.entries.remove(entry)
+        elif not top.complete and top.entries and self.sort_key(entry) > self.sort_key(top.entries[-1]):
+            return
+        bisect.insort(top.entries, entry, key=self.sort_key)
+        if len(top.entries) > TOP_KEEP:
+            top.entries.pop()
+            top.complete = False
+
+    def lower_entry(self, prefix, entry, gone):
+        """Place ``entry`` after its score shrank, or drop it when ``gone``"""
+        top = self.top[prefix]
+        if entry not in top.entries:
+            return
+        top.entries.remove(entry)
+        # Unkept entries may now rank higher, unless every entry is kept
+        if not gone and (top.complete or (top.entries and self.sort_key(entry) < self.sort_key(top.entries[-1]))):
+            bisect.insort(top.entries, entry, key=self.sort_key)
+        if not top.complete and len(top.entries) < MAX_SUGGESTIONS:
+            self.top[prefix] = self.scan(*self.range(prefix))
+
+    def suggest(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            top = self.top.get(prefix)
+            if top is None:
+                top = self.scan(*self.range(prefix))
+            return [
+                {'text': text, 'type': kind, **self.extra.get((kind, text), {})}
+                for kind, text in top.entries[:limit]
+            ]
+
+
+def build_index():
+    from .models import Category, Product
+
+    index = PrefixIndex()
+    categories = Category.objects.filter(is_active=True).values_list('name', 'slug', 'product_count')
+    titles = Product.objects.filter(is_available=True).order_by().values('title').annotate(listings=Count('id'))
+    minimum = getattr(settings, 'AUTOCOMPLETE_MIN_QUERY_COUNT', 3)
+    index.load(
+        [('category', name, max(count, 1), {'slug': slug}) for name, slug, count in categories] +
+        [('product', row['title'], row['listings'], None) for row in titles.iterator()] +
+        [('query', query, count, None) for query, count in popular_queries(minimum)]
+    )
+    return index
+
+
+def _rebuild():
+    global _index, _built_at
+    close_old_connections()
+    try:
+        index = build_index()
+        with _index_lock:
+            _index, _built_at = index, time.monotonic()
+    except Exception:
+        logger.exception('Could not rebuild the autocomplete index')
+    finally:
+        connections.close_all()
+        _rebuilding.clear()
+
+
+def get_index():
+    """The worker's index, built on first use and refreshed in the background"""
+    global _index, _built_at
+    with _index_lock:
+        if _index is None:
+            _index, _built_at = build_index(), time.monotonic()
+        elif time.monotonic() - _built_at > getattr(settings, 'AUTOCOMPLETE_REBUILD_INTERVAL', 300):
+            if not _rebuilding.is_set():
+                _rebuilding.set()
+                threading.Thread(target=_rebuild, name='autocomplete-rebuild', daemon=True).start()
+        return _index
+
+
+def warm_up():
+    """Build the index at worker start, a missing database only logs"""
+    try:
+        get_index()
+    except Exception:
+        logger.warning('Autocomplete index not built at startup', exc_info=True)
+
+
+def suggest(prefix, limit=10):
+    return get_index().suggest(prefix, limit)
+
+
+def product_changed(previous, current):
+    """Apply a product save; states are (title, is_available) or None"""
+    index = _index
+    if index is None or previous == current:
+        return
+    if previous and previous[1]:
+        index.remove('product', previous[0])
+    if current and current[1]:
+        index.add('product', current[0])
+
+
+def category_changed(previous_name, category):
+    """Apply a category save, or a deletion when ``category`` is None"""
+    index = _index
+    if index is None:
+        return
+    for name in {previous_name, category and category.name} - {None}:
+        index.remove('category', name, weight=index.weights.get(('category', name), 0))
+    if category is not None and category.is_active:
+        index.add('category', category.name, max(category.product_count, 1), slug=category.slug)
+
+
+def popular_queries(minimum):
+    with _query_lock:
+        return [(query, count) for query, count in _query_counts.items() if count >= minimum]
+
+
+def suggestible_query(query):
+    """
+    ``query`` normalized if it may be shown to everyone once popular, else None.
+    Searches are only recorded when they matched listings, so their words come
+    from the catalog; this also drops long or number-like searches and words in
+    ``AUTOCOMPLETE_BLOCKED_WORDS``.
+    """
+    query = normalize(query)
+    words = query.split()
+    if not words or len(words) > MAX_QUERY_WORDS or len(query) > MAX_QUERY_LENGTH or DIGITS_RE.search(query):
+        return None
+    blocked = getattr(settings, 'AUTOCOMPLETE_BLOCKED_WORDS', ())
+    if any(word in blocked for word in words):
+        return None
+    return query
+
+
+def record_query(query):
+    """Count a search that returned results; frequent ones become suggestions"""
+    query = suggestible_query(query)
+    if query is None:
+        return
+    with _query_lock:
+        _query_counts[query] += 1
+        count = _query_counts[query]
+        if len(_query_counts) > MAX_TRACKED_QUERIES:
+            # Forget the long tail of one-off queries
+            for rare, _ in _query_counts.most_common()[MAX_TRACKED_QUERIES // 2:]:
+                del _query_counts[rare]
+    index = _index
+    minimum = getattr(settings, 'AUTOCOMPLETE_MIN_QUERY_COUNT', 3)
+    if index is not None and count >= minimum:
+        index.add('query', query, minimum if count == minimum else 1)
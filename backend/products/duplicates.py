@@ -0,0 +1,194 @@
+"""
+Near-duplicate photo detection.
+
+Every product photo gets a 64-bit difference hash (dHash: the image shrunk
+to 9x8 grey pixels, one bit per "left brighter than right" comparison),
+stored in ``ImageFingerprint`` together with its four 16-bit bands. Photos
+of the same item, re-encoded, resized or lightly cropped, differ in only a
+few bits.
+
+Lookups use multi-index hashing: two hashes within ``DUPLICATE_IMAGE_MAX_DISTANCE``
+bits have at least one band within ``distance // 4`` bits of each other, so
+the candidates come from indexed ``bandN IN (...)`` lookups and only those
+are compared bit by bit.
+"""
+
+import itertools
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import ImageFingerprint
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BAND_BITS = 16
+BANDS = HASH_BITS // BAND_BITS
+# Bound on rows compared per lookup
+MAX_CANDIDATES = 1000
+# Hashes with fewer set (or unset) bits come from flat or plain gradient images
+# and match each other without being the same photo
+MIN_FEATURE_BITS = 3
+
+
+def max_distance():
+    return getattr(settings, 'DUPLICATE_IMAGE_MAX_DISTANCE', 7)
+
+
+def dhash(source):
+    """64-bit difference hash of an image file object or stored name"""
+    if isinstance(source, str):
+        with default_storage.open(source, 'rb') as handle:
+            return dhash(handle)
+    source.seek(0)
+    image = Image.open(source)
+    image.draft('L', (64, 64))  # decode JPEGs at reduced size
+    image = ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = (value << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value
+
+
+def to_signed(value):
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * band)) & mask for band in range(BANDS)]
+
+
+def is_featureless(value):
+    bits = bin(to_unsigned(value)).count('1')
+    return bits < MIN_FEATURE_BITS or bits > HASH_BITS - MIN_FEATURE_BITS
+
+
+def distance(first, second):
+    return bin(to_unsigned(first) ^ to_unsigned(second)).count('1')
+
+
+def nearby_values(value, radius):
+    """Every band value within ``radius`` bits of ``value``"""
+    values = [value]
+    for flips in range(1, radius + 1):
+        for positions in itertools.combinations(range(BAND_BITS), flips):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            values.append(flipped)
+    return values
+
+
+def fingerprint(product_id, product_image_id, name, source=None):
+    """Hash ``name`` (reusing the hash of an identical stored file) and store it"""
+    known = ImageFingerprint.objects.filter(name=name).values_list('dhash', flat=True).first()
+    if known is not None:
+        value = to_unsigned(known)
+    else:
+        try:
+            value = dhash(source if source is not None else name)
+        except Exception:
+            logger.warning('Could not fingerprint %s', name, exc_info=True)
+            return None
+    fields = {'name': name, 'dhash': to_signed(value)}
+    fields.update({f'band{band}': band_value for band, band_value in enumerate(bands(value))})
+    entry, _ = ImageFingerprint.objects.update_or_create(
+        product_id=product_id, product_image_id=product_image_id, defaults=fields
+    )
+    return entry
+
+
+def remove_fingerprint(product_id, product_image_id):
+    ImageFingerprint.objects.filter(product_id=product_id, product_image_id=product_image_id).delete()
+
+
+def find_duplicates(value, exclude_product_id=None, limit=10):
+    """Fingerprints within DUPLICATE_IMAGE_MAX_DISTANCE bits of hash ``value``, closest first"""
+    value = to_unsigned(value)
+    if is_featureless(value):
+        return []
+    limit_bits = max_distance()
+    radius = limit_bits // BANDS
+    condition = Q()
+    for band, band_value in enumerate(bands(value)):
+        condition |= Q(**{f'band{band}__in': nearby_values(band_value, radius)})
+    candidates = ImageFingerprint.objects.filter(condition).select_related('product')
+    if exclude_product_id is not None:
+        candidates = candidates.exclude(product_id=exclude_product_id)
+
+    matches = []
+    for candidate in candidates[:MAX_CANDIDATES]:
+        bits = distance(value, candidate.dhash)
+        if bits <= limit_bits:
+            matches.append((bits, candidate))
+    matches.sort(key=lambda match: (match[0], match[1].pk))
+    return matches[:limit]
+
+
+def duplicate_report(entry, limit=5):
+    """API payload of the likely duplicates of a stored fingerprint"""
+    if entry is None:
+        return []
+    return [
+        {
+            'product': match.product_id,
+            'title': match.product.title,
+            'image': match.product_image_id,
+            'distance': bits,
+            'same_owner': match.product.owner_id == entry.product.owner_id,
+        }
+        for bits, match in find_duplicates(entry.dhash, exclude_product_id=entry.product_id, limit=limit)
+    ]
+
+
+def duplicate_groups(fingerprints):
+    """
+    Cluster ``(id, product_id, hash)`` tuples of the whole catalog into groups
+    of near-identical photos that span more than one product.
+    """
+    limit_bits = max_distance()
+    radius = limit_bits // BANDS
+    # Identical hashes (e.g. shared blobs) are searched once
+    by_value = defaultdict(list)
+    for pk, product_id, value in fingerprints:
+        if not is_featureless(value):
+            by_value[to_unsigned(value)].append((pk, product_id))
+    values = list(by_value)
+    tables = [defaultdict(list) for _ in range(BANDS)]
+    for position, value in enumerate(values):
+        for band, band_value in enumerate(bands(value)):
+            tables[band][band_value].append(position)
+
+    # Union-find over distinct hashes within the distance limit
+    parent = list(range(len(values)))
+
+    def root(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    for position, value in enumerate(values):
+        for band, band_value in enumerate(bands(value)):
+            for nearby in nearby_values(band_value, radius):
+                for other in tables[band].get(nearby, ()):
+                    if other < position and root(other) != root(position):
+                        if bin(value ^ values[other]).count('1') <= limit_bits:
+                            parent[root(position)] = root(other)
+
+    groups = defaultdict(list)
+    for position, value in enumerate(values):
+        groups[root(position)].extend(by_value[value])
+    return [members for members in groups.values() if len({product_id for _, product_id in members}) > 1]
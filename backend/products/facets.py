@@ -0,0 +1,99 @@
+"""
+Facet counts for /api/products/search/.
+
+``facet_counts`` groups the filtered queryset by (category, condition, price
+bucket) in a single query and folds the rows into one count list per facet,
+so the search page gets every facet with its results instead of issuing one
+search request per facet. Results are cached like listing counts, for
+``PRODUCT_COUNT_CACHE_TIMEOUT`` seconds keyed on the generated SQL.
+"""
+
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import Product
+
+FACETS = ('category', 'condition', 'price')
+DEFAULT_PRICE_BUCKETS = [10, 25, 50, 100, 250, 500]
+
+
+def price_buckets():
+    """Upper bounds of the price buckets, the last bucket has no upper bound"""
+    return getattr(settings, 'SEARCH_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)
+
+
+def parse_facets(value):
+    """``?facets=1`` / ``true`` for every facet or a comma separated subset"""
+    value = (value or '').strip().lower()
+    if not value or value in ('0', 'false'):
+        return []
+    if value in ('1', 'true', 'all'):
+        return list(FACETS)
+    names = {name.strip() for name in value.split(',')}
+    return [name for name in FACETS if name in names]
+
+
+def _bucket_expression(bounds):
+    return Case(
+        *[When(price__lt=bound, then=Value(index)) for index, bound in enumerate(bounds)],
+        default=Value(len(bounds)),
+        output_field=IntegerField()
+    )
+
+
+def _compute(queryset, bounds):
+    rows = queryset.order_by().annotate(price_bucket=_bucket_expression(bounds)).values(
+        'category__slug', 'category__name', 'condition', 'price_bucket'
+    ).annotate(count=Count('id'))
+
+    categories = defaultdict(int)
+    category_names = {}
+    conditions = defaultdict(int)
+    prices = defaultdict(int)
+    for row in rows:
+        categories[row['category__slug']] += row['count']
+        category_names[row['category__slug']] = row['category__name']
+        conditions[row['condition']] += row['count']
+        prices[row['price_bucket']] += row['count']
+
+    labels = dict(Product.CONDITION_CHOICES)
+    lower_bounds = [0] + list(bounds)
+    upper_bounds = list(bounds) + [None]
+    return {
+        'category': [
+            {'slug': slug, 'name': category_names[slug], 'count': count}
+            for slug, count in sorted(categories.items(), key=lambda item: (-item[1], category_names[item[0]]))
+        ],
+        'condition': [
+            {'value': value, 'label': label, 'count': conditions[value]}
+            for value, label in Product.CONDITION_CHOICES
+            if conditions[value]
+        ] + [
+            {'value': value, 'label': value, 'count': count}
+            for value, count in conditions.items() if value not in labels
+        ],
+        'price': [
+            {'min': lower_bounds[index], 'max': upper_bounds[index], 'count': prices[index]}
+            for index in range(len(bounds) + 1)
+        ],
+    }
+
+
+def facet_counts(queryset, names=FACETS):
+    """Counts per category, condition and price bucket of ``queryset``"""
+    bounds = price_buckets()
+    timeout = getattr(settings, 'PRODUCT_COUNT_CACHE_TIMEOUT', 0)
+    if timeout:
+        sql, params = queryset.order_by().query.sql_with_params()
+        key = 'product-facets:' + hashlib.md5(f'{sql}|{params}|{bounds}'.encode()).hexdigest()
+        facets = cache.get(key)
+        if facets is None:
+            facets = _compute(queryset, bounds)
+            cache.set(key, facets, timeout)
+    else:
+        facets = _compute(queryset, bounds)
+    return {name: facets[name] for name in names}
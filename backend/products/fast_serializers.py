@@ -0,0 +1,119 @@
+"""
+Read-only fast path for product list payloads.
+
+``serialize_product_rows`` produces exactly what ``ProductListSerializer``
+returns, but from ``product_rows()`` dicts (one ``values()`` query over the
+needed columns, joined to category and owner) plus a single query for the
+primary images, without building model instances or running the DRF field
+machinery per row. ``manage.py benchmark_serializers`` checks both produce
+the same bytes. ``aserialize_product_rows`` does the same with the async ORM.
+"""
+
+from rest_framework import serializers
+
+from .images import variant_urls
+from .models import Product, ProductImage
+
+PRODUCT_COLUMNS = (
+    'id', 'title', 'description', 'category', 'category__name', 'category__slug',
+    'condition', 'price', 'original_price', 'image', 'image_variants', 'owner__username',
+    'location', 'is_available', 'is_featured', 'view_count', 'created_at',
+)
+IMAGE_COLUMNS = ('id', 'product_id', 'image', 'variants', 'alt_text', 'is_primary', 'created_at')
+
+# Primitive DRF fields, reused so values are formatted exactly like the serializers do
+_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+_datetime = serializers.DateTimeField()
+_product_storage = Product._meta.get_field('image').storage
+_image_storage = ProductImage._meta.get_field('image').storage
+
+
+def product_rows(queryset):
+    """``queryset`` as dicts of the columns ``serialize_product_rows`` needs"""
+    # Annotations (e.g. search_rank) are kept for keyset pagination
+    return queryset.select_related(None).prefetch_related(None).values(
+        *PRODUCT_COLUMNS, *queryset.query.annotations
+    )
+
+
+def _file_url(storage, name, request):
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def _primary_image_rows(product_ids):
+    rows = ProductImage.objects.filter(product_id__in=product_ids, is_primary=True).order_by('created_at', 'id')
+    return rows.values(*IMAGE_COLUMNS)
+
+
+def _image_payloads(rows):
+    images = {}
+    for row in rows:
+        if row['product_id'] in images:
+            continue
+        images[row['product_id']] = {
+            'id': row['id'],
+            'image': _image_storage.url(row['image']),
+            'variants': variant_urls(row['variants']),
+            'alt_text': row['alt_text'],
+            'is_primary': row['is_primary'],
+            'created_at': _datetime.to_representation(row['created_at']),
+        }
+    return images
+
+
+def primary_images(product_ids):
+    """product id -> ProductImageSerializer data of its primary image (relative URLs, as in list responses)"""
+    return _image_payloads(_primary_image_rows(product_ids))
+
+
+async def aprimary_images(product_ids):
+    return _image_payloads([row async for row in _primary_image_rows(product_ids)])
+
+
+def serialize_product_rows(rows, request=None):
+    """``ProductListSerializer(many=True).data`` for ``product_rows()`` dicts"""
+    rows = list(rows)
+    images = primary_images([row['id'] for row in rows]) if rows else {}
+    return _product_payloads(rows, images, request)
+
+
+async def aserialize_product_rows(rows, request=None):
+    """``serialize_product_rows`` with the async ORM, for a ``product_rows()`` queryset or fetched rows"""
+    rows = [row async for row in rows] if hasattr(rows, '__aiter__') else list(rows)
+    images = await aprimary_images([row['id'] for row in rows]) if rows else {}
+    return _product_payloads(rows, images, request)
+
+
+def _product_payloads(rows, images, request):
+    data = [
+        {
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'category': row['category'],
+            'category_name': row['category__name'],
+            'category_slug': row['category__slug'],
+            'condition': row['condition'],
+            'price': _price.to_representation(row['price']),
+            'original_price': None if row['original_price'] is None else _price.to_representation(row['original_price']),
+            'discount_percentage': Product.compute_discount(row['price'], row['original_price']),
+            'image': _file_url(_product_storage, row['image'], request),
+            'image_variants': variant_urls(row['image_variants'], request),
+            'primary_image': images.get(row['id']),
+            'owner_username': row['owner__username'],
+            'location': row['location'],
+            'is_available': row['is_available'],
+            'is_featured': row['is_featured'],
+            'view_count': row['view_count'],
+            'created_at': _datetime.to_representation(row['created_at']),
+        }
+        for row in rows
+    ]
+    # Radius searches (products.geo.near_queryset)
+    if rows and 'distance_km' in rows[0]:
+        for item, row in zip(data, rows):
+            item['distance_km'] = round(row['distance_km'], 2)
+    return data
@@ -0,0 +1,225 @@
+"""
+"Near me" search on product locations.
+
+``Product.location`` stays free text ("City, State"). On save it is looked up
+in an offline gazetteer (``data/us_cities.csv``) and the coordinates are
+stored with their geohash. A radius search turns the circle into a handful of
+geohash prefixes, each an indexed range scan on ``Product.geohash``, and only
+the rows in those cells get an exact haversine distance (``distance_km``).
+Circles crossing the antimeridian are covered on both sides of it, and those
+containing a pole at every longitude.
+This works on SQLite and Postgres without spatial extensions.
+"""
+
+import csv
+import math
+import os
+import re
+from functools import lru_cache
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+from rest_framework.exceptions import ValidationError
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), 'data', 'us_cities.csv')
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+MAX_CELLS = 16
+
+STATES = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'district of columbia': 'DC',
+    'florida': 'FL', 'georgia': 'GA', 'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL',
+    'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS', 'kentucky': 'KY', 'louisiana': 'LA',
+    'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA', 'michigan': 'MI', 'minnesota': 'MN',
+    'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT', 'nebraska': 'NE', 'nevada': 'NV',
+    'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM', 'new york': 'NY',
+    'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK', 'oregon': 'OR',
+    'pennsylvania': 'PA', 'rhode island': 'RI', 'south carolina': 'SC', 'south dakota': 'SD',
+    'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT', 'virginia': 'VA',
+    'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY',
+}
+
+
+def _normalize(text):
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', text.lower())).strip()
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    """Normalized "city st" and "city" -> (latitude, longitude)"""
+    places = {}
+    with open(GAZETTEER_PATH, newline='') as handle:
+        for row in csv.DictReader(handle):
+            point = (float(row['latitude']), float(row['longitude']))
+            city = _normalize(row['city'])
+            places[f"{city} {row['state'].lower()}"] = point
+            # A bare city name means the largest one, listed first
+            places.setdefault(city, point)
+    return places
+
+
+def lookup(location):
+    """Coordinates of a "City, State" string, or None when unknown"""
+    if not location:
+        return None
+    places = gazetteer()
+    parts = [_normalize(part) for part in location.split(',')]
+    city = parts[0]
+    if len(parts) > 1 and parts[1]:
+        state = STATES.get(parts[1], parts[1]).lower()
+        return places.get(f'{city} {state}')
+    return places.get(city)
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, span = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if target >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geocode(product):
+    """Set latitude, longitude and geohash of ``product`` from its location"""
+    point = lookup(product.location)
+    if point is None:
+        product.latitude = product.longitude = None
+        product.geohash = ''
+    else:
+        product.latitude, product.longitude = point
+        product.geohash = encode(*point)
+    return point is not None
+
+
+def cell_size(precision):
+    """(latitude, longitude) degrees covered by one geohash cell"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounding_boxes(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) boxes covering the circle, split at the antimeridian"""
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_delta = math.degrees(angle)
+    min_lat, max_lat = latitude - lat_delta, latitude + lat_delta
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        # The circle contains a pole, and so every longitude
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+    # Widest longitude span of the circle, reached poleward of its centre
+    lon_delta = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(latitude)), 1.0)))
+    min_lon, max_lon = longitude - lon_delta, longitude + lon_delta
+    if max_lon - min_lon >= 360.0:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    if min_lon < -180.0:
+        return [(min_lat, max_lat, min_lon + 360.0, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180.0:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360.0)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+
+def _steps(start, stop, step):
+    value = start
+    while value < stop:
+        yield value
+        value += step
+    yield stop
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """The finest set of at most MAX_CELLS geohash prefixes covering the circle"""
+    boxes = bounding_boxes(latitude, longitude, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        cells_across = sum(
+            ((max_lat - min_lat) / lat_step + 2) * ((max_lon - min_lon) / lon_step + 2)
+            for min_lat, max_lat, min_lon, max_lon in boxes
+        )
+        if cells_across > MAX_CELLS * 4:
+            continue
+        cells = {
+            encode(lat, lon, precision)
+            for min_lat, max_lat, min_lon, max_lon in boxes
+            for lat in _steps(min_lat, max_lat, lat_step / 2)
+            for lon in _steps(min_lon, max_lon, lon_step / 2)
+        }
+        if len(cells) <= MAX_CELLS:
+            return sorted(cells)
+    return ['']
+
+
+def _next_prefix(prefix):
+    """Smallest geohash string sorting after every string starting with prefix"""
+    while prefix:
+        index = GEOHASH_ALPHABET.index(prefix[-1])
+        if index + 1 < len(GEOHASH_ALPHABET):
+            return prefix[:-1] + GEOHASH_ALPHABET[index + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def cell_filter(cells):
+    """Q matching geohashes in any of ``cells``, adjacent cells merged into one range"""
+    ranges = []
+    for cell in cells:
+        upper = _next_prefix(cell)
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1][1] = upper
+        else:
+            ranges.append([cell, upper])
+    condition = Q()
+    for lower, upper in ranges:
+        bounds = Q(geohash__gte=lower) if lower else ~Q(geohash='')
+        if upper is not None:
+            bounds &= Q(geohash__lt=upper)
+        condition |= bounds
+    return condition
+
+
+def distance_expression(latitude, longitude):
+    """Haversine distance in km from the point to each row"""
+    lat_delta = Radians(F('latitude') - latitude) / 2
+    lon_delta = Radians(F('longitude') - longitude) / 2
+    a = Power(Sin(lat_delta), 2) + Cos(Radians(F('latitude'))) * math.cos(math.radians(latitude)) * Power(Sin(lon_delta), 2)
+    return ASin(Sqrt(a), output_field=FloatField()) * (2 * EARTH_RADIUS_KM)
+
+
+def near_queryset(queryset, latitude, longitude, radius_km=DEFAULT_RADIUS_KM):
+    """Products within ``radius_km`` of the point, annotated with ``distance_km``"""
+    in_boxes = Q()
+    for min_lat, max_lat, min_lon, max_lon in bounding_boxes(latitude, longitude, radius_km):
+        in_boxes |= Q(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+    return queryset.filter(
+        cell_filter(covering_cells(latitude, longitude, radius_km)), in_boxes
+    ).annotate(distance_km=distance_expression(latitude, longitude)).filter(distance_km__lte=radius_km)
+
+
+def parse_near(query_params):
+    """(lat, lon, radius_km) from ?lat=&lon=&radius=, or None without lat/lon"""
+    lat, lon = query_params.get('lat'), query_params.get('lon')
+    if not lat and not lon:
+        return None
+    try:
+        latitude, longitude = float(lat), float(lon)
+        radius = float(query_params.get('radius') or DEFAULT_RADIUS_KM)
+    except (TypeError, ValueError):
+        raise ValidationError({'lat': ['lat, lon and radius must be numbers']})
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not 0 < radius <= MAX_RADIUS_KM:
+        raise ValidationError({'lat': [f'lat/lon out of range or radius not within (0, {MAX_RADIUS_KM}] km']})
+    return latitude, longitude, radius
@@ -0,0 +1,169 @@
+"""
+Resized WebP/JPEG variants of product images.
+
+Uploads are stored as-is; once the upload is committed a background thread
+pool renders every size in ``IMAGE_VARIANT_SIZES`` (longest edge in pixels,
+never upscaled) with Pillow and records the result on the row:
+
+    {"thumbnail": {"width": 300, "height": 225,
+                   "webp": "blobs/3f/a2/3fa2...c1.webp",
+                   "jpeg": "blobs/9b/07/9b07...e4.jpg"}, ...}
+
+Rows sharing a stored image (see products.storage) share its variants, which
+are only rendered once. Set ``IMAGE_VARIANTS_SYNC = True`` to render inline (tests, backfills).
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections
+from PIL import Image, ImageOps
+
+from .storage import swap_variant_references
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {'thumbnail': 300, 'medium': 800, 'large': 1600}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_sizes():
+    return getattr(settings, 'IMAGE_VARIANT_SIZES', DEFAULT_SIZES)
+
+
+def variant_path(name, size_name, extension):
+    root, _ = os.path.splitext(name)
+    return f'variants/{root}_{size_name}.{extension}'
+
+
+def render_variants(name, storage=default_storage):
+    """Render every configured size of the stored image ``name``"""
+    quality = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+    with storage.open(name, 'rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+
+    variants = {}
+    for size_name, edge in sorted(variant_sizes().items(), key=lambda item: -item[1]):
+        image = original.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        entry = {'width': image.width, 'height': image.height}
+
+        has_alpha = 'A' in image.getbands()
+        outputs = (
+            ('webp', 'WEBP', image.convert('RGBA' if has_alpha else 'RGB')),
+            ('jpeg', 'JPEG', image.convert('RGB')),
+        )
+        for key, save_format, target in outputs:
+            buffer = io.BytesIO()
+            target.save(buffer, save_format, quality=quality, optimize=True)
+            path = variant_path(name, size_name, 'webp' if key == 'webp' else 'jpg')
+            entry[key] = storage.save(path, ContentFile(buffer.getvalue()))
+        variants[size_name] = entry
+    return variants
+
+
+def existing_variants(name):
+    """Variants already rendered for the stored image ``name`` by any row sharing it, or None"""
+    from .models import Product, ProductImage
+    for model, variants_field in ((Product, 'image_variants'), (ProductImage, 'variants')):
+        variants = (
+            model.objects.filter(image=name).exclude(**{variants_field: {}})
+            .values_list(variants_field, flat=True).first()
+        )
+        if variants:
+            return variants
+    return None
+
+
+def variants_for(name, reuse=True):
+    """Variants of ``name``, rendered unless ``reuse`` finds them on another row; None on failure"""
+    try:
+        return (reuse and existing_variants(name)) or render_variants(name)
+    except Exception:
+        logger.exception('Could not render variants for %s', name)
+        return None
+
+
+def store_variants(model, pk, field_name, variants_field, name, variants):
+    """Record ``variants`` on the row, unless its image is no longer ``name``"""
+    previous = model.objects.filter(pk=pk).values_list(variants_field, flat=True).first()
+    if model.objects.filter(pk=pk, **{field_name: name}).update(**{variants_field: variants}):
+        swap_variant_references(previous, variants)
+        return True
+    return False
+
+
+def generate_variants(model, pk, field_name, variants_field):
+    """Render the variants of ``model.field_name`` and store them on the row"""
+    name = model.objects.filter(pk=pk).values_list(field_name, flat=True).first()
+    if not name:
+        return None
+    # Uploads of the same content share one blob, and so its variants
+    variants = variants_for(name)
+    if variants:
+        store_variants(model, pk, field_name, variants_field, name, variants)
+    return variants
+
+
+def _run_in_worker(*args):
+    close_old_connections()
+    try:
+        generate_variants(*args)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                thread_name_prefix='image-variants'
+            )
+        return _executor
+
+
+def schedule_variants(instance, field_name, variants_field):
+    """Queue variant generation for ``instance`` (called after commit)"""
+    args = (type(instance), instance.pk, field_name, variants_field)
+    if getattr(settings, 'IMAGE_VARIANTS_SYNC', False):
+        generate_variants(*args)
+    else:
+        get_executor().submit(_run_in_worker, *args)
+
+
+def variant_urls(variants, request=None):
+    """Turn a stored variants dict into URLs plus WebP/JPEG ``srcset`` strings"""
+    if not variants:
+        return None
+
+    def url(path):
+        location = default_storage.url(path)
+        return request.build_absolute_uri(location) if request is not None else location
+
+    sizes = {
+        size_name: {
+            'width': entry['width'],
+            'height': entry['height'],
+            'webp': url(entry['webp']),
+            'jpeg': url(entry['jpeg']),
+        }
+        for size_name, entry in variants.items()
+    }
+    # Sizes larger than the original collapse to the same width, list each once
+    ordered = sorted({entry['width']: entry for entry in sizes.values()}.values(), key=lambda entry: entry['width'])
+    return {
+        'sizes': sizes,
+        'srcset': ', '.join(f"{entry['webp']} {entry['width']}w" for entry in ordered),
+        'srcset_jpeg': ', '.join(f"{entry['jpeg']} {entry['width']}w" for entry in ordered),
+    }
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from products.archive import archive_candidates, archive_products
+
+
+class Command(BaseCommand):
+    help = 'Move products unavailable for PRODUCT_ARCHIVE_AFTER_DAYS to the archive tables (run on a schedule, e.g. daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Products archived per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the products that would be archived')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f'{archive_candidates().count()} products would be archived')
+            return
+        archived_count = archive_products(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully archived {archived_count} products'))
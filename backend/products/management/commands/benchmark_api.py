@@ -0,0 +1,219 @@
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+from products.models import Category, Product
+from products import view_counts
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every products/accounts API route and save p50/p95 latency, throughput and query counts as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help='Previous results file to print deltas against')
+        parser.add_argument('--only', help='Comma separated URL names to run')
+
+    def endpoints(self, product, category, user):
+        """url name -> (method, url kwargs, data builder, authenticated: False, True or 'staff')"""
+        def image_upload():
+            buffer = io.BytesIO()
+            Image.new('RGB', (800, 600), (90, 140, 60)).save(buffer, 'JPEG')
+            return {'images': [SimpleUploadedFile('bench.jpg', buffer.getvalue(), content_type='image/jpeg')]}
+
+        refresh = str(RefreshToken.for_user(user))
+        return {
+            # products/urls.py
+            'product-list-create': [
+                ('GET', {}, lambda: {'page_size': 20}, False),
+                ('POST', {}, lambda: {'title': 'Benchmark bike', 'description': 'Bench', 'category': category.pk, 'price': '10.00'}, True),
+            ],
+            'product-detail': [
+                ('GET', {'pk': product.pk}, None, False),
+                ('PATCH', {'pk': product.pk}, lambda: {'title': 'Benchmark bike (edited)'}, True),
+                ('DELETE', {'pk': product.pk}, None, True),
+            ],
+            'user-products': [('GET', {}, None, True)],
+            'archived-products': [('GET', {}, None, True)],
+            'featured-products': [('GET', {}, None, False)],
+            'trending-products': [('GET', {}, None, False)],
+            'toggle-product-availability': [('POST', {'pk': product.pk}, lambda: {}, True)],
+            'upload-product-images': [('POST', {'pk': product.pk}, image_upload, True)],
+            'similar-products': [('GET', {'pk': product.pk}, None, False)],
+            'category-list-create': [('GET', {}, None, False)],
+            'category-detail': [('GET', {'pk': category.pk}, None, False)],
+            'product-categories': [('GET', {}, None, False)],
+            'search-products': [
+                ('GET', {}, lambda: {'q': 'bike'}, False),
+                ('GET', {}, lambda: {'min_price': 5, 'max_price': 50, 'sort': 'price', 'page': 5}, False),
+                ('GET', {}, lambda: {'cursor': '', 'sort': '-created_at'}, False),
+            ],
+            'product-analytics': [('GET', {}, None, False)],
+            'product-autocomplete': [('GET', {}, lambda: {'q': 'bik'}, False)],
+            # accounts/urls.py
+            'register': [('POST', {}, lambda: {'username': f'bench_{time.monotonic_ns()}', 'email': 'b@example.com', 'password': 'bench-password-1', 'password_confirm': 'bench-password-1'}, False)],
+            'login': [('POST', {}, lambda: {'username': user.username, 'password': 'bench-password-1'}, False)],
+            'logout': [('POST', {}, lambda: {'refresh': refresh}, True)],
+            'token_refresh': [('POST', {}, lambda: {'refresh': refresh}, False)],
+            'user-profile': [('GET', {}, None, True)],
+            'update-profile': [('PATCH', {}, lambda: {'first_name': 'Bench'}, True)],
+            'change-password': [('POST', {}, lambda: {'current_password': 'bench-password-1', 'new_password': 'bench-password-1', 'new_password_confirm': 'bench-password-1'}, True)],
+            'password-reset': [('POST', {}, lambda: {'email': user.email}, False)],
+            'password-reset-confirm': [('POST', {}, lambda: {'uid': 'x', 'token': 'x', 'new_password': 'a', 'new_password_confirm': 'a'}, False)],
+            'password-hash-metrics': [('GET', {}, None, 'staff')],
+        }
+
+    def route_names(self):
+        names = set()
+        for pattern in get_resolver().url_patterns:
+            module = getattr(pattern, 'urlconf_name', None)
+            if getattr(module, '__name__', None) in ('products.urls', 'accounts.urls'):
+                names.update(p.name for p in module.urlpatterns if p.name)
+        return names
+
+    def measure(self, client, method, path, data_builder, headers, repeats, warmup):
+        timings, queries, statuses = [], [], set()
+        for iteration in range(warmup + repeats):
+            data = data_builder() if data_builder else None
+            kwargs = dict(headers)
+            if method == 'GET':
+                call = lambda: client.get(path, data or {}, **kwargs)
+            else:
+                # Product views only accept multipart, which every other view parses too
+                body = encode_multipart(BOUNDARY, data or {})
+                call = lambda: client.generic(method, path, body, content_type=MULTIPART_CONTENT, **kwargs)
+
+            # Every request runs in a transaction that is rolled back, so writes
+            # (POST/PATCH/DELETE) measure the same state each time
+            try:
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as context:
+                        started = time.perf_counter()
+                        response = call()
+                        elapsed = time.perf_counter() - started
+                    raise Rollback
+            except Rollback:
+                pass
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(context.captured_queries))
+                statuses.add(response.status_code)
+        return timings, queries, statuses
+
+    def handle(self, *args, **options):
+        product = Product.objects.filter(is_available=True).select_related('category').first()
+        if product is None:
+            raise CommandError('No products to benchmark, run seed_catalog first')
+        only = set(options['only'].split(',')) if options['only'] else None
+
+        results = {}
+        # Repeated runs would otherwise measure 429s from the shared throttle store
+        no_throttling = override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}})
+        try:
+            with no_throttling, transaction.atomic():
+                user, _ = User.objects.get_or_create(username='benchmark_user', defaults={'email': 'benchmark@example.com'})
+                user.set_password('bench-password-1')
+                user.save()
+                Product.objects.filter(pk=product.pk).update(owner=user)
+                product.refresh_from_db()
+                category = product.category or Category.objects.first()
+                staff, _ = User.objects.get_or_create(username='benchmark_staff', defaults={'is_staff': True})
+                auth_headers = {
+                    False: {},
+                    True: {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'},
+                    'staff': {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(staff).access_token}'},
+                }
+                client = Client(SERVER_NAME=(settings.ALLOWED_HOSTS or ['localhost'])[0].replace('*', 'localhost'))
+
+                endpoints = self.endpoints(product, category, user)
+                missing = self.route_names() - set(endpoints)
+                if missing:
+                    self.stdout.write(self.style.WARNING(f'No benchmark defined for: {", ".join(sorted(missing))}'))
+
+                for name, cases in endpoints.items():
+                    if only and name not in only:
+                        continue
+                    for method, url_kwargs, data_builder, authenticated in cases:
+                        path = reverse(name, kwargs=url_kwargs)
+                        timings, queries, statuses = self.measure(
+                            client, method, path, data_builder, auth_headers[authenticated],
+                            options['requests'], options['warmup']
+                        )
+                        suffix = f' {data_builder()}' if method == 'GET' and data_builder else ''
+                        key = f'{method} {name}{suffix}'
+                        results[key] = {
+                            'path': path,
+                            'requests': len(timings),
+                            'p50_ms': round(statistics.median(timings), 3),
+                            'p95_ms': round(statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0], 3),
+                            'throughput_rps': round(len(timings) / (sum(timings) / 1000), 1),
+                            'queries': max(queries),
+                            'status_codes': sorted(statuses),
+                        }
+                        self.stdout.write(
+                            f"{key:<70} p50 {results[key]['p50_ms']:>8.2f}ms  p95 {results[key]['p95_ms']:>8.2f}ms  "
+                            f"{results[key]['throughput_rps']:>7.1f} req/s  {results[key]['queries']:>3} queries  {sorted(statuses)}"
+                        )
+                raise Rollback
+        except Rollback:
+            pass
+        # Views recorded by the rolled back requests must not reach the database
+        view_counts.discard()
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'commit': self.git_commit(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'products': Product.objects.count(),
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Successfully wrote {len(results)} results to {options["output"]}'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path, results):
+        with open(path) as handle:
+            previous = json.load(handle)
+        self.stdout.write(f"\nCompared with {previous.get('commit') or path}:")
+        for key, current in results.items():
+            before = previous.get('endpoints', {}).get(key)
+            if not before:
+                continue
+            change = (current['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            line = (
+                f"{key:<70} p50 {before['p50_ms']:.2f} -> {current['p50_ms']:.2f}ms ({change:+.0f}%), "
+                f"queries {before['queries']} -> {current['queries']}"
+            )
+            regressed = change > 20 or current['queries'] > before['queries']
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
@@ -0,0 +1,202 @@
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from products.models import Product
+
+SERVERS = {
+    'wsgi': ['ecofinds_backend.wsgi:application'],
+    'asgi': ['ecofinds_backend.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid):
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        for task in Path(f'/proc/{current}/task').glob('*'):
+            try:
+                pending.extend(int(child) for child in (task / 'children').read_text().split())
+            except OSError:
+                pass
+    return pids
+
+
+def rss_bytes(pid):
+    """Resident memory of a process and its children (Linux /proc)"""
+    total = 0
+    for member in _process_tree(pid):
+        try:
+            for line in Path(f'/proc/{member}/status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrency, latency and memory per in-flight request of the WSGI and ASGI (async views) servers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,10,50', help='Comma separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=300, help='Requests per concurrency level')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+        parser.add_argument('--servers', default='wsgi,asgi')
+        parser.add_argument('--output', default='benchmark_asgi.json')
+
+    def paths(self):
+        product = Product.objects.filter(is_available=True).values_list('pk', flat=True).first()
+        if product is None:
+            raise CommandError('No products to benchmark, run seed_catalog first')
+        return [
+            '/api/products/?page_size=20',
+            f'/api/products/{product}/',
+            '/api/products/search/?q=bike',
+            '/api/products/featured/',
+            '/api/products/trending/',
+            '/api/products/categories/list/',
+        ]
+
+    def settings_override(self, directory):
+        """Settings module of this run without throttling, so the load is not rejected"""
+        path = Path(directory) / 'benchmark_asgi_settings.py'
+        path.write_text(
+            f'from {settings.SETTINGS_MODULE} import *  # noqa\n'
+            "REST_FRAMEWORK = {**REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}\n"
+        )
+        return 'benchmark_asgi_settings'
+
+    def start(self, name, port, workers, directory):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([directory, str(settings.BASE_DIR), env.get('PYTHONPATH', '')])
+        env['DJANGO_SETTINGS_MODULE'] = self.settings_override(directory)
+        command = [
+            sys.executable, '-m', 'gunicorn', *SERVERS[name],
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+        ]
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'{name} server exited with {process.returncode}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', '/api/products/categories/list/')
+                connection.getresponse().read()
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f'{name} server did not start')
+
+    def load(self, port, paths, concurrency, total):
+        """Run ``total`` requests from ``concurrency`` keep-alive clients"""
+        counter = iter(range(total))
+        lock = threading.Lock()
+
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            timings, errors = [], 0
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    break
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', paths[index % len(paths)], headers={'Accept': 'application/json'})
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        errors += 1
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                timings.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            return timings, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda _: client(), range(concurrency)))
+        elapsed = time.perf_counter() - started
+        timings = sorted(t for result, _ in results for t in result)
+        return {
+            'throughput_rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2),
+            'errors': sum(errors for _, errors in results),
+        }
+
+    def measure(self, name, paths, options, directory):
+        port = _free_port()
+        process = self.start(name, port, options['workers'], directory)
+        try:
+            # Warm every worker's caches and connections
+            self.load(port, paths, options['workers'] * 2, len(paths) * options['workers'] * 4)
+            idle = rss_bytes(process.pid)
+            results = {'idle_rss_mb': round(idle / 2 ** 20, 1), 'levels': {}}
+            for concurrency in [int(value) for value in options['concurrency'].split(',')]:
+                peak = [idle]
+                done = threading.Event()
+
+                def sample():
+                    while not done.wait(0.05):
+                        peak[0] = max(peak[0], rss_bytes(process.pid))
+                sampler = threading.Thread(target=sample, daemon=True)
+                sampler.start()
+                level = self.load(port, paths, concurrency, options['requests'])
+                done.set()
+                sampler.join()
+                level['peak_rss_mb'] = round(peak[0] / 2 ** 20, 1)
+                level['kb_per_in_flight_request'] = round(max(peak[0] - idle, 0) / 1024 / concurrency, 1)
+                results['levels'][concurrency] = level
+                self.stdout.write(
+                    f"{name} c={concurrency:<4} {level['throughput_rps']:>8.1f} req/s  p50 {level['p50_ms']:>8.2f}ms  "
+                    f"p95 {level['p95_ms']:>8.2f}ms  errors {level['errors']:<4} rss {results['idle_rss_mb']} -> "
+                    f"{level['peak_rss_mb']} MB  ({level['kb_per_in_flight_request']} KB/in-flight request)"
+                )
+            return results
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def handle(self, *args, **options):
+        paths = self.paths()
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'workers': options['workers'],
+            'requests_per_level': options['requests'],
+            'paths': paths,
+            'servers': {},
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['servers'].split(','):
+                if name not in SERVERS:
+                    raise CommandError(f'Unknown server {name}, use wsgi or asgi')
+                report['servers'][name] = self.measure(name, paths, options, directory)
+
+        with open(options['output'], 'w') as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Successfully wrote results to {options["output"]}'))
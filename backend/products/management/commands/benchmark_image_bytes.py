@@ -0,0 +1,45 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Compare image bytes served for one product list page: originals vs. resized variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--size', default='thumbnail', help='Variant size the list page would use')
+
+    def size_of(self, name):
+        try:
+            return default_storage.size(name) if name else 0
+        except OSError:
+            return 0
+
+    def handle(self, *args, **options):
+        products = Product.objects.filter(is_available=True).prefetch_related('images').order_by('-created_at')[:options['page_size']]
+
+        totals = {'original': 0, 'webp': 0, 'jpeg': 0}
+        missing_count = 0
+        for product in products:
+            images = [(product.image.name, product.image_variants)]
+            primary = next((img for img in product.images.all() if img.is_primary), None)
+            if primary:
+                images.append((primary.image.name, primary.variants))
+
+            for name, variants in images:
+                if not name:
+                    continue
+                original = self.size_of(name)
+                variant = (variants or {}).get(options['size'])
+                if not variant:
+                    missing_count += 1
+                totals['original'] += original
+                totals['webp'] += self.size_of(variant['webp']) if variant else original
+                totals['jpeg'] += self.size_of(variant['jpeg']) if variant else original
+
+        self.stdout.write(f"Products on page: {len(products)}")
+        self.stdout.write(f"Images without a '{options['size']}' variant: {missing_count}")
+        for key, total in totals.items():
+            ratio = f" ({total / totals['original']:.1%} of original)" if totals['original'] and key != 'original' else ''
+            self.stdout.write(f'{key:>8}: {total / 1024:.1f} KiB{ratio}')
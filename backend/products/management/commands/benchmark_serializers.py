@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from products.fast_serializers import product_rows, serialize_product_rows
+from products.models import Product
+from products.renderers import FastJSONRenderer
+from products.search import search_queryset
+from products.serializers import ProductListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductListSerializer + JSONRenderer with the values() fast path and check both render the same bytes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeats', type=int, default=20)
+        parser.add_argument('--page-sizes', default='20,100')
+        parser.add_argument('--query', default='bike', help='Search term for the search case')
+
+    def cases(self, page_sizes, query):
+        base = Product.objects.filter(is_available=True).select_related('category', 'owner').prefetch_related('images')
+        for size in page_sizes:
+            yield f'list page_size={size}', base.order_by('-created_at')[:size]
+        yield 'featured', base.filter(is_featured=True).order_by('-created_at')[:10]
+        yield 'trending', base.order_by('-view_count')[:10]
+        yield f'search q={query}', search_queryset(base, query).order_by('-created_at')[:20]
+
+    def time_it(self, render, repeats):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                body = render()
+            timings.append((time.perf_counter() - started) * 1000)
+        return body, statistics.median(timings), len(context.captured_queries)
+
+    def handle(self, *args, **options):
+        if not Product.objects.exists():
+            raise CommandError('No products to benchmark, run seed_catalog first')
+        request = RequestFactory(SERVER_NAME=(settings.ALLOWED_HOSTS or ['localhost'])[0].replace('*', 'localhost')).get('/api/products/')
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        mismatches = 0
+
+        for name, queryset in self.cases(page_sizes, options['query']):
+            for label, context_request in (('', request), (' (no request)', None)):
+                context = {'request': context_request}
+                reference, slow_ms, slow_queries = self.time_it(
+                    lambda: JSONRenderer().render(ProductListSerializer(queryset.all(), many=True, context=context).data),
+                    options['repeats']
+                )
+                fast, fast_ms, fast_queries = self.time_it(
+                    lambda: FastJSONRenderer().render(serialize_product_rows(product_rows(queryset.all()), context_request)),
+                    options['repeats']
+                )
+                identical = fast == reference
+                mismatches += not identical
+                line = (
+                    f'{name + label:<35} serializer {slow_ms:>8.2f}ms ({slow_queries} queries)  '
+                    f'fast path {fast_ms:>8.2f}ms ({fast_queries} queries)  '
+                    f'{slow_ms / fast_ms if fast_ms else 0:>5.1f}x  {len(fast)} bytes'
+                )
+                self.stdout.write(line if identical else self.style.ERROR(line + '  OUTPUT DIFFERS'))
+
+        if mismatches:
+            raise CommandError(f'{mismatches} cases rendered different bytes')
+        self.stdout.write(self.style.SUCCESS('Successfully compared serializers, every case rendered identical bytes'))
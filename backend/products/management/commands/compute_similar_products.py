@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from products.similarity import compute_similar
+
+
+class Command(BaseCommand):
+    help = 'Precompute TF-IDF "similar items" per category (new and edited listings only unless --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product against one IDF, required periodically (e.g. nightly)')
+        parser.add_argument('--category', type=int, action='append', help='Only this category id (repeatable)')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError:
+            raise CommandError('compute_similar_products needs numpy and scipy (pip install numpy scipy)')
+
+        started = time.monotonic()
+        updated = compute_similar(full=options['full'], category_ids=options['category'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully updated similar items of {sum(updated.values())} products in '
+                f'{len(updated)} categories in {time.monotonic() - started:.1f}s'
+            )
+        )
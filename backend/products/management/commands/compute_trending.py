@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.trending import compute_trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute the time-decayed trending product rankings (run on a schedule, e.g. every 10 minutes)'
+
+    def handle(self, *args, **options):
+        count = compute_trending()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully ranked {count} trending entries')
+        )
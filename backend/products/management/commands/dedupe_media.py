@@ -0,0 +1,85 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from products.models import ArchivedProduct, ArchivedProductImage, Product, ProductImage, StoredBlob
+from products.storage import ContentAddressedStorage, is_blob, variant_names
+
+
+class Command(BaseCommand):
+    help = 'Move product images into content-addressed blobs, recount references and purge unused blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-originals', action='store_true', help='Delete legacy files once they are stored as blobs')
+        parser.add_argument('--purge', action='store_true', help='Delete blobs that no image refers to')
+        parser.add_argument('--grace-hours', type=int, default=24, help='Only purge blobs unreferenced for this long')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            self.stdout.write(self.style.WARNING('Default storage is not content addressed, nothing to do'))
+            return
+
+        # Archived listings keep their files too (see products.archive)
+        targets = [
+            (Product, 'image_variants'), (ProductImage, 'variants'),
+            (ArchivedProduct, 'image_variants'), (ArchivedProductImage, 'variants'),
+        ]
+
+        # 1. Move legacy uploads into blobs
+        moved_count = 0
+        legacy_names = set()
+        for model, _ in targets:
+            rows = model.objects.exclude(image='').exclude(image__isnull=True).exclude(image__startswith='blobs/')
+            for pk, name in rows.values_list('pk', 'image').iterator():
+                if not default_storage.exists(name):
+                    self.stdout.write(self.style.WARNING(f'{model.__name__} {pk}: missing file {name}'))
+                    continue
+                with default_storage.open(name, 'rb') as original:
+                    blob = default_storage.save(name, original)
+                model.objects.filter(pk=pk, image=name).update(image=blob)
+                legacy_names.add(name)
+                moved_count += 1
+
+        # 2. Recount references from every image field and variant
+        references = Counter()
+        for model, variants_field in targets:
+            for name, variants in model.objects.values_list('image', variants_field).iterator():
+                for referenced in [name] + variant_names(variants):
+                    if is_blob(referenced):
+                        references[referenced] += 1
+
+        fixed_count = 0
+        for blob in StoredBlob.objects.iterator():
+            if blob.ref_count != references.get(blob.name, 0):
+                StoredBlob.objects.filter(pk=blob.pk).update(ref_count=references.get(blob.name, 0), updated_at=timezone.now())
+                fixed_count += 1
+
+        if options['delete_originals']:
+            for name in legacy_names:
+                default_storage.delete(name)
+
+        # 3. Purge unreferenced blobs
+        purged_count = 0
+        if options['purge']:
+            cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+            candidates = list(StoredBlob.objects.filter(ref_count=0, updated_at__lt=cutoff).values_list('pk', flat=True))
+            for pk in candidates:
+                with transaction.atomic():
+                    # Re-checked under the row lock, the blob may have been referenced or uploaded again
+                    blob = StoredBlob.objects.select_for_update().filter(pk=pk, ref_count=0, updated_at__lt=cutoff).first()
+                    if blob is None:
+                        continue
+                    default_storage.delete(blob.name)
+                    blob.delete()
+                purged_count += 1
+
+        unique_bytes = sum(StoredBlob.objects.values_list('size', flat=True))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully moved {moved_count} images into blobs, fixed {fixed_count} reference counts, '
+                f'purged {purged_count} blobs ({unique_bytes / 1024:.1f} KiB stored)'
+            )
+        )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from products.models import Product, ProductImage
+from products.images import store_variants, variants_for
+
+
+class Command(BaseCommand):
+    help = 'Render resized WebP/JPEG variants for existing product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render images that already have variants')
+
+    def handle(self, *args, **options):
+        targets = [
+            (Product, Product.objects.exclude(image='').exclude(image__isnull=True), 'image_variants'),
+            (ProductImage, ProductImage.objects.exclude(image=''), 'variants'),
+        ]
+
+        # Rows sharing a blob share its variants, each stored image is rendered once
+        variants_by_name = {}
+        updated_count = 0
+        failed_count = 0
+        for model, queryset, variants_field in targets:
+            if not options['force']:
+                queryset = queryset.filter(**{variants_field: {}})
+            for pk, name in queryset.values_list('pk', 'image').iterator():
+                if name not in variants_by_name:
+                    variants_by_name[name] = variants_for(name, reuse=not options['force'])
+                variants = variants_by_name[name]
+                if variants:
+                    updated_count += store_variants(model, pk, 'image', variants_field, name, variants)
+                else:
+                    failed_count += 1
+                    self.stdout.write(self.style.WARNING(f'Could not render {model.__name__} {pk}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully stored variants for {updated_count} images '
+                f'({len(variants_by_name)} distinct files, {failed_count} failed)'
+            )
+        )
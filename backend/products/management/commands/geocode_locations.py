@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products import geo
+
+
+class Command(BaseCommand):
+    help = 'Recompute product coordinates and geohashes from their location text'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        located = unknown = 0
+        batch = []
+        for product in Product.objects.only('id', 'location').iterator(chunk_size=batch_size):
+            if geo.geocode(product):
+                located += 1
+            else:
+                unknown += 1
+            batch.append(product)
+            if len(batch) >= batch_size:
+                Product.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+                batch = []
+        if batch:
+            Product.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully geocoded {located} products ({unknown} with unknown locations)')
+        )
@@ -0,0 +1,145 @@
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from products.models import Category, Product, ImportCheckpoint
+from products.serializers import ProductImportSerializer
+from products.signals import adjust_category_count
+from products import geo, search
+
+
+class Command(BaseCommand):
+    help = 'Stream products from a CSV or JSONL file into the catalog in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or JSONL file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--owner', help='Username owning rows without an "owner" column')
+        parser.add_argument('--errors', help='Write rejected rows as JSONL to this file')
+        parser.add_argument('--resume', action='store_true', help='Skip rows committed by a previous run of the same file')
+        parser.add_argument('--job', help='Checkpoint name, defaults to the absolute file path')
+
+    def read_rows(self, path, file_format):
+        """
+        Yield (line number, row dict, None) without loading the file into
+        memory, or (line number, raw line, error) for unreadable JSONL lines
+        """
+        with open(path, newline='', encoding='utf-8') as handle:
+            if file_format == 'csv':
+                for number, row in enumerate(csv.DictReader(handle), start=1):
+                    yield number, row, None
+            else:
+                for number, line in enumerate(handle, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as exc:
+                        yield number, line.rstrip('\n'), f'Invalid JSON: {exc}'
+                        continue
+                    if isinstance(row, dict):
+                        yield number, row, None
+                    else:
+                        yield number, line.rstrip('\n'), f'Expected a JSON object, got {type(row).__name__}'
+
+    def resolve_owner(self, value):
+        value = str(value).strip()
+        if value not in self.owners:
+            if len(self.owners) > 10000:
+                self.owners.clear()
+            lookup = {'pk': int(value)} if value.isdigit() else {'username': value}
+            self.owners[value] = User.objects.filter(**lookup).values_list('pk', flat=True).first()
+        return self.owners[value]
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = max(options['batch_size'], 1)
+
+        # Cached lookups: every category by id, slug and name; owners on first use
+        categories = {}
+        for category in Category.objects.all():
+            for key in (str(category.pk), category.slug, category.name):
+                categories[key.lower()] = category
+        self.owners = {}
+        default_owner = self.resolve_owner(options['owner']) if options['owner'] else None
+        if options['owner'] and default_owner is None:
+            raise CommandError(f'Unknown owner "{options["owner"]}"')
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=options['job'] or os.path.abspath(path))
+        skip_until = checkpoint.rows_done if options['resume'] else 0
+        if skip_until:
+            self.stdout.write(f'Resuming after row {skip_until}')
+
+        errors_file = open(options['errors'], 'a' if options['resume'] else 'w', encoding='utf-8') if options['errors'] else None
+        context = {'categories': categories}
+        totals = Counter()
+        batch = []
+        last_row = skip_until
+        started = time.monotonic()
+
+        def flush(batch, last_row):
+            with transaction.atomic():
+                created = Product.objects.bulk_create(batch)
+                search.index_products(created)
+                for category_id, available in Counter(p.category_id for p in created if p.is_available).items():
+                    adjust_category_count(category_id, available)
+                ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(rows_done=last_row)
+            totals['created'] += len(created)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{last_row} rows read, {totals["created"]} created, {totals["failed"]} rejected ({totals["created"] / elapsed:.0f} products/s)')
+
+        def reject(number, errors, data):
+            totals['failed'] += 1
+            if errors_file:
+                errors_file.write(json.dumps({'row': number, 'errors': errors, 'data': data}) + '\n')
+            elif totals['failed'] <= 20:
+                self.stdout.write(self.style.WARNING(f'Row {number}: {errors}'))
+
+        try:
+            for number, row, problem in self.read_rows(path, file_format):
+                if number <= skip_until:
+                    continue
+                last_row = number
+                if problem:
+                    reject(number, {'non_field_errors': [problem]}, row)
+                    continue
+                row = {key: value for key, value in row.items() if value not in ('', None)}
+                owner_value = row.pop('owner', None)
+                owner_id = self.resolve_owner(owner_value) if owner_value is not None else default_owner
+
+                serializer = ProductImportSerializer(data=row, context=context)
+                if serializer.is_valid() and owner_id is not None:
+                    product = Product(owner_id=owner_id, **serializer.validated_data)
+                    geo.geocode(product)  # bulk_create skips the pre_save signal
+                    batch.append(product)
+                else:
+                    errors = {field: [str(message) for message in messages] for field, messages in serializer.errors.items()}
+                    if owner_id is None:
+                        errors['owner'] = [f'Unknown or missing owner "{owner_value or ""}"']
+                    reject(number, errors, row)
+
+                if len(batch) >= batch_size:
+                    flush(batch, last_row)
+                    batch = []
+            if batch or last_row > skip_until:
+                flush(batch, last_row)
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully imported {totals["created"]} products in {elapsed:.1f}s '
+                f'({totals["created"] / max(elapsed, 0.001):.0f} products/s), {totals["failed"]} rows rejected'
+            )
+        )
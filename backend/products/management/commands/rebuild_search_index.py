@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('Full-text search is not supported on this database, nothing to do'))
+            return
+
+        search.clear_index()
+        count = search.rebuild_index(Product.objects.all())
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {count} products')
+        )
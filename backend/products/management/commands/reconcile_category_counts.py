@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from products.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized available-product count of every category'
+
+    def handle(self, *args, **options):
+        counts = Category.objects.annotate(
+            available=Count('products', filter=Q(products__is_available=True))
+        ).values_list('pk', 'name', 'product_count', 'available')
+
+        fixed_count = 0
+        for pk, name, stored, available in list(counts):
+            if stored != available:
+                Category.objects.filter(pk=pk).update(product_count=available)
+                fixed_count += 1
+                self.stdout.write(f'{name}: {stored} -> {available}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully reconciled {fixed_count} categories')
+        )
@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from products.models import ImageFingerprint, Product, ProductImage
+from products import duplicates
+
+
+class Command(BaseCommand):
+    help = 'Fingerprint product photos that have no dHash yet and report near-duplicate groups across products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-backfill', action='store_true', help='Only scan existing fingerprints')
+        parser.add_argument('--output', help='Write the duplicate groups as JSON to this file')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        hashed = 0 if options['no_backfill'] else self.backfill()
+
+        fingerprints = ImageFingerprint.objects.values_list('pk', 'product_id', 'dhash')
+        groups = duplicates.duplicate_groups(fingerprints.iterator())
+        groups.sort(key=len, reverse=True)
+
+        for members in groups[:20]:
+            products = sorted({product_id for _, product_id in members})
+            self.stdout.write(f'{len(members)} photos across {len(products)} products: {products[:10]}')
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(
+                    [{'fingerprints': [pk for pk, _ in members], 'products': sorted({pid for _, pid in members})} for members in groups],
+                    handle, indent=2
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully fingerprinted {hashed} photos and found {len(groups)} duplicate groups '
+                f'in {time.monotonic() - started:.1f}s'
+            )
+        )
+
+    def backfill(self):
+        hashed = 0
+        for image in ProductImage.objects.filter(fingerprints__isnull=True).exclude(image='').iterator():
+            hashed += duplicates.fingerprint(image.product_id, image.pk, image.image.name) is not None
+        main_image_hashed = ImageFingerprint.objects.filter(product=OuterRef('pk'), product_image__isnull=True)
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).filter(~Exists(main_image_hashed))
+        for product_id, name in products.values_list('pk', 'image').iterator():
+            hashed += duplicates.fingerprint(product_id, None, name) is not None
+        return hashed
@@ -0,0 +1,160 @@
+import io
+import math
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+from products.models import Category, Product, ProductImage, StoredBlob
+from products import geo, search
+
+# Words used to build listing titles, per category slug
+VOCABULARY = {
+    'electronics': (['Used', 'Refurbished', 'Vintage', 'Wireless', 'Portable'], ['laptop', 'phone', 'tablet', 'headphones', 'camera', 'monitor', 'speaker', 'console']),
+    'clothing': (['Denim', 'Wool', 'Leather', 'Cotton', 'Vintage'], ['jacket', 'jeans', 'dress', 'sweater', 'boots', 'sneakers', 'scarf', 'coat']),
+    'books': (['Hardcover', 'Paperback', 'Signed', 'First edition', 'Illustrated'], ['novel', 'cookbook', 'textbook', 'atlas', 'biography', 'comic', 'poetry collection']),
+    'home-garden': (['Oak', 'Ceramic', 'Cast iron', 'Handmade', 'Mid-century'], ['table', 'lamp', 'chair', 'planter', 'pan', 'rug', 'bookshelf', 'mirror']),
+    'sports': (['Carbon', 'Youth', 'Pro', 'Lightweight', 'Folding'], ['bike', 'tennis racket', 'kayak', 'skis', 'tent', 'dumbbells', 'helmet']),
+    'toys': (['Wooden', 'Collectible', 'Remote control', 'Classic', 'Educational'], ['puzzle', 'board game', 'train set', 'doll', 'drone', 'lego set']),
+    'automotive': (['OEM', 'Aftermarket', 'Chrome', 'All-season', 'Heavy duty'], ['tires', 'roof rack', 'car seat', 'floor mats', 'jump starter', 'toolkit']),
+}
+DEFAULT_VOCABULARY = (['Gently used', 'Like new', 'Old', 'Spare', 'Assorted'], ['item', 'set', 'bundle', 'kit', 'collection'])
+
+LOCATIONS = [
+    'New York, NY', 'Los Angeles, CA', 'Chicago, IL', 'Houston, TX', 'Phoenix, AZ', 'Philadelphia, PA',
+    'San Antonio, TX', 'San Diego, CA', 'Dallas, TX', 'Austin, TX', 'Jacksonville, FL', 'Columbus, OH',
+    'Charlotte, NC', 'Indianapolis, IN', 'San Francisco, CA', 'Seattle, WA', 'Denver, CO', 'Boston, MA',
+    'Nashville, TN', 'Portland, OR', 'Las Vegas, NV', 'Detroit, MI', 'Atlanta, GA', 'Miami, FL',
+    'Minneapolis, MN', 'Raleigh, NC', 'Salt Lake City, UT', 'Pittsburgh, PA', 'Madison, WI', 'Boise, ID',
+]
+CONDITION_WEIGHTS = [('new', 10), ('like_new', 25), ('good', 40), ('fair', 20), ('poor', 5)]
+SEED_PASSWORD = 'seed-password'
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic catalog (users, categories, products, images) for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--categories', type=int, default=0, help='Extra categories on top of populate_categories')
+        parser.add_argument('--max-images', type=int, default=4, help='Maximum gallery images per product')
+        parser.add_argument('--image-pool', type=int, default=32, help='Distinct placeholder image files to share')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = max(options['batch_size'], 1)
+        started = time.monotonic()
+
+        categories = self.create_categories(options['categories'])
+        owner_ids = self.create_users(options['users'], batch_size)
+        image_pool = self.create_image_pool(options['image_pool'], rng)
+        now = timezone.now()
+        condition_names = [name for name, _ in CONDITION_WEIGHTS]
+        condition_weights = [weight for _, weight in CONDITION_WEIGHTS]
+        # Median price differs per category, prices are log-normal around it
+        median_prices = {category.pk: rng.choice([8, 15, 25, 40, 80, 150]) for category in categories}
+        pool_usage = Counter()
+
+        created = 0
+        while created < options['products']:
+            count = min(batch_size, options['products'] - created)
+            products, created_at = [], []
+            for _ in range(count):
+                category = rng.choice(categories)
+                adjectives, nouns = VOCABULARY.get(category.slug, DEFAULT_VOCABULARY)
+                title = f'{rng.choice(adjectives)} {rng.choice(nouns)}'
+                price = round(max(rng.lognormvariate(math.log(median_prices[category.pk]), 0.8), 1), 2)
+                # Sellers follow a power law: a few owners list most of the items
+                owner_id = owner_ids[min(int(rng.paretovariate(1.16)) - 1, len(owner_ids) - 1)]
+                products.append(Product(
+                    title=title,
+                    description=f'{title} in {rng.choice(["great", "decent", "working", "excellent"])} shape. '
+                                f'Pickup or shipping available. {rng.choice(nouns).capitalize()} not included.',
+                    category=category,
+                    condition=rng.choices(condition_names, condition_weights)[0],
+                    price=price,
+                    original_price=round(price * rng.uniform(1.1, 3), 2) if rng.random() < 0.6 else None,
+                    owner_id=owner_id,
+                    location=rng.choice(LOCATIONS),
+                    is_available=rng.random() < 0.9,
+                    is_featured=rng.random() < 0.02,
+                    view_count=min(int(rng.paretovariate(1.2)) - 1, 100000),
+                ))
+                geo.geocode(products[-1])
+                # Recent listings are more common than old ones
+                created_at.append(now - timedelta(days=min(rng.expovariate(1 / 120), 730)))
+
+            with transaction.atomic():
+                products = Product.objects.bulk_create(products)
+                for product, moment in zip(products, created_at):
+                    product.created_at = product.updated_at = moment
+                Product.objects.bulk_update(products, ['created_at', 'updated_at'])
+                search.index_products(products)
+
+                images = []
+                for product in products:
+                    for position in range(rng.randint(0, options['max_images'])):
+                        name = rng.choice(image_pool)
+                        pool_usage[name] += 1
+                        images.append(ProductImage(product=product, image=name, is_primary=(position == 0)))
+                ProductImage.objects.bulk_create(images)
+
+            created += count
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{created} products ({created / elapsed:.0f}/s)')
+
+        # bulk_create skips signals, so bring the derived data up to date
+        for name, uses in pool_usage.items():
+            StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + uses)
+        call_command('reconcile_category_counts', stdout=io.StringIO())
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully generated {created} products for {len(owner_ids)} users in '
+                f'{len(categories)} categories in {time.monotonic() - started:.1f}s '
+                f'(user password: "{SEED_PASSWORD}")'
+            )
+        )
+
+    def create_categories(self, extra):
+        call_command('populate_categories', stdout=io.StringIO())
+        for number in range(1, extra + 1):
+            Category.objects.get_or_create(
+                slug=f'seed-category-{number}',
+                defaults={'name': f'Seed Category {number}', 'description': 'Generated by seed_catalog'}
+            )
+        return list(Category.objects.filter(is_active=True))
+
+    def create_users(self, count, batch_size):
+        password = make_password(SEED_PASSWORD)  # hash once, not per user
+        existing = set(User.objects.filter(username__startswith='seed_user_').values_list('username', flat=True))
+        users = [
+            User(username=f'seed_user_{number}', email=f'seed_user_{number}@example.com', password=password)
+            for number in range(count)
+            if f'seed_user_{number}' not in existing
+        ]
+        User.objects.bulk_create(users, batch_size=batch_size)
+        return list(User.objects.filter(username__startswith='seed_user_').order_by('pk').values_list('pk', flat=True)[:count])
+
+    def create_image_pool(self, size, rng):
+        """A few placeholder photos shared by every generated image row"""
+        names = []
+        for number in range(max(size, 1)):
+            color = tuple(rng.randint(0, 255) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', (1200, 900), color).save(buffer, 'JPEG', quality=85)
+            names.append(default_storage.save(f'products/images/seed_{number}.jpg', ContentFile(buffer.getvalue())))
+        return names
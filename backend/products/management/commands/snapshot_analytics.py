@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.analytics import take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Refresh today's product analytics rollup (the endpoint also refreshes it once older than ANALYTICS_SNAPSHOT_MAX_AGE)"
+
+    def handle(self, *args, **options):
+        snapshot = take_snapshot()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully stored analytics snapshot for {snapshot.date} ({snapshot.total_products} products)')
+        )
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE products_product_fts ('
+            'product_id bigint PRIMARY KEY REFERENCES products_product (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX products_product_fts_document_idx ON products_product_fts USING GIN (document)'
+        )
+        schema_editor.execute(
+            "INSERT INTO products_product_fts (product_id, document) "
+            "SELECT p.id, setweight(to_tsvector('english', p.title), 'A') || "
+            "setweight(to_tsvector('english', p.description), 'B') || "
+            "setweight(to_tsvector('english', c.name), 'C') "
+            "FROM products_product p JOIN products_category c ON c.id = p.category_id"
+        )
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE products_product_fts USING fts5('
+            "title, description, category_name, tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            'INSERT INTO products_product_fts (rowid, title, description, category_name) '
+            'SELECT p.id, p.title, p.description, c.name '
+            'FROM products_product p JOIN products_category c ON c.id = p.category_id'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP TABLE IF EXISTS products_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_auto_20250906_1521'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:08
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_product_counts(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    counts = Category.objects.annotate(
+        available=Count('products', filter=Q(products__is_available=True))
+    ).values_list('pk', 'available')
+    for pk, available in list(counts):
+        Category.objects.filter(pk=pk).update(product_count=available)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_view_count_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Available products, maintained by products.signals'),
+        ),
+        migrations.RunPython(populate_product_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_category_product_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductViewBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_buckets', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_start'], name='products_pr_bucket__1a8de2_idx')],
+                'unique_together': {('product', 'bucket_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trending_entries', to='products.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_entries', to='products.product')),
+            ],
+            options={
+                'ordering': ['category', 'rank'],
+                'indexes': [models.Index(fields=['category', 'rank'], name='products_tr_categor_89e912_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total_products', models.PositiveIntegerField(default=0)),
+                ('total_categories', models.PositiveIntegerField(default=0)),
+                ('avg_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('category_distribution', models.JSONField(default=list)),
+                ('condition_distribution', models.JSONField(default=list)),
+                ('generated_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def geocode_products(apps, schema_editor):
+    from products import geo
+
+    Product = apps.get_model('products', 'Product')
+    products = list(Product.objects.exclude(location='').only('id', 'location'))
+    for product in products:
+        geo.geocode(product)
+    Product.objects.bulk_update(products, ['latitude', 'longitude', 'geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_importcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, help_text='From location, see products.geo', null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['geohash'], name='products_pr_geohash_db39f2_idx'),
+        ),
+        migrations.RunPython(geocode_products, migrations.RunPython.noop),
+    ]
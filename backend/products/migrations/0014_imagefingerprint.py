@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_similarproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('dhash', models.BigIntegerField()),
+                ('band0', models.PositiveIntegerField()),
+                ('band1', models.PositiveIntegerField()),
+                ('band2', models.PositiveIntegerField()),
+                ('band3', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_fingerprints', to='products.product')),
+                ('product_image', models.ForeignKey(blank=True, help_text='Empty for Product.image', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='products.productimage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band0'], name='products_im_band0_0c958b_idx'), models.Index(fields=['band1'], name='products_im_band1_eee3f8_idx'), models.Index(fields=['band2'], name='products_im_band2_84d230_idx'), models.Index(fields=['band3'], name='products_im_band3_ea0fe8_idx'), models.Index(fields=['name'], name='products_im_name_22e9df_idx')],
+            },
+        ),
+    ]
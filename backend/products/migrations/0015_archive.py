@@ -0,0 +1,103 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_imagefingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedProduct',
+            fields=[
+                ('id', models.BigIntegerField(help_text='Primary key of the archived product', primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('image', models.CharField(blank=True, max_length=255)),
+                ('image_variants', models.JSONField(blank=True, default=dict)),
+                ('fields', models.JSONField(default=dict, help_text='Other Product fields, serialized')),
+                ('updated_at', models.DateTimeField(help_text='Last change before archival')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedProductImage',
+            fields=[
+                ('id', models.BigIntegerField(help_text='Primary key of the archived image', primary_key=True, serialize=False)),
+                ('image', models.CharField(max_length=255)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+                ('fields', models.JSONField(default=dict, help_text='Other ProductImage fields, serialized')),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_categor_c898cc_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_price_9b1a5f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_created_52f0d7_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_view_co_64c090_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_geohash_db39f2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['category', '-created_at'], name='product_live_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['-created_at'], name='product_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price'], name='product_live_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['-view_count'], name='product_live_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True), ('is_featured', True)), fields=['-created_at'], name='product_live_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['geohash'], name='product_live_geohash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', False)), fields=['updated_at'], name='product_unlisted_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedproduct',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to='products.category'),
+        ),
+        migrations.AddField(
+            model_name='archivedproduct',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedproductimage',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='products.archivedproduct'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:43
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def populate_similar_computed_at(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    SimilarProduct = apps.get_model('products', 'SimilarProduct')
+    computed_at = SimilarProduct.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id').annotate(
+        latest=Max('computed_at')
+    ).values('latest')
+    Product.objects.filter(similar_entries__isnull=False).update(similar_computed_at=Subquery(computed_at))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='similar_computed_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When its similar items were last computed, even if none were found (see products.similarity)', null=True),
+        ),
+        migrations.RunPython(populate_similar_computed_at, migrations.RunPython.noop),
+    ]
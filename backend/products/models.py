@@ -9,6 +9,7 @@ class Category(models.Model):
     description = models.TextField(blank=True)
     icon = models.CharField(max_length=50, blank=True, help_text="Icon class name (e.g., 'fas fa-laptop')")
     is_active = models.BooleanField(default=True)
+    product_count = models.PositiveIntegerField(default=0, editable=False, help_text="Available products, maintained by products.signals")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -18,6 +19,15 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # product_count is maintained with F() updates, never write back a stale copy
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'product_count'
+            ]
+        super().save(*args, **kwargs)
+
 
 class Product(models.Model):
     CONDITION_CHOICES = [
@@ -35,8 +45,13 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     original_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Original price when new")
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of image, see products.images")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
     location = models.CharField(max_length=200, blank=True, help_text="City, State")
+    latitude = models.FloatField(null=True, blank=True, editable=False, help_text="From location, see products.geo")
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
+    similar_computed_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="When its similar items were last computed, even if none were found (see products.similarity)")
     is_available = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
     view_count = models.PositiveIntegerField(default=0)
@@ -46,28 +61,55 @@ class Product(models.Model):
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['category', 'is_available']),
-            models.Index(fields=['price']),
-            models.Index(fields=['created_at']),
+            # Listings only ever sort/filter available products, so their
+            # indexes leave out unlisted rows (see products.archive)
+            models.Index(fields=['category', '-created_at'], condition=models.Q(is_available=True), name='product_live_category_idx'),
+            models.Index(fields=['-created_at'], condition=models.Q(is_available=True), name='product_live_created_idx'),
+            models.Index(fields=['price'], condition=models.Q(is_available=True), name='product_live_price_idx'),
+            models.Index(fields=['-view_count'], condition=models.Q(is_available=True), name='product_live_views_idx'),
+            models.Index(fields=['-created_at'], condition=models.Q(is_available=True, is_featured=True), name='product_live_featured_idx'),
+            models.Index(fields=['geohash'], condition=models.Q(is_available=True), name='product_live_geohash_idx'),
+            # Archival candidates
+            models.Index(fields=['updated_at'], condition=models.Q(is_available=False), name='product_unlisted_idx'),
         ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so category counters can be adjusted on save
+        if 'category_id' in field_names and 'is_available' in field_names:
+            instance._counter_state = (instance.category_id, instance.is_available)
+        # ... and the autocomplete index updated when the title or availability changes
+        if 'title' in field_names and 'is_available' in field_names:
+            instance._autocomplete_state = (instance.title, instance.is_available)
+        # ... and so image variants are only regenerated when the image changes
+        if 'image' in field_names:
+            instance._loaded_image = instance.image.name
+        return instance
+
     @property
     def discount_percentage(self):
-        if self.original_price and self.original_price > self.price:
-            return round(((self.original_price - self.price) / self.original_price) * 100, 1)
+        return self.compute_discount(self.price, self.original_price)
+
+    @staticmethod
+    def compute_discount(price, original_price):
+        if original_price and original_price > price:
+            return round(((original_price - price) / original_price) * 100, 1)
         return 0
 
     def increment_view_count(self):
-        self.view_count += 1
-        self.save(update_fields=['view_count'])
+        """Buffer a view (see products.view_counts) and refresh view_count to the live value"""
+        from .view_counts import record_view
+        self.view_count += record_view(self.pk)
 
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/images/')
+    variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of image, see products.images")
     alt_text = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -75,5 +117,161 @@ class ProductImage(models.Model):
     class Meta:
         ordering = ['-is_primary', 'created_at']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._loaded_image = instance.image.name
+        return instance
+
+    def __str__(self):
+        return f"{self.product.title} - Image {self.id}"
+
+
+class ArchivedProduct(models.Model):
+    """A product unavailable for PRODUCT_ARCHIVE_AFTER_DAYS, moved out of Product by products.archive"""
+    id = models.BigIntegerField(primary_key=True, help_text="Primary key of the archived product")
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_products')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='archived_products')
+    title = models.CharField(max_length=200)
+    image = models.CharField(max_length=255, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True)
+    fields = models.JSONField(default=dict, help_text="Other Product fields, serialized")
+    updated_at = models.DateTimeField(help_text="Last change before archival")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-archived_at']
+
+    def __str__(self):
+        return f"{self.title} (archived)"
+
+
+class ArchivedProductImage(models.Model):
+    id = models.BigIntegerField(primary_key=True, help_text="Primary key of the archived image")
+    product = models.ForeignKey(ArchivedProduct, on_delete=models.CASCADE, related_name='images')
+    image = models.CharField(max_length=255)
+    variants = models.JSONField(default=dict, blank=True)
+    fields = models.JSONField(default=dict, help_text="Other ProductImage fields, serialized")
+
+    def __str__(self):
+        return f"{self.product_id} - Image {self.id} (archived)"
+
+
+class ProductViewBucket(models.Model):
+    """Views of a product within one hour, used to compute trending scores"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='view_buckets')
+    bucket_start = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['product', 'bucket_start']
+        indexes = [
+            models.Index(fields=['bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.bucket_start:%Y-%m-%d %H:00}: {self.views}"
+
+
+class TrendingProduct(models.Model):
+    """Precomputed trending ranking, global when category is null"""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='trending_entries')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='trending_entries')
+    rank = models.PositiveIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['category', 'rank']
+        indexes = [
+            models.Index(fields=['category', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} {self.product_id} ({self.category_id or 'all'})"
+
+
+class SimilarProduct(models.Model):
+    """Precomputed nearest neighbours of a product by title/description TF-IDF"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_to')
+    rank = models.PositiveIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        indexes = [
+            models.Index(fields=['product', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.similar_id} (#{self.rank}, {self.score:.2f})"
+
+
+class ImageFingerprint(models.Model):
+    """dHash of a product photo, split into 16-bit bands for duplicate search (see products.duplicates)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='image_fingerprints')
+    product_image = models.ForeignKey(ProductImage, on_delete=models.CASCADE, null=True, blank=True, related_name='fingerprints', help_text="Empty for Product.image")
+    name = models.CharField(max_length=255)
+    dhash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField()
+    band1 = models.PositiveIntegerField()
+    band2 = models.PositiveIntegerField()
+    band3 = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band0']),
+            models.Index(fields=['band1']),
+            models.Index(fields=['band2']),
+            models.Index(fields=['band3']),
+            models.Index(fields=['name']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.dhash & 0xFFFFFFFFFFFFFFFF:016x})"
+
+
+class AnalyticsSnapshot(models.Model):
+    """Daily rollup of catalog statistics, refreshed by products.analytics"""
+    date = models.DateField(unique=True)
+    total_products = models.PositiveIntegerField(default=0)
+    total_categories = models.PositiveIntegerField(default=0)
+    avg_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    category_distribution = models.JSONField(default=list)
+    condition_distribution = models.JSONField(default=list)
+    generated_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Analytics {self.date}"
+
+
+class StoredBlob(models.Model):
+    """A content-addressed media file and how many image fields point at it"""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class ImportCheckpoint(models.Model):
+    """Rows of an import_products run committed so far, used to resume it"""
+    name = models.CharField(max_length=255, unique=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.product.title} - Image {self.id}"
\ No newline at end of file
+        return f"{self.name}: {self.rows_done} rows"
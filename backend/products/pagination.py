@@ -0,0 +1,197 @@
+"""
+Pagination for product listings.
+
+``ProductPagination`` keeps the regular ``?page=`` behaviour and adds a
+keyset (cursor) mode, enabled by passing ``?cursor=`` (empty for the first
+page). Cursor pages are fetched with ``WHERE (sort, id) > last seen`` instead
+of ``OFFSET``, so a deep page costs the same as the first one.
+"""
+
+import base64
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def cached_count(queryset):
+    """
+    ``queryset.count()`` memoized in the cache for
+    ``PRODUCT_COUNT_CACHE_TIMEOUT`` seconds, keyed on the generated SQL.
+    """
+    timeout = getattr(settings, 'PRODUCT_COUNT_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return queryset.count()
+
+    key = _count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def _count_key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    return 'product-count:' + hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+
+
+async def acached_count(queryset):
+    """``cached_count`` with the async ORM and cache APIs"""
+    timeout = getattr(settings, 'PRODUCT_COUNT_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return await queryset.acount()
+
+    key = _count_key(queryset)
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, timeout)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """PageNumberPagination that can also paginate with the async ORM"""
+
+    async def acount(self, queryset):
+        return await queryset.acount()
+
+    async def apaginate_queryset(self, queryset, request):
+        """``paginate_queryset`` with the async ORM"""
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.get_page_size(request))
+        paginator.count = await self.acount(queryset)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        return [row async for row in self.page.object_list]
+
+
+class ProductPagination(AsyncPageNumberPagination):
+    django_paginator_class = CachedCountPaginator
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    async def acount(self, queryset):
+        return await acached_count(queryset)
+
+    async def apaginate_queryset(self, queryset, request):
+        """The page-number mode of ``paginate_queryset`` with the async ORM"""
+        self.keyset = False
+        return await super().apaginate_queryset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(self.get_keyset_payload(data))
+
+    # Keyset mode
+
+    def get_sort_key(self, queryset):
+        """Return ``(field, descending)`` for the queryset's active ordering"""
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering or ['-id'])
+        key = ordering[0]
+        if not isinstance(key, str):
+            raise ValueError('Keyset pagination requires string orderings')
+        field = key.lstrip('-')
+        return ('id' if field == 'pk' else field), key.startswith('-')
+
+    def decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(raw.encode()).decode())
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, value, pk):
+        payload = json.dumps([_encode_value(value), pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def paginate_keyset(self, queryset, request):
+        self.page_size = self.get_page_size(request)
+        self.sort_field, descending = self.get_sort_key(queryset)
+        op = 'lt' if descending else 'gt'
+
+        if self.sort_field == 'id':
+            queryset = queryset.order_by('-id' if descending else 'id')
+        else:
+            prefix = '-' if descending else ''
+            queryset = queryset.order_by(prefix + self.sort_field, prefix + 'id')
+
+        self.total_queryset = queryset
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            if self.sort_field == 'id':
+                queryset = queryset.filter(**{f'id__{op}': pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.sort_field}__{op}': value}) |
+                    Q(**{self.sort_field: value, f'id__{op}': pk})
+                )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last_row = rows[-1] if rows else None
+        return rows
+
+    def get_next_link(self):
+        if self.keyset:
+            if not self.has_next:
+                return None
+            row = self.last_row
+            if isinstance(row, dict):  # values() rows, see products.fast_serializers
+                cursor = self.encode_cursor(row[self.sort_field], row['id'])
+            else:
+                cursor = self.encode_cursor(getattr(row, self.sort_field), row.pk)
+            return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+        return super().get_next_link()
+
+    def get_keyset_payload(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'page_size': self.page_size,
+            'results': data,
+        }
+        if self.request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            payload['count'] = cached_count(self.total_queryset)
+        return payload
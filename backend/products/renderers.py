@@ -0,0 +1,37 @@
+"""
+``FastJSONRenderer`` renders the same bytes as DRF's ``JSONRenderer`` using
+orjson when it is installed. Types orjson does not handle itself (Decimal,
+datetimes, lazy strings, ...) go through DRF's encoder, and anything orjson
+refuses (e.g. integers over 64 bits) falls back to the stock renderer.
+Floats below 1e-4 or from 1e16 up are written in orjson's exponent notation
+(``1e-5`` rather than ``1e-05``).
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping of the JavaScript line terminators as JSONRenderer
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
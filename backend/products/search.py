@@ -0,0 +1,148 @@
+"""
+Full-text search over products.
+
+SQLite uses an FTS5 virtual table (porter stemming, prefix indexes) and
+PostgreSQL uses a tsvector side table with a GIN index. Both live in
+``products_product_fts`` and are kept in sync by the signal handlers in
+``products.signals``. Other database vendors fall back to ``icontains``.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+FTS_TABLE = 'products_product_fts'
+
+# Column weights used for ranking: title, description, category name
+SQLITE_WEIGHTS = (10.0, 1.0, 5.0)
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_terms(query):
+    """Split a raw search string into safe, lowercase search terms"""
+    return TERM_RE.findall((query or '').lower())
+
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _match_expression(terms):
+    """Build a vendor specific query where every term is prefix matched"""
+    if connection.vendor == 'postgresql':
+        return ' & '.join(f'{term}:*' for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_queryset(queryset, query, rank=False):
+    """
+    Restrict ``queryset`` to products matching ``query``.
+
+    When ``rank`` is true the queryset is annotated with ``search_rank``,
+    where a higher value means a better match on every backend.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return queryset
+
+    if not is_supported():
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) |
+                Q(description__icontains=term) |
+                Q(category__name__icontains=term)
+            )
+        return queryset
+
+    match = _match_expression(terms)
+    if connection.vendor == 'postgresql':
+        match_sql = f"SELECT product_id FROM {FTS_TABLE} WHERE document @@ to_tsquery('english', %s)"
+        rank_sql = (
+            f"SELECT ts_rank_cd(document, to_tsquery('english', %s)) FROM {FTS_TABLE} "
+            f"WHERE product_id = products_product.id"
+        )
+    else:
+        match_sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        rank_sql = (
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = products_product.id'
+        )
+
+    queryset = queryset.filter(id__in=RawSQL(match_sql, [match]))
+    if rank:
+        queryset = queryset.annotate(search_rank=RawSQL(rank_sql, [match]))
+    return queryset
+
+
+def index_product(product):
+    """Insert or refresh the search document for a single product"""
+    index_products([product])
+
+
+def index_products(products):
+    """Insert or refresh the search documents for several products at once"""
+    if not is_supported() or not products:
+        return
+    rows = [
+        (product.pk, product.title, product.description, product.category.name if product.category_id else '')
+        for product in products
+    ]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (product_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('english', %s), 'A') || "
+                f"setweight(to_tsvector('english', %s), 'B') || "
+                f"setweight(to_tsvector('english', %s), 'C')) "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                rows
+            )
+        else:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, category_name) VALUES (%s, %s, %s, %s)',
+                rows
+            )
+
+
+def remove_product(product_id):
+    """Drop a product from the search index"""
+    if not is_supported():
+        return
+    column = 'product_id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE {column} = %s', [product_id])
+
+
+def clear_index():
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+
+def rebuild_index(products):
+    """Re-index every product in ``products``, returns the number indexed"""
+    count = 0
+    batch = []
+    for product in products.select_related('category').iterator(chunk_size=500):
+        batch.append(product)
+        if len(batch) == 500:
+            index_products(batch)
+            count += len(batch)
+            batch = []
+    index_products(batch)
+    return count + len(batch)
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """SearchFilter that uses the full-text index instead of ``icontains``"""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        return search_queryset(queryset, query)
@@ -1,25 +1,26 @@
 from rest_framework import serializers
-from .models import Product, Category, ProductImage
+from .models import ArchivedProduct, Product, Category, ProductImage
+from .images import variant_urls
 from django.contrib.auth.models import User
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    product_count = serializers.SerializerMethodField()
-    
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'icon', 'is_active', 'product_count', 'created_at']
-        read_only_fields = ['id', 'created_at']
-    
-    def get_product_count(self, obj):
-        return obj.products.filter(is_available=True).count()
+        read_only_fields = ['id', 'product_count', 'created_at']
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+    
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_primary', 'created_at']
+        fields = ['id', 'image', 'variants', 'alt_text', 'is_primary', 'created_at']
         read_only_fields = ['id', 'created_at']
+    
+    def get_variants(self, obj):
+        return variant_urls(obj.variants, self.context.get('request'))
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -85,7 +86,9 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
         if images_data:
             # Clear existing images
             instance.images.all().delete()
-            # Add new images
+            # Add new images, keeping exactly one primary
+            if not any(image_data.get('is_primary') for image_data in images_data):
+                images_data[0]['is_primary'] = True
             for image_data in images_data:
                 ProductImage.objects.create(product=instance, **image_data)
         
@@ -97,6 +100,7 @@ class ProductListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     category_slug = serializers.CharField(source='category.slug', read_only=True)
     discount_percentage = serializers.ReadOnlyField()
+    image_variants = serializers.SerializerMethodField()
     primary_image = serializers.SerializerMethodField()
     
     class Meta:
@@ -104,12 +108,51 @@ class ProductListSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'description', 'category', 'category_name', 'category_slug',
             'condition', 'price', 'original_price', 'discount_percentage', 'image',
-            'primary_image', 'owner_username', 'location', 'is_available',
+            'image_variants', 'primary_image', 'owner_username', 'location', 'is_available',
             'is_featured', 'view_count', 'created_at'
         ]
     
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image_variants, self.context.get('request'))
+    
     def get_primary_image(self, obj):
-        primary_img = obj.images.filter(is_primary=True).first()
+        # Iterate images.all() so the views' prefetch_related('images') is used
+        primary_img = next((img for img in obj.images.all() if img.is_primary), None)
         if primary_img:
             return ProductImageSerializer(primary_img).data
         return None
+
+
+class ProductImportSerializer(ProductCreateSerializer):
+    """Validates import_products rows; categories are resolved from a cached lookup"""
+    images = None
+    category = serializers.CharField()
+    
+    class Meta(ProductCreateSerializer.Meta):
+        fields = [
+            'title', 'description', 'category', 'condition', 'price', 'original_price',
+            'location', 'is_available', 'is_featured'
+        ]
+    
+    def validate_category(self, value):
+        category = self.context['categories'].get(value.strip().lower())
+        if category is None:
+            raise serializers.ValidationError(f'Unknown category "{value}"')
+        return category
+
+
+class ArchivedProductSerializer(serializers.ModelSerializer):
+    """Owner's view of an archived listing, restored by toggle-availability"""
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    price = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedProduct
+        fields = ['id', 'title', 'category', 'category_name', 'price', 'image_variants', 'updated_at', 'archived_at']
+
+    def get_price(self, obj):
+        return obj.fields.get('price')
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image_variants, self.context.get('request'))
@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import Product, Category, ProductImage
+from . import autocomplete, duplicates, geo, search, storage
+from .images import schedule_variants
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the full-text index in sync with product edits"""
+    if raw:
+        return
+    if update_fields and not {'title', 'description', 'category'} & set(update_fields):
+        return
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+def adjust_category_count(category_id, delta):
+    if delta:
+        Category.objects.filter(pk=category_id).update(
+            product_count=Greatest(F('product_count') + delta, 0)
+        )
+
+
+@receiver(post_save, sender=Product)
+def update_category_counts(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Keep Category.product_count in step with available products"""
+    if raw:
+        return
+    if update_fields and not {'category', 'is_available'} & set(update_fields):
+        return
+
+    if created:
+        previous = (None, False)
+    else:
+        previous = getattr(instance, '_counter_state', None)
+        if previous is None:
+            # Stored state unknown (deferred fields), counters are reconciled by
+            # reconcile_category_counts
+            previous = (instance.category_id, instance.is_available)
+    current = (instance.category_id, instance.is_available)
+    instance._counter_state = current
+
+    if previous == current:
+        return
+    if previous[1]:
+        adjust_category_count(previous[0], -1)
+    if current[1]:
+        adjust_category_count(current[0], 1)
+
+
+@receiver(post_delete, sender=Product)
+def decrement_category_count(sender, instance, **kwargs):
+    state = getattr(instance, '_counter_state', (instance.category_id, instance.is_available))
+    if state[1]:
+        adjust_category_count(state[0], -1)
+
+
+@receiver(post_save, sender=Product)
+def update_autocomplete(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Keep this worker's autocomplete index in step with titles and availability"""
+    if raw or (update_fields and not {'title', 'is_available'} & set(update_fields)):
+        return
+    previous = None if created else getattr(instance, '_autocomplete_state', None)
+    current = (instance.title, instance.is_available)
+    instance._autocomplete_state = current
+    autocomplete.product_changed(previous, current)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_autocomplete(sender, instance, **kwargs):
+    autocomplete.product_changed(getattr(instance, '_autocomplete_state', None), None)
+
+
+@receiver(pre_save, sender=Product)
+def geocode_location(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Store coordinates of the location for "near me" search"""
+    if raw or (update_fields and 'location' not in update_fields):
+        return
+    geo.geocode(instance)
+    if update_fields and 'geohash' not in update_fields:
+        Product.objects.filter(pk=instance.pk).update(
+            latitude=instance.latitude, longitude=instance.longitude, geohash=instance.geohash
+        )
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_name(sender, instance, raw=False, **kwargs):
+    instance._previous_name = None
+    if not raw and instance.pk:
+        instance._previous_name = Category.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def reindex_renamed_category(sender, instance, created, raw=False, **kwargs):
+    """Category names are part of the search document"""
+    if raw or created or getattr(instance, '_previous_name', None) in (None, instance.name):
+        return
+    search.rebuild_index(instance.products.all())
+
+
+@receiver(post_save, sender=Category)
+def update_category_autocomplete(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.category_changed(getattr(instance, '_previous_name', None), instance)
+
+
+@receiver(post_delete, sender=Category)
+def remove_category_from_autocomplete(sender, instance, **kwargs):
+    autocomplete.category_changed(instance.name, None)
+
+
+@receiver(post_save, sender=Product)
+def handle_product_image_change(sender, instance, raw=False, **kwargs):
+    """Count blob references and render resized copies of a new or replaced image"""
+    previous = getattr(instance, '_loaded_image', None)
+    if raw or instance.image.name == previous:
+        return
+    instance._loaded_image = instance.image.name
+    storage.swap_reference(previous, instance.image.name)
+    if instance.image_variants:
+        storage.swap_variant_references(instance.image_variants, None)
+        instance.image_variants = {}
+        Product.objects.filter(pk=instance.pk).update(image_variants={})
+    if instance.image:
+        instance._fingerprint = duplicates.fingerprint(instance.pk, None, instance.image.name)
+        transaction.on_commit(lambda: schedule_variants(instance, 'image', 'image_variants'))
+    else:
+        duplicates.remove_fingerprint(instance.pk, None)
+
+
+@receiver(post_save, sender=ProductImage)
+def handle_gallery_image_change(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_loaded_image', None)
+    if raw or instance.image.name == previous:
+        return
+    instance._loaded_image = instance.image.name
+    storage.swap_reference(previous, instance.image.name)
+    if instance.image:
+        # Hashed now so upload_product_images can report likely duplicates
+        instance._fingerprint = duplicates.fingerprint(instance.product_id, instance.pk, instance.image.name)
+        transaction.on_commit(lambda: schedule_variants(instance, 'image', 'variants'))
+
+
+@receiver(post_delete, sender=Product)
+def release_product_image(sender, instance, **kwargs):
+    storage.release_reference(instance.image.name)
+    storage.swap_variant_references(instance.image_variants, None)
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_gallery_image(sender, instance, **kwargs):
+    storage.release_reference(instance.image.name)
+    storage.swap_variant_references(instance.variants, None)
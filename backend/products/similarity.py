@@ -0,0 +1,191 @@
+"""
+"Similar items" from precomputed TF-IDF neighbours.
+
+``compute_similar`` (run through ``manage.py compute_similar_products``)
+vectorizes the title and description of every available product per category
+into a sparse TF-IDF matrix (sublinear term frequency, title terms counted
+twice, rows L2-normalized) and stores the ``SIMILAR_PRODUCTS_TOP_K`` highest
+cosine similarities of each product in ``SimilarProduct``, and stamps
+``Product.similar_computed_at`` even when it found none. The endpoint then
+only reads one product's rows by the (product, rank) index.
+
+Incremental runs only vectorize against products that are new or edited
+since their neighbours were computed, and merge them into the stored lists
+of the existing products. Those stored scores were weighted with the IDF of
+the catalog at the time, so after enough incremental runs the lists mix
+scores from several IDF generations; schedule a ``--full`` run (e.g.
+nightly) to recompute every list against one. NumPy and SciPy are only
+imported by the batch job.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Product, SimilarProduct
+
+CHUNK_SIZE = 1000
+MIN_SCORE = 0.05
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or that the this to was were '
+    'will with not no in out up very can all any new used'.split()
+)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def tokenize(text):
+    return [word for word in re.findall(r'[a-z0-9]+', text.lower()) if len(word) > 1 and word not in STOP_WORDS]
+
+
+def vectorize(documents):
+    """L2-normalized TF-IDF CSR matrix for a list of (title, description)"""
+    import numpy as np
+    from scipy import sparse
+
+    vocabulary, rows, columns, values = {}, [], [], []
+    for row, (title, description) in enumerate(documents):
+        counts = Counter(tokenize(title) * 2 + tokenize(description))
+        for term, count in counts.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            values.append(1 + math.log(count))
+    count = len(documents)
+    matrix = sparse.csr_matrix((values, (rows, columns)), shape=(count, max(len(vocabulary), 1)), dtype=np.float32)
+
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    # Smoothed, so a term shared by every listing of the category (e.g.
+    # "chair" among chairs) still counts, just less than rarer ones
+    idf = np.log((1 + count) / (1 + document_frequency)) + 1
+    matrix = (matrix @ sparse.diags(idf.astype(np.float32))).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return (sparse.diags(1 / norms) @ matrix).tocsr()
+
+
+def top_neighbours(similarities, row_ids, column_ids, top_k):
+    """{row product id: [(score, column product id), ...]} from a sparse similarity block"""
+    import numpy as np
+
+    similarities = similarities.tocsr()
+    result = {}
+    for row, product_id in enumerate(row_ids):
+        start, end = similarities.indptr[row], similarities.indptr[row + 1]
+        columns = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        keep = (scores >= MIN_SCORE) & (column_ids[columns] != product_id)
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        result[product_id] = [(float(scores[i]), int(column_ids[columns[i]])) for i in order]
+    return result
+
+
+def _entries(neighbours, now):
+    return [
+        SimilarProduct(product_id=product_id, similar_id=similar_id, rank=rank, score=score, computed_at=now)
+        for product_id, items in neighbours.items()
+        for rank, (score, similar_id) in enumerate(items, start=1)
+    ]
+
+
+def stale_product_ids(queryset):
+    """Products never computed or edited since they were computed"""
+    return set(
+        queryset.filter(
+            Q(similar_computed_at__isnull=True) | Q(updated_at__gt=F('similar_computed_at'))
+        ).values_list('pk', flat=True)
+    )
+
+
+def lists_to_update(candidates, targets, top_k):
+    """Stored lists that are short, beaten by a candidate or refer to a changed product"""
+    stored = SimilarProduct.objects.filter(product_id__in=list(candidates)).values('product_id').annotate(
+        kept=Count('id', filter=~Q(similar_id__in=targets)),
+        floor=Min('score', filter=~Q(similar_id__in=targets)),
+        changed=Count('id', filter=Q(similar_id__in=targets)),
+    )
+    lists = {row['product_id']: row for row in stored}
+    return [
+        product_id for product_id, items in candidates.items()
+        if product_id not in lists
+        or lists[product_id]['changed']
+        or lists[product_id]['kept'] < top_k
+        or items[0][0] > lists[product_id]['floor']
+    ]
+
+
+def compute_category(category_id, full=False, now=None):
+    """Refresh neighbours within one category, returns the number of products updated"""
+    import numpy as np
+
+    now = now or timezone.now()
+    top_k = _setting('SIMILAR_PRODUCTS_TOP_K', 20)
+    available = Product.objects.filter(is_available=True, category_id=category_id)
+    targets = None if full else stale_product_ids(available)
+    if targets is not None and not targets:
+        return 0
+
+    rows = list(available.order_by('pk').values_list('pk', 'title', 'description'))
+    if not rows:
+        SimilarProduct.objects.filter(product__category_id=category_id).delete()
+        return 0
+    product_ids = np.array([row[0] for row in rows])
+    matrix = vectorize([(title, description) for _, title, description in rows])
+
+    neighbours = {}
+    target_rows = np.arange(len(rows)) if full else np.flatnonzero(np.isin(product_ids, list(targets)))
+    for start in range(0, len(target_rows), CHUNK_SIZE):
+        chunk = target_rows[start:start + CHUNK_SIZE]
+        neighbours.update(top_neighbours(matrix[chunk] @ matrix.T, product_ids[chunk], product_ids, top_k))
+
+    if not full:
+        # Existing products may now have one of the new listings among their neighbours
+        candidates = top_neighbours(matrix @ matrix[target_rows].T, product_ids, product_ids[target_rows], top_k)
+        candidates = {pid: items for pid, items in candidates.items() if items and pid not in neighbours}
+        affected = lists_to_update(candidates, targets, top_k)
+        stored = defaultdict(list)
+        for product_id, similar_id, score in SimilarProduct.objects.filter(product_id__in=affected).exclude(
+            similar_id__in=targets
+        ).values_list('product_id', 'similar_id', 'score'):
+            stored[product_id].append((score, similar_id))
+        for product_id in affected:
+            merged = sorted(stored[product_id] + candidates[product_id], key=lambda item: -item[0])
+            neighbours[product_id] = merged[:top_k]
+
+    with transaction.atomic():
+        if full:
+            SimilarProduct.objects.filter(product__category_id=category_id).delete()
+        else:
+            SimilarProduct.objects.filter(product_id__in=list(neighbours)).delete()
+        SimilarProduct.objects.bulk_create(_entries(neighbours, now), batch_size=1000)
+        # Also marks the products that have no neighbours as computed
+        Product.objects.filter(pk__in=list(neighbours)).update(similar_computed_at=now)
+    return len(neighbours)
+
+
+def compute_similar(full=False, category_ids=None):
+    """Refresh neighbours in every category that has available products"""
+    now = timezone.now()
+    if category_ids is None:
+        category_ids = Product.objects.filter(is_available=True).order_by().values_list('category_id', flat=True).distinct()
+    updated = {category_id: compute_category(category_id, full=full, now=now) for category_id in category_ids}
+    if full:
+        # Neighbour lists of products that are no longer available
+        SimilarProduct.objects.filter(product__is_available=False).delete()
+    return updated
+
+
+def similar_queryset(queryset, product_id):
+    """``queryset`` restricted to the stored neighbours of ``product_id``, best first"""
+    return queryset.filter(similar_to__product_id=product_id).order_by('similar_to__rank')
@@ -0,0 +1,107 @@
+"""
+Content-addressed media storage.
+
+``ContentAddressedStorage`` hashes every file while reading it and stores it
+once under ``blobs/<aa>/<bb>/<sha256><ext>``, whatever name it was uploaded
+with. Saving the same bytes again writes nothing and returns the existing
+name, so relisted photos share one file. Blob names never change content, so
+``MEDIA_URL + 'blobs/'`` can be served with ``Cache-Control: immutable``.
+
+Image fields pointing at blobs are counted in ``StoredBlob.ref_count`` by the
+handlers in ``products.signals``; ``manage.py dedupe_media --purge`` removes
+blobs nothing has referred to or uploaded for its grace period. Every upload
+and reference change stamps ``StoredBlob.updated_at`` for that purpose.
+"""
+
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_DIR = 'blobs'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+
+def blob_name(digest, original_name):
+    extension = os.path.splitext(original_name)[1].lower()
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def hash_content(self, content):
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            digest.update(chunk)
+            size += len(chunk)
+        return digest.hexdigest(), size
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content hash in _save(), only a racing
+        # write of the same blob needs a temporary alternative name
+        if is_blob(name):
+            return super().get_available_name(name, max_length)
+        return name
+
+    def _save(self, name, content):
+        digest, size = self.hash_content(content)
+        target = blob_name(digest, name)
+        # Registered before checking for the file: a concurrent purge has then
+        # either removed the file already or sees the blob as recently used
+        register_blob(target, digest, size)
+        if not self.exists(target):
+            content.seek(0)
+            saved = super()._save(target, content)
+            if saved != target:
+                # Another worker stored the same blob concurrently
+                self.delete(saved)
+        return target
+
+
+def register_blob(name, digest, size):
+    from .models import StoredBlob
+    if not StoredBlob.objects.filter(name=name).update(updated_at=timezone.now()):
+        StoredBlob.objects.get_or_create(name=name, defaults={'sha256': digest, 'size': size})
+
+
+def add_reference(name):
+    if is_blob(name):
+        from .models import StoredBlob
+        StoredBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release_reference(name):
+    if is_blob(name):
+        from .models import StoredBlob
+        StoredBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+def swap_reference(old_name, new_name):
+    if old_name != new_name:
+        release_reference(old_name)
+        add_reference(new_name)
+
+
+def variant_names(variants):
+    """Every stored file name in an image variants dict (see products.images)"""
+    return [
+        entry[key]
+        for entry in (variants or {}).values()
+        for key in ('webp', 'jpeg')
+        if entry.get(key)
+    ]
+
+
+def swap_variant_references(old_variants, new_variants):
+    for name in variant_names(old_variants):
+        release_reference(name)
+    for name in variant_names(new_variants):
+        add_reference(name)
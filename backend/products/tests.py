@@ -1,3 +1,1349 @@
-from django.test import TestCase
+import importlib.util
+import itertools
+import json
+import math
+import os
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from accounts import authentication
+from accounts.tokens import RefreshToken
+from ecofinds_backend.instrumentation import QueryBudgetExceeded
+
+from .fast_serializers import aserialize_product_rows, product_rows, serialize_product_rows
+from . import analytics, autocomplete, images, storage, throttling, trending, urls, view_counts, views
+from .models import (
+    AnalyticsSnapshot, ArchivedProduct, Category, ImageFingerprint, Product, ProductImage, SimilarProduct, StoredBlob
+)
+from .facets import facet_counts, parse_facets
+from . import duplicates, geo
+from .renderers import FastJSONRenderer
+from .search import search_queryset
+from .serializers import ProductListSerializer
+from .similarity import compute_category, compute_similar, stale_product_ids
+from .throttling import CatalogDetailThrottle, CatalogThrottle
+
+# The throttle store is a file shared with any server running on this host
+NO_THROTTLES = override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}})
+
+
+def image_bytes(color='red', size=(32, 32), format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format)
+    return buffer.getvalue()
+
+
+def temporary_media(test):
+    """Store files in a directory removed after ``test``"""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    media = override_settings(MEDIA_ROOT=directory.name)
+    media.enable()
+    test.addCleanup(media.disable)
+
+
+@NO_THROTTLES
+class CatalogTestCase(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('seller')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.furniture = Category.objects.create(name='Furniture', slug='furniture')
+        cls.products = [
+            cls.make_product(f'Oak chair {number}', cls.furniture, price=10 + number, is_featured=number % 2 == 0)
+            for number in range(6)
+        ] + [
+            cls.make_product(f'Paperback novel {number}', cls.books, price=5 + number)
+            for number in range(6)
+        ]
+
+    def tearDown(self):
+        # Views buffered by detail requests would be flushed to the real database at exit
+        view_counts.discard()
+        # Listing counts are cached by their SQL, the same in every test
+        cache.clear()
+        super().tearDown()
+
+    @classmethod
+    def make_product(cls, title, category, price=10, **fields):
+        return Product.objects.create(
+            title=title,
+            description=f'A second hand {title.lower()}',
+            category=category,
+            price=Decimal(price),
+            owner=cls.owner,
+            **fields,
+        )
+
+
+@override_settings(REQUEST_TIMING=True, QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTests(CatalogTestCase):
+    """Over budget requests raise QueryBudgetExceeded, so N+1 regressions fail here"""
+
+    def test_product_list(self):
+        response = self.client.get(reverse('product-list-create'), {'page_size': 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 12)
+
+    def test_product_list_filtered(self):
+        response = self.client.get(reverse('product-list-create'), {'category': self.books.pk, 'ordering': 'price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 6)
+
+    def test_product_detail(self):
+        response = self.client.get(reverse('product-detail', args=[self.products[0].pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Oak chair 0')
+
+    def test_search(self):
+        response = self.client.get(reverse('search-products'), {'q': 'chair', 'facets': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 6)
+
+    def test_featured(self):
+        response = self.client.get(reverse('featured-products'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+
+    def test_trending(self):
+        response = self.client.get(reverse('trending-products'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 10)
+
+    def test_categories(self):
+        response = self.client.get(reverse('product-categories'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+    @override_settings(ANALYTICS_CACHE_TIMEOUT=0)
+    def test_analytics(self):
+        analytics.take_snapshot()
+        response = self.client.get(reverse('product-analytics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_products'], 12)
+
+    def test_over_budget_raises(self):
+        with override_settings(QUERY_COUNT_BUDGETS={'product-list-create': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('product-list-create'))
+
+
+class InlineThread:
+    """threading.Thread stand-in running its target on start()"""
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@override_settings(ANALYTICS_SNAPSHOT_MAX_AGE=60, ANALYTICS_CACHE_TIMEOUT=30)
+class AnalyticsTests(CatalogTestCase):
+    def setUp(self):
+        cache.delete(analytics.CACHE_KEY)
+        self.addCleanup(cache.delete, analytics.CACHE_KEY)
+
+    def test_first_request_takes_a_snapshot(self):
+        response = self.client.get(reverse('product-analytics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_products'], 12)
+        self.assertEqual(len(response.data['recent_products']), 5)
+        self.assertEqual(AnalyticsSnapshot.objects.count(), 1)
+
+    def test_cached_response_makes_no_query(self):
+        analytics.take_snapshot()
+        with self.assertNumQueries(3):
+            self.client.get(reverse('product-analytics'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product-analytics'))
+        self.assertEqual(response.data['total_products'], 12)
+
+    @override_settings(ANALYTICS_CACHE_TIMEOUT=0)
+    def test_stale_snapshot_refreshed_in_background(self):
+        stale = analytics.take_snapshot(now=timezone.now() - timedelta(minutes=5))
+        self.make_product('Oak table', self.furniture)
+
+        # The test transaction must survive the refresh thread's connection cleanup
+        with mock.patch.object(analytics.threading, 'Thread', InlineThread), \
+                mock.patch.object(analytics, 'close_old_connections'), \
+                mock.patch.object(analytics, 'connections'):
+            response = self.client.get(reverse('product-analytics'))
+        self.assertEqual(response.data['total_products'], 12)
+        self.assertGreaterEqual(response.data['snapshot_age_seconds'], 300)
+        self.assertFalse(analytics._refreshing.is_set())
+
+        refreshed = AnalyticsSnapshot.objects.get()
+        self.assertEqual(refreshed.total_products, 13)
+        self.assertGreater(refreshed.generated_at, stale.generated_at)
+
+    @override_settings(ANALYTICS_CACHE_TIMEOUT=0)
+    def test_fresh_snapshot_not_refreshed(self):
+        analytics.take_snapshot()
+        with mock.patch.object(analytics.threading, 'Thread') as thread:
+            self.client.get(reverse('product-analytics'))
+        thread.assert_not_called()
+
+
+class TrendingTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for views_count, product in enumerate(cls.products):
+            Product.objects.filter(pk=product.pk).update(view_count=views_count)
+
+    def trending_ids(self, **params):
+        response = self.client.get(reverse('trending-products'), params)
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']]
+
+    def test_by_views_before_any_ranking(self):
+        by_views = [product.pk for product in reversed(self.products)]
+        self.assertEqual(self.trending_ids(), by_views[:10])
+        self.assertEqual(self.trending_ids(category='books'), by_views[:6])
+
+    def test_unranked_category_falls_back_to_its_views(self):
+        chairs = self.products[:6]
+        trending.record_hits({chairs[0].pk: 1, chairs[1].pk: 5})
+        trending.compute_trending()
+
+        self.assertEqual(self.trending_ids(), [chairs[1].pk, chairs[0].pk])
+        self.assertEqual(self.trending_ids(category='furniture'), [chairs[1].pk, chairs[0].pk])
+        books = [product.pk for product in reversed(self.products[6:])]
+        self.assertEqual(self.trending_ids(category='books'), books)
+        self.assertEqual(self.trending_ids(category='no-such-category'), [])
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=60)
+class ViewCountTests(CatalogTestCase):
+    def test_flushed_once_due(self):
+        product = self.products[0]
+        view_counts.flush()
+        view_counts.record_view(product.pk)
+        view_counts.record_view(product.pk)
+        self.assertEqual(view_counts._flush_if_due(), 0)
+        self.assertEqual(Product.objects.get(pk=product.pk).view_count, 0)
+
+        # An idle worker's thread writes the hits once the interval has passed
+        view_counts._last_flush -= 60
+        self.assertEqual(view_counts._flush_if_due(), 2)
+        self.assertEqual(Product.objects.get(pk=product.pk).view_count, 2)
+        self.assertEqual(view_counts.pending_views(product.pk), 0)
+
+    def test_flusher_restarted_after_fork(self):
+        self.addCleanup(setattr, view_counts, '_flusher', None)
+        self.addCleanup(setattr, view_counts, '_flusher_enabled', False)
+        with mock.patch.object(view_counts.threading, 'Thread') as thread:
+            view_counts.start_flusher()
+            thread.assert_called_once_with(target=view_counts._flush_periodically, name='view-count-flush', daemon=True)
+
+            thread.return_value.is_alive.return_value = False
+            view_counts.record_view(self.products[0].pk)
+        self.assertEqual(thread.return_value.start.call_count, 2)
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def walk(self, params):
+        """Ids of every page followed through the ``next`` links"""
+        ids = []
+        response = self.client.get(reverse('product-list-create'), {'cursor': '', 'page_size': 5, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids += [product['id'] for product in response.data['results']]
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_walks_every_product_once_in_order(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(self.walk({}), expected)
+
+    def test_ties_are_broken_by_id(self):
+        # 'Oak chair 0' and 'Paperback novel 5' both cost 10
+        expected = list(Product.objects.order_by('price', 'id').values_list('pk', flat=True))
+        self.assertEqual(self.walk({'ordering': 'price'}), expected)
+        expected = list(Product.objects.order_by('-price', '-id').values_list('pk', flat=True))
+        self.assertEqual(self.walk({'ordering': '-price'}), expected)
+
+    def test_filters_apply_to_every_page(self):
+        ids = self.walk({'category': self.books.pk})
+        self.assertEqual(set(ids), {product.pk for product in self.products if product.category == self.books})
+        self.assertEqual(len(ids), 6)
+
+    def test_count_on_request(self):
+        response = self.client.get(reverse('product-list-create'), {'cursor': '', 'page_size': 5, 'with_count': '1'})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('product-list-create'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CategoryCountTests(CatalogTestCase):
+    def assertCounts(self, books, furniture):
+        self.assertEqual(
+            dict(Category.objects.values_list('slug', 'product_count')),
+            {'books': books, 'furniture': furniture},
+        )
+
+    def test_created_products_are_counted(self):
+        self.assertCounts(6, 6)
+        self.make_product('Hidden novel', self.books, is_available=False)
+        self.assertCounts(6, 6)
+
+    def test_availability_toggles(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.is_available = False
+        product.save()
+        self.assertCounts(6, 5)
+        product.save()  # unchanged state is not counted twice
+        self.assertCounts(6, 5)
+        product.is_available = True
+        product.save(update_fields=['is_available'])
+        self.assertCounts(6, 6)
+
+    def test_category_change(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.category = self.books
+        product.save()
+        self.assertCounts(7, 5)
+
+    def test_unrelated_update_fields_are_skipped(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.title = 'Walnut chair'
+        product.save(update_fields=['title'])
+        self.assertCounts(6, 6)
+
+    def test_delete(self):
+        Product.objects.get(pk=self.products[0].pk).delete()
+        self.assertCounts(6, 5)
+        product = Product.objects.get(pk=self.products[6].pk)
+        product.is_available = False
+        product.save()
+        product.delete()
+        self.assertCounts(5, 5)
+
+    def test_category_save_keeps_count(self):
+        category = Category.objects.get(pk=self.books.pk)
+        self.make_product('New novel', self.books)
+        category.description = 'Used books'
+        category.save()
+        self.assertCounts(7, 6)
+
+    def test_reconcile(self):
+        Product.objects.filter(category=self.books).update(is_available=False)
+        self.assertCounts(6, 6)
+        call_command('reconcile_category_counts', stdout=StringIO())
+        self.assertCounts(0, 6)
+
+
+class ImportProductsTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, path, *args):
+        errors = os.path.join(self.directory, 'errors.jsonl')
+        call_command('import_products', path, '--owner', 'seller', '--errors', errors, *args, stdout=StringIO())
+        with open(errors, encoding='utf-8') as handle:
+            return [json.loads(line) for line in handle]
+
+    def row(self, title, **fields):
+        return json.dumps({'title': title, 'description': 'Imported', 'category': 'books', 'price': '4.50', **fields})
+
+    def test_jsonl_rows_and_errors(self):
+        path = self.write('products.jsonl', [
+            self.row('Imported novel'),
+            '{"title": "Truncated',
+            '["not", "an", "object"]',
+            '',
+            self.row('Unknown category', category='toys'),
+            self.row('Unknown owner', owner='nobody'),
+            self.row('Imported atlas', category='Books'),
+        ])
+        errors = self.run_import(path)
+
+        self.assertEqual(
+            list(Product.objects.filter(title__startswith='Imported').order_by('title').values_list('title', flat=True)),
+            ['Imported atlas', 'Imported novel'],
+        )
+        self.assertEqual([error['row'] for error in errors], [2, 3, 5, 6])
+        self.assertTrue(errors[0]['errors']['non_field_errors'][0].startswith('Invalid JSON'))
+        self.assertEqual(errors[0]['data'], '{"title": "Truncated')
+        self.assertEqual(errors[1]['errors'], {'non_field_errors': ['Expected a JSON object, got list']})
+        self.assertIn('category', errors[2]['errors'])
+        self.assertIn('owner', errors[3]['errors'])
+        self.assertEqual(Category.objects.get(pk=self.books.pk).product_count, 8)
+        # bulk_create skips the signals, the import indexes the rows itself
+        self.assertEqual(search_queryset(Product.objects.all(), 'atlas').count(), 1)
+
+    def test_csv(self):
+        path = self.write('products.csv', [
+            'title,description,category,price,condition',
+            'Imported lamp,Brass,furniture,12.00,good',
+            'Broken lamp,Brass,furniture,-1,good',
+        ])
+        errors = self.run_import(path)
+        self.assertTrue(Product.objects.filter(title='Imported lamp', owner=self.owner).exists())
+        self.assertEqual([error['row'] for error in errors], [2])
+        self.assertIn('price', errors[0]['errors'])
+
+    def test_resume_skips_committed_rows(self):
+        path = self.write('products.jsonl', [self.row(f'Imported novel {number}') for number in range(5)])
+        self.run_import(path, '--batch-size', '2')
+        self.run_import(path, '--resume')
+        self.assertEqual(Product.objects.filter(title__startswith='Imported').count(), 5)
+
+    def test_unknown_default_owner(self):
+        path = self.write('products.jsonl', [self.row('Imported novel')])
+        with self.assertRaises(CommandError):
+            call_command('import_products', path, '--owner', 'nobody', stdout=StringIO())
+
+
+class StatelessReadTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user('other seller')
+        Product.objects.filter(pk=cls.products[0].pk).update(owner=cls.other)
+        ArchivedProduct.objects.create(
+            id=10_000, owner=cls.owner, category=cls.books, title='Old atlas', updated_at=timezone.now()
+        )
+        ArchivedProduct.objects.create(
+            id=10_001, owner=cls.other, category=cls.books, title='Old map', updated_at=timezone.now()
+        )
+
+    def setUp(self):
+        super().setUp()
+        authentication.clear_user_cache()
+        self.addCleanup(authentication.clear_user_cache)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.owner).access_token}')
+
+    def get(self, name):
+        """Response to ``name`` and whether the user was loaded for it"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response, any('FROM "auth_user" WHERE' in query['sql'] for query in queries)
+
+    @override_settings(AUTH_STATELESS_READS=True)
+    def test_reads_use_the_token(self):
+        response, loaded_user = self.get('user-products')
+        self.assertFalse(loaded_user)
+        self.assertEqual(response.data['count'], 11)
+        self.assertNotIn(self.products[0].pk, [product['id'] for product in response.data['results']])
+
+        response, loaded_user = self.get('archived-products')
+        self.assertFalse(loaded_user)
+        self.assertEqual([product['title'] for product in response.data['results']], ['Old atlas'])
+
+    @override_settings(AUTH_STATELESS_READS=False)
+    def test_reads_load_the_user_when_disabled(self):
+        response, loaded_user = self.get('user-products')
+        self.assertTrue(loaded_user)
+        self.assertEqual(response.data['count'], 11)
+
+    @override_settings(AUTH_STATELESS_READS=True)
+    def test_writes_still_load_the_user(self):
+        # Reads trust the token until it expires, writes check the account
+        self.owner.is_active = False
+        self.owner.save()
+        response, _ = self.get('user-products')
+        self.assertEqual(response.data['count'], 11)
+        response = self.client.post(reverse('toggle-product-availability', args=[self.products[1].pk]))
+        self.assertEqual(response.status_code, 401)
+
+
+class ArchiveTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.get(pk=self.products[0].pk)
+        self.product.is_available = False
+        self.product.condition = 'fair'
+        self.product.original_price = Decimal('99.90')
+        self.product.save()
+        self.long_ago = timezone.now() - timedelta(days=settings.PRODUCT_ARCHIVE_AFTER_DAYS + 1)
+        Product.objects.filter(pk=self.product.pk).update(updated_at=self.long_ago)
+
+    def archive(self):
+        call_command('archive_products', stdout=StringIO())
+
+    def toggle(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse('toggle-product-availability', args=[self.product.pk]))
+
+    def test_only_long_unavailable_products_are_archived(self):
+        recent = Product.objects.get(pk=self.products[1].pk)
+        recent.is_available = False
+        recent.save()
+        self.archive()
+        self.assertFalse(Product.objects.filter(pk=self.product.pk).exists())
+        self.assertTrue(Product.objects.filter(pk=recent.pk).exists())
+        self.assertEqual(list(ArchivedProduct.objects.values_list('pk', flat=True)), [self.product.pk])
+        self.assertEqual(Category.objects.get(pk=self.furniture.pk).product_count, 4)
+
+    def test_archived_listing(self):
+        self.archive()
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(reverse('archived-products'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product.pk])
+        self.assertEqual(response.data['results'][0]['price'], '10.00')
+
+    def test_round_trip(self):
+        self.archive()
+        response = self.toggle(self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_available'])
+
+        self.assertFalse(ArchivedProduct.objects.exists())
+        restored = Product.objects.get(pk=self.product.pk)
+        for field in ('title', 'description', 'category_id', 'owner_id', 'condition', 'price', 'original_price', 'created_at'):
+            self.assertEqual(getattr(restored, field), getattr(self.product, field), field)
+        self.assertTrue(restored.is_available)
+        self.assertEqual(Category.objects.get(pk=self.furniture.pk).product_count, 6)
+        self.assertEqual(search_queryset(Product.objects.all(), 'oak chair 0').first(), restored)
+
+    def test_only_the_owner_restores(self):
+        self.archive()
+        response = self.toggle(User.objects.create_user('someone'))
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(ArchivedProduct.objects.filter(pk=self.product.pk).exists())
+
+
+class AsyncParityTests(CatalogTestCase):
+    """products.async_views answer GETs with the same bytes and headers as the DRF views"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        routes = {
+            'product-list-create': (views.ProductListCreateView.as_view(), 'product_list', CatalogThrottle),
+            'product-detail': (views.ProductDetailView.as_view(), 'product_detail', CatalogDetailThrottle),
+            'featured-products': (views.FeaturedProductsView.as_view(), 'featured_products', None),
+            'trending-products': (views.TrendingProductsView.as_view(), 'trending_products', CatalogThrottle),
+            'product-categories': (views.product_categories, 'product_categories', None),
+            'search-products': (views.search_products, 'search_products', CatalogThrottle),
+        }
+        cls.views = {}
+        for url_name, (view, async_name, throttle_class) in routes.items():
+            with override_settings(ASYNC_VIEWS=False):
+                sync_view = urls.read_view(view, async_name, throttle_class)
+            with override_settings(ASYNC_VIEWS=True):
+                async_view = urls.read_view(view, async_name, throttle_class)
+            cls.views[url_name] = (sync_view, async_view)
+
+    def assertSameResponse(self, url_name, params=None, kwargs=None, headers=None, ignore=()):
+        """Compare the views' own responses, without the middleware"""
+        kwargs = kwargs or {}
+        url = reverse(url_name, kwargs=kwargs)
+        sync_view, async_view = self.views[url_name]
+        expected = sync_view(RequestFactory().get(url, params, headers=headers), **kwargs).render()
+        response = async_to_sync(async_view)(AsyncRequestFactory().get(url, params, headers=headers), **kwargs)
+
+        self.assertEqual(response.status_code, expected.status_code)
+        for header in ('Content-Type', 'Allow', 'Vary', 'WWW-Authenticate', 'Retry-After'):
+            self.assertEqual(response.get(header), expected.get(header), header)
+        if ignore:
+            body, expected_body = json.loads(response.content), json.loads(expected.content)
+            for field in ignore:
+                body.pop(field), expected_body.pop(field)
+            self.assertEqual(body, expected_body)
+        else:
+            self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_product_list(self):
+        self.assertSameResponse('product-list-create')
+        self.assertSameResponse('product-list-create', {'page': 2, 'page_size': 5, 'ordering': 'price'})
+        self.assertSameResponse('product-list-create', {'category': self.books.pk, 'search': 'novel'})
+        self.assertSameResponse('product-list-create', {'page': 9})
+
+    def test_product_detail(self):
+        response = self.assertSameResponse('product-detail', kwargs={'pk': self.products[0].pk}, ignore=['view_count'])
+        self.assertEqual(json.loads(response.content)['view_count'], 2)
+        self.assertSameResponse('product-detail', kwargs={'pk': 0})
+
+    def test_featured_and_trending(self):
+        self.assertSameResponse('featured-products')
+        self.assertSameResponse('trending-products')
+        self.assertSameResponse('trending-products', {'category': self.books.slug})
+
+    def test_categories(self):
+        response = self.assertSameResponse('product-categories')
+        # @api_view keeps its methods in a set, products.urls fixes their order
+        self.assertEqual(response['Allow'], 'GET, OPTIONS')
+
+    def test_search(self):
+        self.assertSameResponse('search-products', {'q': 'chair', 'facets': '1'})
+        self.assertSameResponse('search-products', {'q': '!!!', 'sort': 'price', 'page_size': 4, 'page': 2})
+        self.assertSameResponse('search-products', {'page': 'two'})
+
+    def test_invalid_token(self):
+        response = self.assertSameResponse('product-list-create', headers={'Authorization': 'Bearer not.a.token'})
+        self.assertEqual(response.status_code, 401)
+
+
+class BlobPurgeTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.name = default_storage.save('photo.jpg', ContentFile(image_bytes()))
+        self.age(days=3)
+
+    def age(self, **delta):
+        StoredBlob.objects.filter(name=self.name).update(updated_at=timezone.now() - timedelta(**delta))
+
+    def purge(self):
+        call_command('dedupe_media', '--purge', '--grace-hours', '24', stdout=StringIO())
+        return default_storage.exists(self.name)
+
+    def test_same_content_is_stored_once(self):
+        self.assertTrue(self.name.startswith('blobs/'))
+        self.assertEqual(default_storage.save('copy.jpg', ContentFile(image_bytes())), self.name)
+        self.assertEqual(StoredBlob.objects.count(), 1)
+
+    def test_grace_period_starts_at_the_last_release(self):
+        storage.add_reference(self.name)
+        self.age(days=3)
+        storage.release_reference(self.name)
+        self.assertTrue(self.purge())
+        self.age(hours=25)
+        self.assertFalse(self.purge())
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_reupload_restarts_the_grace_period(self):
+        default_storage.save('again.jpg', ContentFile(image_bytes()))
+        self.assertTrue(self.purge())
+
+    def test_referenced_blobs_are_kept(self):
+        Product.objects.create(
+            title='Lamp', description='Brass', price=Decimal(5), image=self.name,
+            category=Category.objects.create(name='Lighting', slug='lighting'),
+            owner=User.objects.create_user('seller'),
+        )
+        self.age(days=3)
+        self.assertTrue(self.purge())
+        self.assertEqual(StoredBlob.objects.get(name=self.name).ref_count, 1)
+
+
+@NO_THROTTLES
+@override_settings(IMAGE_VARIANT_SIZES={'thumbnail': 8, 'medium': 16})
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.name = default_storage.save('photo.jpg', ContentFile(image_bytes()))
+        category = Category.objects.create(name='Lighting', slug='lighting')
+        owner = User.objects.create_user('seller')
+        self.products = [
+            Product.objects.create(title=f'Lamp {number}', description='Brass', price=Decimal(5), image=self.name,
+                                   category=category, owner=owner)
+            for number in range(3)
+        ]
+        self.gallery = ProductImage.objects.create(product=self.products[0], image=self.name, is_primary=True)
+        self.addCleanup(cache.clear)
+
+    def test_shared_blobs_are_rendered_once(self):
+        with mock.patch('products.images.render_variants', wraps=images.render_variants) as render:
+            call_command('generate_image_variants', stdout=StringIO())
+        render.assert_called_once_with(self.name)
+
+        variants = Product.objects.get(pk=self.products[0].pk).image_variants
+        self.assertEqual(set(variants), {'thumbnail', 'medium'})
+        self.assertEqual(ProductImage.objects.get(pk=self.gallery.pk).variants, variants)
+        for product in self.products:
+            self.assertEqual(Product.objects.get(pk=product.pk).image_variants, variants)
+        for name in storage.variant_names(variants):
+            self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 4)
+
+    def test_new_rows_reuse_rendered_variants(self):
+        images.generate_variants(Product, self.products[0].pk, 'image', 'image_variants')
+        with mock.patch('products.images.render_variants') as render:
+            variants = images.generate_variants(ProductImage, self.gallery.pk, 'image', 'variants')
+        render.assert_not_called()
+        self.assertEqual(variants, Product.objects.get(pk=self.products[0].pk).image_variants)
+
+    def test_list_primary_images_keep_relative_urls(self):
+        response = self.client.get(reverse('product-list-create'))
+        product = next(row for row in response.data['results'] if row['id'] == self.products[0].pk)
+        self.assertTrue(product['image'].startswith('http://testserver/'))
+        self.assertEqual(product['primary_image']['image'], default_storage.url(self.name))
+
+
+class PrefixIndexTests(TestCase):
+    """The incrementally maintained top entries always match a brute-force ranking"""
+
+    WORDS = ['oak', 'oval', 'old', 'olive', 'chair', 'chaise', 'chest', 'charm', 'table', 'tablet', 'tan', 'tall']
+
+    def setUp(self):
+        self.random = random.Random(7)
+        self.weights = {}
+        self.index = autocomplete.PrefixIndex()
+
+    def title(self):
+        return ' '.join(self.random.choice(self.WORDS) for _ in range(self.random.randint(1, 3)))
+
+    def add(self, kind, text, weight=1):
+        self.weights[kind, text] = self.weights.get((kind, text), 0) + weight
+        self.index.add(kind, text, weight)
+
+    def remove(self, kind, text, weight=1):
+        if (kind, text) in self.weights:
+            self.weights[kind, text] -= weight
+            if self.weights[kind, text] <= 0:
+                del self.weights[kind, text]
+        self.index.remove(kind, text, weight)
+
+    def expected(self, prefix, limit):
+        matches = [
+            entry for entry in self.weights
+            if any(key.startswith(prefix) for key in autocomplete.index_keys(entry[1]))
+        ]
+        matches.sort(key=lambda entry: (-self.weights[entry] * autocomplete.KIND_BOOST[entry[0]], entry[1], entry[0]))
+        return [{'text': text, 'type': kind} for kind, text in matches[:limit]]
+
+    def assertMatchesBruteForce(self):
+        prefixes = {word[:end] for word in self.WORDS for end in range(1, len(word) + 1)} | {'oak c', 'chair t', 'zz'}
+        for prefix in sorted(prefixes):
+            self.assertEqual(
+                self.index.suggest(prefix, autocomplete.MAX_SUGGESTIONS),
+                self.expected(prefix, autocomplete.MAX_SUGGESTIONS),
+                prefix,
+            )
+
+    def test_load(self):
+        entries = [('product', self.title(), self.random.randint(1, 3), None) for _ in range(400)]
+        for kind, text, weight, _ in entries:
+            self.weights[kind, text] = self.weights.get((kind, text), 0) + weight
+        self.index.load(entries)
+        self.assertTrue(self.index.top)
+        self.assertMatchesBruteForce()
+
+    def test_incremental_changes(self):
+        titles = [self.title() for _ in range(300)]
+        for title in titles:
+            self.add('product', title)
+        self.assertMatchesBruteForce()
+
+        for step in range(600):
+            title = self.random.choice(titles)
+            action = step % 5
+            if action == 0:  # insert
+                titles.append(self.title())
+                self.add('product', titles[-1])
+            elif action == 1:  # rename
+                position = titles.index(title)
+                self.remove('product', title)
+                titles[position] = self.title()
+                self.add('product', titles[position])
+            elif action == 2:  # delete
+                self.remove('product', title)
+                titles.remove(title)
+            elif action == 3:  # unlisted, then listed again later
+                self.remove('product', title)
+                if self.random.random() < 0.5:
+                    self.add('product', title)
+            else:  # a search became more popular
+                self.add('query', self.title(), self.random.randint(1, 3))
+            if step % 50 == 0:
+                self.assertMatchesBruteForce()
+        self.assertMatchesBruteForce()
+
+    def test_wide_prefix_losing_its_best_entries(self):
+        # Rescanned once removals leave fewer kept entries than a full page
+        for number in range(100):
+            self.add('product', f'oak chair {number:03}')
+        for number in range(40):
+            self.add('product', f'oak table {number:03}', 3)
+        for number in range(40):
+            self.remove('product', f'oak table {number:03}', 3)
+            self.assertEqual(self.index.suggest('oak', 20), self.expected('oak', 20))
+
+    def test_complete_prefix_gaining_entries(self):
+        # 30 entries with three keys each under "o": every entry is kept
+        for number in range(30):
+            self.add('product', f'oak oval old {number:02}', 5)
+        self.assertTrue(self.index.top['o'].complete)
+        for number in range(30):
+            self.add('product', f'olive {number:02}')
+        for number in range(30):
+            self.remove('product', f'oak oval old {number:02}', 5)
+            self.assertEqual(self.index.suggest('o', 20), self.expected('o', 20))
+        self.assertMatchesBruteForce()
+
+
+@NO_THROTTLES
+@override_settings(AUTOCOMPLETE_MIN_QUERY_COUNT=2, AUTOCOMPLETE_BLOCKED_WORDS=['rude'])
+class AutocompleteTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete._index = autocomplete.build_index()
+        autocomplete._built_at = float('inf')  # no background rebuild
+        self.addCleanup(setattr, autocomplete, '_index', None)
+        self.addCleanup(autocomplete._query_counts.clear)
+
+    def suggest(self, query):
+        response = self.client.get(reverse('product-autocomplete'), {'q': query, 'limit': 20})
+        return [(row['type'], row['text']) for row in response.data['suggestions']]
+
+    def test_categories_and_titles(self):
+        self.assertEqual(self.suggest('furn'), [('category', 'Furniture')])
+        self.assertIn(('product', 'Oak chair 3'), self.suggest('chair 3'))
+
+    def test_product_changes(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.title = 'Walnut stool'
+        product.save()
+        self.assertEqual(self.suggest('walnut'), [('product', 'Walnut stool')])
+        self.assertNotIn(('product', 'Oak chair 0'), self.suggest('oak'))
+
+        product.is_available = False
+        product.save()
+        self.assertEqual(self.suggest('walnut'), [])
+        product.is_available = True
+        product.save()
+        self.assertEqual(self.suggest('walnut'), [('product', 'Walnut stool')])
+        product.delete()
+        self.assertEqual(self.suggest('walnut'), [])
+
+    def test_popular_searches(self):
+        for _ in range(2):
+            self.client.get(reverse('search-products'), {'q': 'Oak  CHAIR!'})
+        self.assertIn(('query', 'oak chair'), self.suggest('oak'))
+        # Searches without results are not counted
+        for _ in range(2):
+            self.client.get(reverse('search-products'), {'q': 'oakland'})
+        self.assertNotIn(('query', 'oakland'), self.suggest('oak'))
+
+    def test_unsuitable_searches_are_not_suggested(self):
+        for query in ('rude chair', 'chair 0123456789', 'oak chair with four legs and a cushion'):
+            self.assertIsNone(autocomplete.suggestible_query(query))
+            for _ in range(3):
+                autocomplete.record_query(query)
+        self.assertEqual([kind for kind, _ in self.suggest('chair')].count('query'), 0)
+
+
+class ThrottleTests(CatalogTestCase):
+    rates = {'catalog': '10/min', 'catalog_detail': '3/min'}
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store_path = os.path.join(directory.name, 'throttle.sqlite3')
+        for override in (
+            override_settings(THROTTLE_STORE_PATH=self.store_path),
+            override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': self.rates}),
+        ):
+            override.enable()
+            self.addCleanup(override.disable)
+        # The store is opened once per process
+        throttling._store = None
+        self.addCleanup(setattr, throttling, '_store', None)
+
+    def statuses(self, url, count, params=None):
+        return [self.client.get(url, params).status_code for _ in range(count)]
+
+    def test_rejects_with_retry_after(self):
+        self.assertEqual(self.statuses(reverse('product-list-create'), 10), [200] * 10)
+        response = self.client.get(reverse('product-list-create'))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertLessEqual(int(response['Retry-After']), 6)
+
+    def test_expensive_requests_cost_more(self):
+        # page_size=100 costs 5, a search 2 more
+        self.assertEqual(self.statuses(reverse('search-products'), 2, {'q': 'oak', 'page_size': 100}), [200, 429])
+
+    def test_estimate_cost(self):
+        def cost(**params):
+            return throttling.estimate_cost(Request(RequestFactory().get('/', params)))
+
+        self.assertEqual(cost(), 1)
+        self.assertEqual(cost(page_size=100), 5)
+        self.assertEqual(cost(page=60, page_size=20), 2)
+        self.assertEqual(cost(page=10 ** 6), 6)
+        self.assertEqual(cost(q='oak', location='Austin', lat='30.2', facets='1'), 9)
+        self.assertEqual(cost(page_size='many'), 1)
+
+    def test_detail_budget_is_separate(self):
+        detail = reverse('product-detail', args=[self.products[0].pk])
+        self.assertEqual(self.statuses(detail, 4), [200, 200, 200, 429])
+        self.assertEqual(self.statuses(reverse('product-list-create'), 1), [200])
+
+    def test_writes_are_not_charged(self):
+        self.client.force_authenticate(self.owner)
+        for _ in range(12):
+            response = self.client.post(reverse('product-list-create'), {'title': 'Lamp'})
+            self.assertNotEqual(response.status_code, 429)
+        self.assertEqual(self.statuses(reverse('product-list-create'), 10), [200] * 10)
+
+    def test_users_and_addresses_have_separate_budgets(self):
+        self.statuses(reverse('product-list-create'), 10)
+        self.assertEqual(self.statuses(reverse('product-list-create'), 1), [429])
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.statuses(reverse('product-list-create'), 1), [200])
+
+    def test_async_views_share_the_budget(self):
+        with override_settings(ASYNC_VIEWS=True):
+            view = urls.read_view(views.ProductListCreateView.as_view(), 'product_list', CatalogThrottle)
+        self.statuses(reverse('product-list-create'), 10)
+        response = async_to_sync(view)(AsyncRequestFactory().get(reverse('product-list-create')))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_unavailable_store_lets_requests_through(self):
+        with override_settings(THROTTLE_STORE_PATH=os.path.join(self.store_path, 'missing', 'throttle.sqlite3')):
+            throttling._store = None
+            with self.assertLogs('products.throttling', 'WARNING'):
+                self.assertEqual(self.statuses(reverse('product-list-create'), 12), [200] * 12)
+
+
+@skipUnless(importlib.util.find_spec('numpy') and importlib.util.find_spec('scipy'), 'needs numpy and scipy')
+class SimilarProductsTests(CatalogTestCase):
+    def neighbours(self, product):
+        return list(SimilarProduct.objects.filter(product=product).values_list('similar_id', flat=True))
+
+    def test_neighbours_within_the_category(self):
+        compute_similar(full=True)
+        chairs = {product.pk for product in self.products[:6]}
+        neighbours = self.neighbours(self.products[0])
+        self.assertEqual(set(neighbours), chairs - {self.products[0].pk})
+
+        response = self.client.get(reverse('similar-products', args=[self.products[0].pk]), {'limit': 3})
+        self.assertEqual([product['id'] for product in response.data], neighbours[:3])
+
+    def test_term_shared_by_the_whole_category_still_counts(self):
+        lamps = Category.objects.create(name='Lamps', slug='lamps')
+        words = 'brass copper marble walnut glass paper rattan linen steel bamboo ceramic concrete'.split()
+        products = [
+            Product.objects.create(title=f'Lamp {word}', description='Lamp', category=lamps, price=5, owner=self.owner)
+            for word in words
+        ]
+        compute_category(lamps.pk, full=True)
+        for product in products:
+            self.assertEqual(len(self.neighbours(product)), len(products) - 1)
+
+    def test_products_without_neighbours_are_not_stale(self):
+        misc = Category.objects.create(name='Misc', slug='misc')
+        telescope = Product.objects.create(title='Telescope', description='Brass', category=misc, price=5, owner=self.owner)
+        Product.objects.create(title='Scarf', description='Knitted', category=misc, price=5, owner=self.owner)
+        available = Product.objects.filter(category=misc)
+
+        self.assertEqual(compute_category(misc.pk), 2)
+        self.assertFalse(SimilarProduct.objects.filter(product__category=misc).exists())
+        self.assertEqual(stale_product_ids(available), set())
+        self.assertEqual(compute_category(misc.pk), 0)
+
+        telescope.description = 'Brass, with tripod'
+        telescope.save()
+        self.assertEqual(stale_product_ids(available), {telescope.pk})
+        self.assertEqual(compute_category(misc.pk), 1)
+
+    def test_incremental_run_merges_new_listings(self):
+        compute_similar(full=True)
+        chair = self.make_product('Oak chair 6', self.furniture)
+        self.assertEqual(compute_similar()[self.books.pk], 0)
+
+        self.assertEqual(len(self.neighbours(chair)), 6)
+        self.assertIn(chair.pk, self.neighbours(self.products[0]))
+        self.assertEqual(stale_product_ids(Product.objects.all()), set())
+
+
+class PrimaryImageTests(CatalogTestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.chair, self.novel = self.products[0], self.products[6]
+        ProductImage.objects.create(product=self.chair, image=default_storage.save('side.jpg', ContentFile(image_bytes('red'))))
+        self.primary = ProductImage.objects.create(
+            product=self.chair, image=default_storage.save('front.jpg', ContentFile(image_bytes('blue'))), is_primary=True
+        )
+        ProductImage.objects.create(product=self.novel, image=default_storage.save('cover.jpg', ContentFile(image_bytes('green'))))
+
+    def test_read_from_prefetched_images(self):
+        queryset = Product.objects.filter(pk__in=[self.chair.pk, self.novel.pk]).select_related(
+            'category', 'owner'
+        ).prefetch_related('images').order_by('pk')
+        # Products, then every image at once
+        with self.assertNumQueries(2):
+            data = ProductListSerializer(queryset, many=True).data
+        self.assertEqual(data[0]['primary_image']['id'], self.primary.pk)
+        self.assertEqual(data[0]['primary_image']['image'], self.primary.image.url)
+        self.assertIsNone(data[1]['primary_image'])
+
+    def test_listing(self):
+        response = self.client.get(reverse('product-list-create'), {'page_size': 50})
+        products = {product['id']: product for product in response.data['results']}
+        self.assertEqual(products[self.chair.pk]['primary_image']['id'], self.primary.pk)
+        self.assertIsNone(products[self.novel.pk]['primary_image'])
+        self.assertIsNone(products[self.products[1].pk]['primary_image'])
+
+
+@override_settings(IMAGE_VARIANT_SIZES={'thumbnail': 8})
+class FastPathTests(CatalogTestCase):
+    """serialize_product_rows + FastJSONRenderer give the same bytes as ProductListSerializer + JSONRenderer"""
+
+    def setUp(self):
+        temporary_media(self)
+        chair = self.products[0]
+        chair.title = 'Oak chair \u2028 \u00e9 \U0001fa91'
+        chair.original_price = Decimal('25.50')
+        chair.location = 'Portland, OR'
+        chair.image = default_storage.save('chair.jpg', ContentFile(image_bytes('red')))
+        chair.save()
+        images.generate_variants(Product, chair.pk, 'image', 'image_variants')
+        gallery = ProductImage.objects.create(
+            product=chair, image=default_storage.save('front.jpg', ContentFile(image_bytes('blue'))), is_primary=True
+        )
+        images.generate_variants(ProductImage, gallery.pk, 'image', 'variants')
+        self.request = Request(RequestFactory().get('/api/products/'))
+
+    def assertSameBytes(self, queryset):
+        expected = JSONRenderer().render(
+            ProductListSerializer(queryset.select_related('category', 'owner').prefetch_related('images'), many=True,
+                                  context={'request': self.request}).data
+        )
+        self.assertEqual(FastJSONRenderer().render(serialize_product_rows(product_rows(queryset), self.request)), expected)
+        rows = async_to_sync(aserialize_product_rows)(product_rows(queryset), self.request)
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+        return expected
+
+    def test_same_bytes(self):
+        body = self.assertSameBytes(Product.objects.order_by('pk'))
+        chair = json.loads(body)[0]
+        self.assertEqual(chair['discount_percentage'], 60.8)
+        self.assertTrue(chair['image'].startswith('http://testserver/'))
+        self.assertIn('srcset', chair['image_variants'])
+        self.assertIn('srcset', chair['primary_image']['variants'])
+
+    def test_sliced_and_filtered(self):
+        self.assertSameBytes(Product.objects.filter(category=self.books).order_by('-price')[1:4])
+        self.assertSameBytes(Product.objects.none())
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'line\u2028separator\u2029 \u00e9 \U0001f600 "quoted" </script>',
+            'price': Decimal('10.50'),
+            'at': timezone.now(),
+            'floats': [0.5, 1.0, 123456.789],
+            'big': 2 ** 70,
+            'nested': [None, True, {'key': []}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+@override_settings(SEARCH_PRICE_BUCKETS=[10, 25, 250])
+class FacetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.make_product('Oak desk', cls.furniture, price=250, condition='like_new')
+        cls.make_product('Oak wardrobe', cls.furniture, price=Decimal('249.99'), condition='fair')
+        cls.make_product('Oak stool', cls.furniture, price=Decimal('9.99'), condition='fair')
+        cls.make_product('Oak bench', cls.furniture, price=40, is_available=False)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def search(self, **params):
+        response = self.client.get(reverse('search-products'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def brute_force(self, products):
+        """The facets, counted product by product"""
+        bounds = [10, 25, 250]
+        products = list(products)
+        categories = {product.category for product in products}
+        labels = dict(Product.CONDITION_CHOICES)
+        return {
+            'category': sorted(
+                [
+                    {'slug': category.slug, 'name': category.name,
+                     'count': sum(product.category == category for product in products)}
+                    for category in categories
+                ],
+                key=lambda row: (-row['count'], row['name'])
+            ),
+            'condition': [
+                {'value': value, 'label': labels[value], 'count': sum(product.condition == value for product in products)}
+                for value, _ in Product.CONDITION_CHOICES
+                if any(product.condition == value for product in products)
+            ],
+            'price': [
+                {'min': low, 'max': high,
+                 'count': sum(low <= product.price and (high is None or product.price < high) for product in products)}
+                for low, high in zip([0] + bounds, bounds + [None])
+            ],
+        }
+
+    def test_match_the_results(self):
+        cases = [
+            ({}, Product.objects.filter(is_available=True)),
+            ({'q': 'oak'}, Product.objects.filter(is_available=True, title__icontains='oak')),
+            ({'category': 'books'}, Product.objects.filter(is_available=True, category=self.books)),
+            ({'min_price': 10, 'max_price': 250}, Product.objects.filter(is_available=True, price__gte=10, price__lte=250)),
+            ({'condition': 'fair'}, Product.objects.filter(is_available=True, condition='fair')),
+        ]
+        for params, expected in cases:
+            with self.subTest(**params):
+                data = self.search(facets='1', **params)
+                self.assertEqual(data['count'], expected.count())
+                self.assertEqual(data['facets'], self.brute_force(expected))
+
+    def test_price_bucket_bounds(self):
+        price = self.search(facets='price')['facets']['price']
+        # Lower bounds are inclusive, upper bounds exclusive
+        self.assertEqual([row['count'] for row in price], [6, 7, 1, 1])
+        self.assertEqual((price[-1]['min'], price[-1]['max']), (250, None))
+
+    def test_requested_facets_only(self):
+        self.assertNotIn('facets', self.search())
+        self.assertNotIn('facets', self.search(facets='0'))
+        self.assertEqual(set(self.search(facets='category,price')['facets']), {'category', 'price'})
+        self.assertEqual(set(self.search(facets='all', cursor='')['facets']), {'category', 'condition', 'price'})
+
+    def test_parse_facets(self):
+        self.assertEqual(parse_facets(None), [])
+        self.assertEqual(parse_facets('false'), [])
+        self.assertEqual(parse_facets('TRUE'), ['category', 'condition', 'price'])
+        self.assertEqual(parse_facets('price, category'), ['category', 'price'])
+        self.assertEqual(parse_facets('price,category,colour'), ['category', 'price'])
+
+    @override_settings(PRODUCT_COUNT_CACHE_TIMEOUT=30)
+    def test_cached(self):
+        queryset = Product.objects.filter(is_available=True, category=self.books)
+        facets = facet_counts(queryset)
+        with self.assertNumQueries(0):
+            self.assertEqual(facet_counts(queryset, ['price']), {'price': facets['price']})
+
+
+class NearSearchTests(CatalogTestCase):
+    """Radius searches match a brute-force haversine filter, including across cell edges, the antimeridian and poles"""
+
+    CENTERS = [
+        (45.5152, -122.6784),  # Portland
+        (0.0, 0.0),  # Equator and prime meridian, four top-level cells meet
+        (0.5, 179.95),  # Antimeridian
+        (-12.0, -179.99),
+        (89.9, 10.0),  # Near the pole the circle spans every longitude
+        (-89.95, -45.0),
+        (64.0, -20.0),  # High latitude, wide in longitude
+    ]
+    RADII = [1, 25, 500]
+
+    def place(self, latitude, longitude):
+        product = self.make_product('Lamp', self.furniture)
+        Product.objects.filter(pk=product.pk).update(
+            latitude=latitude, longitude=longitude, geohash=geo.encode(latitude, longitude)
+        )
+        return product.pk
+
+    def haversine(self, lat1, lon1, lat2, lon2):
+        lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        points = {}
+        for latitude, longitude in self.CENTERS:
+            for radius in self.RADII:
+                spread = math.degrees(radius * 1.5 / geo.EARTH_RADIUS_KM)
+                for _ in range(15):
+                    point_lat = min(max(latitude + rng.uniform(-spread, spread), -90.0), 90.0)
+                    lon_spread = min(spread / max(math.cos(math.radians(point_lat)), 1e-3), 180.0)
+                    point_lon = (longitude + rng.uniform(-lon_spread, lon_spread) + 180) % 360 - 180
+                    points[self.place(point_lat, point_lon)] = (point_lat, point_lon)
+
+        available = Product.objects.filter(is_available=True)
+        for latitude, longitude in self.CENTERS:
+            for radius in self.RADII:
+                with self.subTest(latitude=latitude, longitude=longitude, radius=radius):
+                    distances = {pk: self.haversine(latitude, longitude, *point) for pk, point in points.items()}
+                    found = {
+                        row['pk']: row['distance_km']
+                        for row in geo.near_queryset(available, latitude, longitude, radius).values('pk', 'distance_km')
+                    }
+                    # Float rounding may go either way right on the edge
+                    expected = {pk for pk, distance in distances.items() if distance < radius - 1e-6}
+                    outside = {pk for pk, distance in distances.items() if distance > radius + 1e-6}
+                    self.assertLessEqual(expected, set(found))
+                    self.assertFalse(outside & set(found))
+                    for pk, distance in found.items():
+                        self.assertAlmostEqual(distance, distances[pk], places=6)
+
+    def test_covering_cells_stay_bounded(self):
+        for latitude, longitude in self.CENTERS:
+            for radius in self.RADII:
+                self.assertLessEqual(len(geo.covering_cells(latitude, longitude, radius)), geo.MAX_CELLS)
+
+    def test_search_sorted_by_distance(self):
+        near = self.place(45.52, -122.68)
+        further = self.place(45.6, -122.6)
+        self.place(47.6, -122.3)  # Seattle, out of range
+        response = self.client.get(reverse('search-products'), {'lat': 45.5152, 'lon': -122.6784, 'radius': 25, 'sort': 'distance'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.data['results']], [near, further])
+        self.assertLess(response.data['results'][0]['distance_km'], response.data['results'][1]['distance_km'])
+
+    def test_parse_near(self):
+        self.assertIsNone(geo.parse_near({}))
+        self.assertEqual(geo.parse_near({'lat': '90', 'lon': '-180', 'radius': '500'}), (90.0, -180.0, 500.0))
+        self.assertEqual(geo.parse_near({'lat': '1', 'lon': '2'}), (1.0, 2.0, geo.DEFAULT_RADIUS_KM))
+        for params in ({'lat': '1'}, {'lat': 'x', 'lon': '2'}, {'lat': '90.1', 'lon': '0'}, {'lat': '0', 'lon': '180.5'},
+                       {'lat': '0', 'lon': '0', 'radius': '0'}, {'lat': '0', 'lon': '0', 'radius': '500.1'}):
+            with self.subTest(**params), self.assertRaises(ValidationError):
+                geo.parse_near(params)
+
+
+def photo(seed, size=(240, 180)):
+    """A JPEG of random coloured shapes, standing in for a product photo"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        box = (x, y, x + rng.randrange(20, 120), y + rng.randrange(20, 90))
+        draw.ellipse(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def encoded(image, format='JPEG', **options):
+    buffer = BytesIO()
+    image.save(buffer, format, **options)
+    return buffer
+
+
+@override_settings(DUPLICATE_IMAGE_MAX_DISTANCE=7)
+class DuplicateImageTests(CatalogTestCase):
+    def store(self, product, value, name='photo.jpg'):
+        return ImageFingerprint.objects.create(
+            product=product, name=name, dhash=duplicates.to_signed(value),
+            **{f'band{band}': band_value for band, band_value in enumerate(duplicates.bands(value))}
+        )
+
+    def test_edited_copies_stay_close(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                original = photo(seed)
+                value = duplicates.dhash(encoded(original))
+                width, height = original.size
+                copies = [
+                    encoded(original, quality=40),
+                    encoded(original, 'PNG'),
+                    encoded(original.resize((width // 2, height // 2))),
+                    encoded(original.resize((width * 2, height * 2))),
+                    encoded(original.crop((4, 3, width - 4, height - 3))),
+                ]
+                for copy in copies:
+                    self.assertLessEqual(duplicates.distance(value, duplicates.dhash(copy)), duplicates.max_distance())
+
+    def test_other_photos_are_far(self):
+        values = [duplicates.dhash(encoded(photo(seed))) for seed in range(10)]
+        for first, second in itertools.combinations(values, 2):
+            self.assertGreater(duplicates.distance(first, second), duplicates.max_distance())
+
+    def test_lookup_matches_brute_force(self):
+        rng = random.Random(11)
+        stored = {}
+        for _ in range(40):
+            base = rng.getrandbits(64)
+            for flips in (0, 1, 3, 5, 7, 8, 12):
+                value = base
+                for position in rng.sample(range(64), flips):
+                    value ^= 1 << position
+                product = self.products[rng.randrange(len(self.products))]
+                stored[self.store(product, value).pk] = value
+
+        for query in list(stored.values())[::9]:
+            expected = sorted(
+                (duplicates.distance(query, value), pk) for pk, value in stored.items()
+                if duplicates.distance(query, value) <= 7
+            )
+            found = duplicates.find_duplicates(query, limit=len(stored))
+            self.assertEqual([(bits, entry.pk) for bits, entry in found], expected)
+
+    def test_featureless_images_never_match(self):
+        blank = duplicates.dhash(encoded(Image.new('RGB', (64, 64), 'white')))
+        self.assertTrue(duplicates.is_featureless(blank))
+        self.store(self.products[0], blank)
+        self.assertEqual(duplicates.find_duplicates(blank), [])
+
+    def test_groups_span_products(self):
+        value = duplicates.dhash(encoded(photo(1)))
+        other = duplicates.dhash(encoded(photo(2)))
+        relisted = [self.store(self.products[0], value), self.store(self.products[1], value ^ 0b101)]
+        same_product = [self.store(self.products[2], other), self.store(self.products[2], other ^ 1)]
+        groups = duplicates.duplicate_groups(ImageFingerprint.objects.values_list('pk', 'product_id', 'dhash'))
+        self.assertEqual(
+            [sorted(pk for pk, _ in members) for members in groups],
+            [sorted(entry.pk for entry in relisted)]
+        )
+        self.assertNotIn(same_product[0].pk, [pk for members in groups for pk, _ in members])
+
+    def test_upload_reports_relisted_photos(self):
+        temporary_media(self)
+        original = photo(4)
+        self.client.force_authenticate(self.owner)
+        first = self.client.post(
+            reverse('upload-product-images', args=[self.products[0].pk]),
+            {'images': [SimpleUploadedFile('chair.jpg', encoded(original).getvalue(), content_type='image/jpeg')]},
+        )
+        self.assertEqual(first.data['images'][0]['possible_duplicates'], [])
+
+        smaller = encoded(original.resize((120, 90)), quality=60).getvalue()
+        second = self.client.post(
+            reverse('upload-product-images', args=[self.products[1].pk]),
+            {'images': [SimpleUploadedFile('again.jpg', smaller, content_type='image/jpeg')]},
+        )
+        self.assertEqual(second.status_code, 201)
+        [match] = second.data['images'][0]['possible_duplicates']
+        self.assertEqual(match['product'], self.products[0].pk)
+        self.assertEqual(match['image'], first.data['images'][0]['id'])
+        self.assertTrue(match['same_owner'])
 
-# Create your tests here.
@@ -0,0 +1,170 @@
+"""
+Cost-aware throttling for the public catalog endpoints.
+
+Each request is charged an estimated cost instead of counting as one hit:
+bigger pages, deep ``?page=`` offsets, full-text terms, the unindexed
+``location`` filter, radius searches and facet counts all cost more.
+``CatalogThrottle`` (product lists, search, trending, analytics) and
+``CatalogDetailThrottle`` (single product lookups) draw from separate budgets,
+``DEFAULT_THROTTLE_RATES['catalog']`` and ``['catalog_detail']`` in cost units,
+per user or client IP. Only safe (GET/HEAD/OPTIONS) requests are charged, so
+creating or editing a product does not spend the read budget.
+
+Budgets are enforced with the generic cell rate algorithm: one "theoretical
+arrival time" per client and scope, kept in a SQLite file
+(``THROTTLE_STORE_PATH``) shared by all workers on the host and updated under
+a write lock. Rejected requests get DRF's 429 with ``Retry-After``. If the
+store is unavailable, requests are let through.
+"""
+
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+from .pagination import ProductPagination
+
+logger = logging.getLogger(__name__)
+
+# Rows whose arrival time has passed are deleted on about one charge in this many
+PRUNE_EVERY = 1000
+
+
+class ThrottleStore:
+    """Per-key theoretical arrival times in a SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS throttle (key TEXT PRIMARY KEY, tat REAL NOT NULL)')
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def charge(self, key, cost, burst, now):
+        """
+        Spend ``cost`` seconds of the ``burst`` second allowance of ``key``.
+        Returns 0 when allowed, otherwise the seconds until it would be.
+        """
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tat FROM throttle WHERE key = ?', (key,)).fetchone()
+            tat = max(row[0], now) if row else now
+            wait = tat + cost - burst - now
+            if wait <= 0:
+                connection.execute(
+                    'INSERT INTO throttle (key, tat) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET tat = excluded.tat',
+                    (key, tat + cost),
+                )
+            if random.randrange(PRUNE_EVERY) == 0:
+                connection.execute('DELETE FROM throttle WHERE tat < ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return max(wait, 0)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = getattr(settings, 'THROTTLE_STORE_PATH', None) or os.path.join(
+                tempfile.gettempdir(), 'ecofinds-throttle.sqlite3'
+            )
+            _store = ThrottleStore(path)
+        return _store
+
+
+def _int_param(query_params, name, default):
+    try:
+        return int(query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def estimate_cost(request):
+    """Relative database cost of a product list or search request"""
+    params = request.query_params
+    page_size = min(max(_int_param(params, 'page_size', 20), 1), ProductPagination.max_page_size)
+    page = max(_int_param(params, 'page', 1), 1)
+    cost = 1 + (page_size - 1) // 20
+    # OFFSET pagination reads every skipped row
+    cost += min((page - 1) * page_size // 1000, 5)
+    if params.get('q') or params.get('search'):
+        cost += 2
+    if params.get('location'):
+        cost += 3
+    if params.get('lat'):
+        cost += 1
+    if params.get('facets'):
+        cost += 2
+    return cost
+
+
+class CostRateThrottle(BaseThrottle):
+    """Throttle charging ``get_cost()`` units against the rate of ``scope``"""
+    scope = None
+    parse_rate = SimpleRateThrottle.parse_rate
+
+    def get_rate(self):
+        rates = getattr(settings, 'REST_FRAMEWORK', {}).get('DEFAULT_THROTTLE_RATES', {})
+        return rates.get(self.scope)
+
+    def get_cost(self, request, view):
+        return 1
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'{self.scope}:user:{request.user.pk}'
+        return f'{self.scope}:ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        rate = self.get_rate()
+        # Only reads spend the catalog budgets
+        if rate is None or request.method not in SAFE_METHODS:
+            return True
+        units, duration = self.parse_rate(rate)
+        cost = min(self.get_cost(request, view), units)
+        try:
+            wait = get_store().charge(self.get_ident_key(request), cost * duration / units, duration, time.time())
+        except sqlite3.Error:
+            logger.warning('Throttle store unavailable, not throttling', exc_info=True)
+            return True
+        if wait > 0:
+            self.wait_seconds = wait
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class CatalogThrottle(CostRateThrottle):
+    scope = 'catalog'
+
+    def get_cost(self, request, view):
+        return estimate_cost(request)
+
+
+class CatalogDetailThrottle(CostRateThrottle):
+    scope = 'catalog_detail'
@@ -0,0 +1,129 @@
+"""
+Time-decayed trending rankings.
+
+Flushed view hits (see ``products.view_counts``) are added to hourly
+``ProductViewBucket`` rows. ``compute_trending`` (run on a schedule through
+``manage.py compute_trending``) scores every available product as
+
+    sum(views * 0.5 ** (age_hours / TRENDING_HALF_LIFE_HOURS))
+
+over the last ``TRENDING_WINDOW_DAYS`` and stores the top
+``TRENDING_TOP_N`` globally and per category in ``TrendingProduct``. A
+category without a ranking (no recent views) is listed by view count instead.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product, ProductViewBucket, TrendingProduct
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def bucket_for(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record_hits(hits_by_product, now=None):
+    """Add ``{product_id: hits}`` to the current hourly buckets"""
+    if not hits_by_product:
+        return
+    bucket_start = bucket_for(now or timezone.now())
+    product_ids = list(hits_by_product)
+
+    # Make sure every bucket row exists, then increment atomically
+    existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    ProductViewBucket.objects.bulk_create(
+        [ProductViewBucket(product_id=pk, bucket_start=bucket_start) for pk in product_ids if pk in existing],
+        ignore_conflicts=True
+    )
+    by_increment = defaultdict(list)
+    for product_id, hits in hits_by_product.items():
+        by_increment[hits].append(product_id)
+    for hits, ids in by_increment.items():
+        ProductViewBucket.objects.filter(product_id__in=ids, bucket_start=bucket_start).update(views=F('views') + hits)
+
+
+def compute_trending(now=None):
+    """Rebuild the TrendingProduct table, returns the number of ranked products"""
+    now = now or timezone.now()
+    half_life = float(_setting('TRENDING_HALF_LIFE_HOURS', 24))
+    window_start = now - timedelta(days=_setting('TRENDING_WINDOW_DAYS', 7))
+    top_n = _setting('TRENDING_TOP_N', 50)
+
+    scores = defaultdict(float)
+    categories = {}
+    buckets = ProductViewBucket.objects.filter(
+        bucket_start__gte=window_start, product__is_available=True
+    ).values_list('product_id', 'product__category_id', 'bucket_start', 'views')
+    for product_id, category_id, bucket_start, views in buckets.iterator():
+        age_hours = max((now - bucket_start).total_seconds() / 3600, 0)
+        scores[product_id] += views * 0.5 ** (age_hours / half_life)
+        categories[product_id] = category_id
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    per_category = defaultdict(list)
+    for product_id, score in ranked:
+        per_category[categories[product_id]].append((product_id, score))
+
+    entries = [
+        TrendingProduct(category_id=None, product_id=product_id, rank=rank, score=score, computed_at=now)
+        for rank, (product_id, score) in enumerate(ranked[:top_n], start=1)
+    ]
+    for category_id, items in per_category.items():
+        entries.extend(
+            TrendingProduct(category_id=category_id, product_id=product_id, rank=rank, score=score, computed_at=now)
+            for rank, (product_id, score) in enumerate(items[:top_n], start=1)
+        )
+
+    with transaction.atomic():
+        TrendingProduct.objects.all().delete()
+        TrendingProduct.objects.bulk_create(entries, batch_size=500)
+        ProductViewBucket.objects.filter(bucket_start__lt=window_start).delete()
+    return len(entries)
+
+
+def _entries_for(category_slug):
+    if category_slug:
+        return TrendingProduct.objects.filter(category__slug=category_slug)
+    return TrendingProduct.objects.filter(category__isnull=True)
+
+
+def trending_queryset(queryset, category_slug=None):
+    """
+    Order ``queryset`` by the precomputed ranking (global, or for the category
+    with ``category_slug``), or by view count in the same scope while that
+    ranking is empty (not computed yet, or no recent views in the category).
+    """
+    if not _entries_for(category_slug).exists():
+        return _by_views(queryset, category_slug)
+    return _ranked(queryset, category_slug)
+
+
+async def atrending_queryset(queryset, category_slug=None):
+    """``trending_queryset`` with the async ORM"""
+    if not await _entries_for(category_slug).aexists():
+        return _by_views(queryset, category_slug)
+    return _ranked(queryset, category_slug)
+
+
+def _by_views(queryset, category_slug):
+    if category_slug:
+        queryset = queryset.filter(category__slug=category_slug)
+    return queryset.order_by('-view_count')
+
+
+def _ranked(queryset, category_slug):
+    if category_slug:
+        ranking = {'trending_entries__category__slug': category_slug}
+    else:
+        ranking = {'trending_entries__isnull': False, 'trending_entries__category__isnull': True}
+    # order_by reuses the join set up by filter(), so this is one index range scan
+    return queryset.filter(**ranking).order_by('trending_entries__rank')
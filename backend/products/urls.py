@@ -1,22 +1,45 @@
+from functools import wraps
+
+from django.conf import settings
 from django.urls import path
 from . import views
+from .throttling import CatalogDetailThrottle, CatalogThrottle
+
+
+def read_view(sync_view, async_name, throttle_class=None):
+    """``sync_view``, with its GETs served by products.async_views when ASYNC_VIEWS is on"""
+    if getattr(settings, 'ASYNC_VIEWS', False):
+        from . import async_views
+        return async_views.with_async_reads(sync_view, getattr(async_views, async_name), throttle_class)
+
+    @wraps(sync_view)
+    def view(request, *args, **kwargs):
+        response = sync_view(request, *args, **kwargs)
+        if response.has_header('Allow'):
+            response['Allow'] = views.allow_header(response['Allow'].split(','))
+        return response
+    return view
+
 
 urlpatterns = [
     # Product endpoints
-    path('', views.ProductListCreateView.as_view(), name='product-list-create'),
-    path('<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
+    path('', read_view(views.ProductListCreateView.as_view(), 'product_list', CatalogThrottle), name='product-list-create'),
+    path('<int:pk>/', read_view(views.ProductDetailView.as_view(), 'product_detail', CatalogDetailThrottle), name='product-detail'),
     path('my-products/', views.UserProductsView.as_view(), name='user-products'),
-    path('featured/', views.FeaturedProductsView.as_view(), name='featured-products'),
-    path('trending/', views.TrendingProductsView.as_view(), name='trending-products'),
+    path('my-products/archived/', views.ArchivedProductsView.as_view(), name='archived-products'),
+    path('featured/', read_view(views.FeaturedProductsView.as_view(), 'featured_products'), name='featured-products'),
+    path('trending/', read_view(views.TrendingProductsView.as_view(), 'trending_products', CatalogThrottle), name='trending-products'),
     path('<int:pk>/toggle-availability/', views.toggle_product_availability, name='toggle-product-availability'),
     path('<int:pk>/upload-images/', views.upload_product_images, name='upload-product-images'),
+    path('<int:pk>/similar/', views.similar_products, name='similar-products'),
     
     # Category endpoints
     path('categories/', views.CategoryListCreateView.as_view(), name='category-list-create'),
     path('categories/<int:pk>/', views.CategoryDetailView.as_view(), name='category-detail'),
-    path('categories/list/', views.product_categories, name='product-categories'),
+    path('categories/list/', read_view(views.product_categories, 'product_categories'), name='product-categories'),
     
     # Search and analytics
-    path('search/', views.search_products, name='search-products'),
+    path('search/', read_view(views.search_products, 'search_products', CatalogThrottle), name='search-products'),
+    path('autocomplete/', views.autocomplete, name='product-autocomplete'),
     path('analytics/', views.product_analytics, name='product-analytics'),
 ]
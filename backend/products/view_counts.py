@@ -0,0 +1,159 @@
+"""
+Buffered product view counting.
+
+Detail views record hits in a per-process buffer instead of writing the
+product row on every GET. The buffer is flushed as batched
+``UPDATE ... SET view_count = view_count + n`` statements when
+``VIEW_COUNT_FLUSH_INTERVAL`` seconds have passed since the last flush, when
+``VIEW_COUNT_MAX_PENDING`` hits are waiting, and at interpreter exit. A worker
+crash therefore loses at most ``VIEW_COUNT_MAX_PENDING`` hits. Each flush
+also feeds the hourly buckets used by ``products.trending``.
+
+The interval is checked as hits are recorded, and in web workers (see
+``start_flusher``, called by the WSGI/ASGI modules) by a background thread
+too, so a worker that stops getting requests still writes its hits within
+about ``VIEW_COUNT_FLUSH_INTERVAL`` seconds.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = Counter()
+_pending_total = 0
+_last_flush = time.monotonic()
+_flusher = None
+_flusher_enabled = False
+
+
+def _flush_interval():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 0)
+
+
+def _max_pending():
+    return getattr(settings, 'VIEW_COUNT_MAX_PENDING', 1000)
+
+
+def record_view(product_id):
+    """
+    Buffer one view of ``product_id``, flushing if a bound was reached.
+
+    Returns the number of hits for the product that were pending in this
+    process (including this one) before any flush, i.e. what has to be added
+    to a freshly loaded ``view_count`` to get the live value.
+    """
+    global _pending_total
+    with _lock:
+        _pending[product_id] += 1
+        _pending_total += 1
+        hits = _pending[product_id]
+        due = (
+            time.monotonic() - _last_flush >= _flush_interval() or
+            _pending_total >= _max_pending()
+        )
+    if due:
+        try:
+            flush()
+        except Exception:
+            logger.exception('Failed to flush buffered view counts')
+    if _flusher_enabled and not _flusher.is_alive():
+        # Threads do not survive a fork of the worker
+        _start_thread()
+    return hits
+
+
+def pending_views(product_id):
+    """Hits recorded by this process that are not in the database yet"""
+    with _lock:
+        return _pending.get(product_id, 0)
+
+
+def live_view_count(product):
+    return product.view_count + pending_views(product.pk)
+
+
+def discard():
+    """Drop buffered hits without writing them (used by benchmark_api)"""
+    global _pending, _pending_total
+    with _lock:
+        _pending, _pending_total = Counter(), 0
+
+
+def flush():
+    """Write buffered hits as one UPDATE per distinct increment, returns hits written"""
+    global _pending, _pending_total, _last_flush
+    with _lock:
+        batch, _pending = _pending, Counter()
+        _pending_total = 0
+        _last_flush = time.monotonic()
+    if not batch:
+        return 0
+
+    from .models import Product
+    from .trending import record_hits
+
+    by_increment = defaultdict(list)
+    for product_id, hits in batch.items():
+        by_increment[hits].append(product_id)
+
+    try:
+        with transaction.atomic():
+            for hits, product_ids in by_increment.items():
+                Product.objects.filter(pk__in=product_ids).update(view_count=F('view_count') + hits)
+            record_hits(batch)
+    except Exception:
+        # Put the hits back so they are retried by the next flush
+        with _lock:
+            _pending.update(batch)
+            _pending_total += sum(batch.values())
+        raise
+    return sum(batch.values())
+
+
+def _flush_if_due():
+    with _lock:
+        due = _pending_total and time.monotonic() - _last_flush >= _flush_interval()
+    return flush() if due else 0
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(max(_flush_interval(), 1))
+        try:
+            _flush_if_due()
+        except Exception:
+            logger.exception('Failed to flush buffered view counts')
+        finally:
+            connections.close_all()
+
+
+def _start_thread():
+    global _flusher
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_periodically, name='view-count-flush', daemon=True)
+            _flusher.start()
+
+
+def start_flusher():
+    """Also flush due hits from a background thread, for idle web workers"""
+    global _flusher_enabled
+    _flusher_enabled = True
+    _start_thread()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Failed to flush buffered view counts at exit')
@@ -1,26 +1,41 @@
 from rest_framework import generics, permissions, status, filters
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db import models
-from django.db.models import Q, Count, Avg, Min, Max
+from django.http import Http404
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Product, Category, ProductImage
+from django.utils import timezone
+from accounts.authentication import TokenUserJWTAuthentication
+from .models import ArchivedProduct, Product, Category, ProductImage, AnalyticsSnapshot
+from .search import ProductSearchFilter, parse_terms, search_queryset
+from .pagination import AsyncPageNumberPagination, ProductPagination, cached_count
+from .throttling import CatalogDetailThrottle, CatalogThrottle
+from .trending import atrending_queryset, trending_queryset
+from .analytics import analytics_payload
+from .fast_serializers import product_rows, serialize_product_rows
+from .facets import facet_counts, parse_facets
+from .geo import near_queryset, parse_near
+from .similarity import similar_queryset
+from .archive import restore_product
+from .duplicates import duplicate_report
+from . import autocomplete as autocomplete_index
 from .serializers import (
     ProductSerializer, ProductCreateSerializer, ProductUpdateSerializer, 
-    ProductListSerializer, CategorySerializer, ProductImageSerializer
+    ProductListSerializer, CategorySerializer, ProductImageSerializer, ArchivedProductSerializer
 )
 
 
 class ProductListCreateView(generics.ListCreateAPIView):
     queryset = Product.objects.filter(is_available=True).select_related('category', 'owner').prefetch_related('images')
     permission_classes = [AllowAny]  # Allow anyone to view products
+    throttle_classes = [CatalogThrottle]
     parser_classes = [MultiPartParser, FormParser]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = ProductPagination
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'condition', 'is_featured']
-    search_fields = ['title', 'description', 'category__name']
     ordering_fields = ['price', 'title', 'created_at', 'view_count']
     ordering = ['-created_at']
     
@@ -32,6 +47,12 @@ class ProductListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
     
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path, same payload as ProductListSerializer
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(product_rows(queryset))
+        return self.get_paginated_response(serialize_product_rows(page, request))
+    
     def get_queryset(self):
         queryset = Product.objects.filter(is_available=True).select_related('category', 'owner').prefetch_related('images')
         
@@ -48,6 +69,11 @@ class ProductListCreateView(generics.ListCreateAPIView):
         if location:
             queryset = queryset.filter(location__icontains=location)
         
+        # Radius filter, ?lat=&lon=&radius= (km)
+        near = parse_near(self.request.query_params)
+        if near:
+            queryset = near_queryset(queryset, *near)
+        
         # Featured products filter
         featured = self.request.query_params.get('featured')
         if featured and featured.lower() == 'true':
@@ -60,6 +86,7 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all().select_related('category', 'owner').prefetch_related('images')
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [CatalogDetailThrottle]
     parser_classes = [MultiPartParser, FormParser]
     
     def get_permissions(self):
@@ -73,7 +100,7 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
         return ProductSerializer
     
     def get_object(self):
-        obj = get_object_or_404(Product, pk=self.kwargs['pk'])
+        obj = get_object_or_404(self.get_queryset(), pk=self.kwargs['pk'])
         
         # Check permissions for update/delete
         if self.request.method in ['PUT', 'PATCH', 'DELETE']:
@@ -101,13 +128,25 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
 class UserProductsView(generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenUserJWTAuthentication]
+    pagination_class = ProductPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['is_available', 'is_featured']
     ordering_fields = ['price', 'title', 'created_at', 'view_count']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        return Product.objects.filter(owner=self.request.user).select_related('category').prefetch_related('images')
+        return Product.objects.filter(owner_id=self.request.user.pk).select_related('category', 'owner').prefetch_related('images')
+
+
+class ArchivedProductsView(generics.ListAPIView):
+    """The user's listings moved to the archive after being unavailable for long"""
+    serializer_class = ArchivedProductSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenUserJWTAuthentication]
+
+    def get_queryset(self):
+        return ArchivedProduct.objects.filter(owner_id=self.request.user.pk).select_related('category')
 
 
 class CategoryListCreateView(generics.ListCreateAPIView):
@@ -132,39 +171,88 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
         return [IsAuthenticated()]
 
 
+def featured_products_queryset():
+    """Newest featured products, listed by FeaturedProductsView and its async variant"""
+    return Product.objects.filter(is_available=True, is_featured=True).order_by('-created_at')[:10]
+
+
+def trending_products_queryset(category_slug):
+    """
+    Top 10 of the precomputed ranking (manage.py compute_trending), optionally
+    per category, else by view count; listed by TrendingProductsView
+    """
+    return trending_queryset(Product.objects.filter(is_available=True), category_slug)[:10]
+
+
+async def atrending_products_queryset(category_slug):
+    """``trending_products_queryset`` with the async ORM"""
+    return (await atrending_queryset(Product.objects.filter(is_available=True), category_slug))[:10]
+
+
 class FeaturedProductsView(generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [AllowAny]
+    pagination_class = AsyncPageNumberPagination
     
     def get_queryset(self):
-        return Product.objects.filter(is_available=True, is_featured=True).select_related('category', 'owner').prefetch_related('images').order_by('-created_at')[:10]
+        return featured_products_queryset()
+    
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(product_rows(self.get_queryset()))
+        return self.get_paginated_response(serialize_product_rows(page, request))
 
 
 class TrendingProductsView(generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [AllowAny]
+    pagination_class = AsyncPageNumberPagination
+    throttle_classes = [CatalogThrottle]
     
     def get_queryset(self):
-        return Product.objects.filter(is_available=True).select_related('category', 'owner').prefetch_related('images').order_by('-view_count')[:10]
+        return trending_products_queryset(self.request.query_params.get('category'))
+    
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(product_rows(self.get_queryset()))
+        return self.get_paginated_response(serialize_product_rows(page, request))
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def product_categories(request):
     """Get all available product categories with product counts"""
-    categories = Category.objects.filter(is_active=True).annotate(
-        product_count=Count('products', filter=Q(products__is_available=True))
-    ).order_by('name')
+    categories = Category.objects.filter(is_active=True).order_by('name')
     serializer = CategorySerializer(categories, many=True)
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@throttle_classes([CatalogDetailThrottle])
+def similar_products(request, pk):
+    """Similar items, precomputed by manage.py compute_similar_products"""
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+    except ValueError:
+        return Response({'limit': ['Must be a number']}, status=status.HTTP_400_BAD_REQUEST)
+    
+    products = product_rows(similar_queryset(Product.objects.filter(is_available=True), pk))[:limit]
+    results = serialize_product_rows(products, request)
+    if not results:
+        get_object_or_404(Product, pk=pk)
+    return Response(results)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_product_availability(request, pk):
     """Toggle product availability (soft delete/restore)"""
     try:
-        product = get_object_or_404(Product, pk=pk, owner=request.user)
+        product = Product.objects.filter(pk=pk, owner=request.user).first()
+        if product is None:
+            # Long unavailable listings are moved out to the archive
+            product = restore_product(pk, owner=request.user)
+        if product is None:
+            raise Http404('No Product matches the given query.')
         product.is_available = not product.is_available
         product.save()
         
@@ -177,99 +265,160 @@ def toggle_product_availability(request, pk):
         return Response({'error': 'Product not found or you do not have permission'}, status=status.HTTP_404_NOT_FOUND)
 
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def search_products(request):
-    """Advanced product search with filters"""
+def search_filters(query_params):
+    """Available products filtered and sorted by the search parameters, and the search term"""
     queryset = Product.objects.filter(is_available=True).select_related('category', 'owner').prefetch_related('images')
     
-    # Search query
-    search = request.query_params.get('q', '')
+    # Search query (full-text index, ranked when sorting by relevance)
+    search = query_params.get('q', '')
+    # Only searches with usable terms (not just punctuation) can be ranked
+    sort_by = query_params.get('sort', 'relevance' if parse_terms(search) else '-created_at')
     if search:
-        queryset = queryset.filter(
-            Q(title__icontains=search) | 
-            Q(description__icontains=search) |
-            Q(category__name__icontains=search)
-        )
+        queryset = search_queryset(queryset, search, rank=(sort_by == 'relevance'))
     
     # Category filter
-    category = request.query_params.get('category', '')
+    category = query_params.get('category', '')
     if category:
         queryset = queryset.filter(category__slug=category)
     
     # Condition filter
-    condition = request.query_params.get('condition', '')
+    condition = query_params.get('condition', '')
     if condition:
         queryset = queryset.filter(condition=condition)
     
     # Price range
-    min_price = request.query_params.get('min_price')
-    max_price = request.query_params.get('max_price')
+    min_price = query_params.get('min_price')
+    max_price = query_params.get('max_price')
     if min_price:
         queryset = queryset.filter(price__gte=min_price)
     if max_price:
         queryset = queryset.filter(price__lte=max_price)
     
     # Location filter
-    location = request.query_params.get('location', '')
+    location = query_params.get('location', '')
     if location:
         queryset = queryset.filter(location__icontains=location)
     
+    # "Near me", ?lat=&lon=&radius= (km), adds distance_km to each result
+    near = parse_near(query_params)
+    if near:
+        queryset = near_queryset(queryset, *near)
+    
     # Sort options
-    sort_by = request.query_params.get('sort', '-created_at')
     valid_sorts = ['price', '-price', 'title', '-title', 'created_at', '-created_at', 'view_count', '-view_count']
-    if sort_by in valid_sorts:
+    if sort_by == 'relevance':
+        if 'search_rank' in queryset.query.annotations:
+            queryset = queryset.order_by('-search_rank', '-created_at')
+        else:
+            queryset = queryset.order_by('-created_at')
+    elif sort_by == 'distance' and near:
+        queryset = queryset.order_by('distance_km', 'id')
+    elif sort_by in valid_sorts:
         queryset = queryset.order_by(sort_by)
     
+    return queryset, search
+
+
+def search_page(query_params):
+    """(page, page_size) of a page-number search request, ValueError if not numbers"""
+    page_size = min(max(int(query_params.get('page_size', 20)), 1), ProductPagination.max_page_size)
+    page = max(int(query_params.get('page', 1)), 1)
+    return page, page_size
+
+
+def allow_header(methods):
+    """
+    Allow header value for ``methods`` in APIView.http_method_names order;
+    @api_view keeps its methods in a set, ordered by string hash differently
+    in each worker
+    """
+    methods = {method.strip().upper() for method in methods}
+    return ', '.join(method.upper() for method in APIView.http_method_names if method.upper() in methods)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@throttle_classes([CatalogThrottle])
+def search_products(request):
+    """Advanced product search with filters"""
+    queryset, search = search_filters(request.query_params)
+    
+    # Facet counts for the current filters, e.g. ?facets=1 or ?facets=category,price
+    facets = parse_facets(request.query_params.get('facets'))
+    
+    # Keyset pagination when a cursor is passed (?cursor= for the first page)
+    paginator = ProductPagination()
+    if paginator.cursor_query_param in request.query_params:
+        products = paginator.paginate_queryset(product_rows(queryset), request)
+        response = paginator.get_paginated_response(serialize_product_rows(products))
+        if search and products:
+            autocomplete_index.record_query(search)
+        if facets:
+            response.data['facets'] = facet_counts(queryset, facets)
+        return response
+    
     # Pagination
-    page_size = int(request.query_params.get('page_size', 20))
-    page = int(request.query_params.get('page', 1))
+    try:
+        page, page_size = search_page(request.query_params)
+    except ValueError:
+        return Response({'page': ['Must be a number']}, status=status.HTTP_400_BAD_REQUEST)
     
     start = (page - 1) * page_size
     end = start + page_size
     
-    products = queryset[start:end]
-    serializer = ProductListSerializer(products, many=True)
+    products = product_rows(queryset)[start:end]
+    count = cached_count(queryset)
     
-    return Response({
-        'results': serializer.data,
-        'count': queryset.count(),
+    data = {
+        'results': serialize_product_rows(products),
+        'count': count,
         'page': page,
         'page_size': page_size,
-        'total_pages': (queryset.count() + page_size - 1) // page_size
+        'total_pages': (count + page_size - 1) // page_size
+    }
+    if facets:
+        data['facets'] = facet_counts(queryset, facets)
+    if search and count:
+        autocomplete_index.record_query(search)
+    
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def autocomplete(request):
+    """Search-as-you-type suggestions from the in-memory prefix index"""
+    query = request.query_params.get('q', '')
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), autocomplete_index.MAX_SUGGESTIONS)
+    except ValueError:
+        return Response({'limit': ['Must be a number']}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'query': query,
+        'suggestions': autocomplete_index.suggest(query, limit)
     })
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@throttle_classes([CatalogThrottle])
 def product_analytics(request):
-    """Get product analytics and statistics"""
-    total_products = Product.objects.filter(is_available=True).count()
-    total_categories = Category.objects.filter(is_active=True).count()
-    
-    # Price statistics
-    price_stats = Product.objects.filter(is_available=True).aggregate(
-        avg_price=Avg('price'),
-        min_price=Min('price'),
-        max_price=Max('price')
-    )
-    
-    # Category distribution
-    category_stats = Category.objects.filter(is_active=True).annotate(
-        product_count=Count('products', filter=Q(products__is_available=True))
-    ).values('name', 'product_count').order_by('-product_count')
-    
-    # Recent products
-    recent_products = Product.objects.filter(is_available=True).order_by('-created_at')[:5]
-    recent_serializer = ProductListSerializer(recent_products, many=True)
+    """Get product analytics and statistics (served from the latest rollup snapshot)"""
+    data = dict(analytics_payload())
+    data['snapshot_age_seconds'] = int((timezone.now() - data['snapshot_generated_at']).total_seconds())
     
-    return Response({
-        'total_products': total_products,
-        'total_categories': total_categories,
-        'price_statistics': price_stats,
-        'category_distribution': list(category_stats),
-        'recent_products': recent_serializer.data
-    })
+    # Daily history, e.g. ?history=30
+    history = request.query_params.get('history')
+    if history:
+        try:
+            days = min(max(int(history), 1), 365)
+        except ValueError:
+            return Response({'history': ['Must be a number of days']}, status=status.HTTP_400_BAD_REQUEST)
+        data['history'] = list(
+            AnalyticsSnapshot.objects.values('date', 'total_products', 'avg_price', 'min_price', 'max_price')[:days]
+        )
+    
+    return Response(data)
 
 
 @api_view(['POST'])
@@ -283,14 +432,20 @@ def upload_product_images(request, pk):
         if not images:
             return Response({'error': 'No images provided'}, status=status.HTTP_400_BAD_REQUEST)
         
+        # First image becomes primary unless the product already has one
+        has_primary = product.images.filter(is_primary=True).exists()
+        
         uploaded_images = []
         for i, image in enumerate(images):
             product_image = ProductImage.objects.create(
                 product=product,
                 image=image,
-                is_primary=(i == 0)  # First image is primary
+                is_primary=(i == 0 and not has_primary)
             )
-            uploaded_images.append(ProductImageSerializer(product_image).data)
+            image_data = ProductImageSerializer(product_image).data
+            # Likely relists of the same photo, flagged for the seller (not blocked)
+            image_data['possible_duplicates'] = duplicate_report(getattr(product_image, '_fingerprint', None))
+            uploaded_images.append(image_data)
         
         return Response({
             'message': f'{len(images)} images uploaded successfully',